@@ -4,7 +4,11 @@ from config import config
 from services.routes import register_blueprints
 from flask_socketio import SocketIO, emit
 from services.ssh_cli import ssh_cli, close_ssh_connection # 正确导入 ssh_cli 函数
-from services.snmp_receiver import start_snmp_receiver
+from services.snmp_receiver import fork_snmp_receiver, start_snmp_receiver
+from services.trap_store import start_trap_store
+from services.trap_fanout import trap_fanout
+from services.oid_names import oid_names
+from perf_mont.poller import start_poller
 import logging
 
 # 配置日志记录
@@ -17,8 +21,23 @@ CORS(app, resources={r"/*": {"origins": "*"}})
 # 设置 Flask-SocketIO
 socketio = SocketIO(app, cors_allowed_origins="*", logger=True, engineio_logger=True)
 
-# 启动 SNMP Trap 接收器
-start_snmp_receiver(socketio)
+# 创建 SNMP Trap 接收进程（通过 fork 创建，需要在任何后台线程之前）
+fork_snmp_receiver(app.debug)
+
+# 启动后台 SNMP 轮询（轮询工作进程同样通过 fork 创建，随后才启动调度线程）
+start_poller()
+
+# 启动 Trap 消费线程
+start_snmp_receiver(socketio, app.debug)
+
+# 启动 Trap 持久化写入（MongoDB 客户端会创建后台线程，放在所有工作进程之后）
+start_trap_store(app)
+
+# 启动 Trap 批量推送
+trap_fanout.start(socketio)
+
+# 在后台构建 OID 名称表，Trap 和性能数据解码时直接查表（放在所有工作进程创建之后，子进程不会继承持有中的锁）
+oid_names.warm_up()
 
 # 注册蓝图
 register_blueprints(app)
@@ -33,12 +52,14 @@ logging.info(app.url_map)
 @socketio.on('connect')
 def handle_connect():
     logging.info('Client connected')
+    trap_fanout.add_client(request.sid)
     emit('response', {'message': 'Connected to WebSocket!'})
 
 @socketio.on('disconnect')
 def handle_disconnect():
     client_id = request.sid  # 获取WebSocket客户端的唯一ID
     close_ssh_connection(client_id)
+    trap_fanout.remove_client(client_id)
     logging.info('Client disconnected')
 
 # 将 initialize_ssh 事件绑定到独立的服务函数
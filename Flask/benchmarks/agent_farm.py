@@ -0,0 +1,238 @@
+"""
+本地模拟 SNMPv3 代理集群，用于在没有真实设备时对轮询、邻居发现和状态巡检做压测。
+
+每个代理监听一个独立的回环地址（127.1.x.y，端口相同），拥有自己的 SNMP 引擎（engineID 不同），
+提供 system、HOST-RESOURCES、ifTable/ifXTable、ipAddrTable、LLDP 和 CDP 表；计数器和 sysUpTime 随时间增长。
+可以为每个请求注入固定延迟、随机抖动和丢包。
+
+单独运行（在 Flask 目录下）：
+    python -m benchmarks.agent_farm --agents 50 --interfaces 48 --latency 5 --loss 0.01
+"""
+import argparse
+import bisect
+import multiprocessing
+import random
+import threading
+import time
+from pysnmp.entity import engine, config
+from pysnmp.entity.rfc3413 import cmdrsp, context
+from pysnmp.carrier.asyncore.dgram import udp
+from pysnmp.smi import instrum
+from pysnmp.proto import rfc1902, rfc1905
+
+FARM_PORT = 11161
+FARM_USER = 'farmuser'
+FARM_AUTH_PASSWORD = 'farmauth123'
+FARM_PRIV_PASSWORD = 'farmpriv123'
+
+COUNTER32_MODULUS = 2 ** 32
+COUNTER64_MODULUS = 2 ** 64
+
+def agent_address(index):
+    """第 index 个代理的回环地址，从 127.1.0.1 开始"""
+    return f'127.1.{index // 250}.{index % 250 + 1}'
+
+def farm_device(index, port=FARM_PORT):
+    """与 devices 中网元格式相同的设备描述，用于基准测试直接轮询代理"""
+    name = f'SIM{index + 1}'
+    return {
+        'ne_id': f'sim-{index + 1}',
+        'device_name': name,
+        'device_type': 'huawei',
+        'network_name': 'agent-farm',
+        'ip': agent_address(index),
+        'snmp_username': FARM_USER,
+        'snmp_auth_protocol': 'SHA',
+        'snmp_auth_password': FARM_AUTH_PASSWORD,
+        'snmp_priv_protocol': 'AES128',
+        'snmp_priv_password': FARM_PRIV_PASSWORD,
+        'ssh_username': '', 'ssh_password': '', 'ssh_secret': '',
+        'verbose': False, 'global_delay_factor': 2,
+    }
+
+def _oid(text):
+    return tuple(int(arc) for arc in text.split('.'))
+
+class FarmInstrumController(instrum.AbstractMibInstrumController):
+    """按排序后的 OID 表应答 GET/GETNEXT（GETBULK 由 pysnmp 转换为多次 GETNEXT）；值为可调用对象时在读取时计算"""
+
+    def __init__(self, table):
+        self.table = table
+        self.oids = sorted(table)
+
+    def _value(self, oid):
+        value = self.table[oid]
+        return value() if callable(value) else value
+
+    def readVars(self, varBinds, acInfo=(None, None)):
+        return [(name, self._value(tuple(name)) if tuple(name) in self.table else rfc1905.noSuchObject)
+                for name, _ in varBinds]
+
+    def readNextVars(self, varBinds, acInfo=(None, None)):
+        result = []
+        for name, _ in varBinds:
+            position = bisect.bisect_right(self.oids, tuple(name))
+            if position < len(self.oids):
+                oid = self.oids[position]
+                result.append((rfc1902.ObjectName(oid), self._value(oid)))
+            else:
+                result.append((name, rfc1905.endOfMibView))
+        return result
+
+def build_table(index, interfaces, neighbors, started):
+    """生成一个代理的 MIB 表"""
+    table = {}
+    uptime = lambda: rfc1902.TimeTicks(int((time.time() - started) * 100) % COUNTER32_MODULUS)
+
+    table[_oid('1.3.6.1.2.1.1.1.0')] = rfc1902.OctetString(f'Simulated router {index + 1}')
+    table[_oid('1.3.6.1.2.1.1.3.0')] = uptime
+    table[_oid('1.3.6.1.2.1.1.5.0')] = rfc1902.OctetString(f'SIM{index + 1}')
+    table[_oid('1.3.6.1.2.1.25.3.3.1.2.1')] = lambda: rfc1902.Integer(random.randint(1, 60))
+    table[_oid('1.3.6.1.2.1.25.2.3.1.6.1')] = rfc1902.Integer(1024 * (index + 1))
+    table[_oid('1.3.6.1.2.1.31.1.5.0')] = rfc1902.TimeTicks(0)
+
+    for if_index in range(1, interfaces + 1):
+        # 每个接口以固定速率增长的计数器（约 if_index Mbit/s）
+        rate = if_index * 125000
+
+        def octets(modulus, kind, factor, rate=rate):
+            return lambda: kind(int((time.time() - started) * rate * factor) % modulus)
+
+        table[_oid(f'1.3.6.1.2.1.2.2.1.1.{if_index}')] = rfc1902.Integer(if_index)
+        table[_oid(f'1.3.6.1.2.1.2.2.1.2.{if_index}')] = rfc1902.OctetString(f'GigabitEthernet0/0/{if_index}')
+        table[_oid(f'1.3.6.1.2.1.2.2.1.5.{if_index}')] = rfc1902.Gauge32(1000000000)
+        table[_oid(f'1.3.6.1.2.1.2.2.1.8.{if_index}')] = rfc1902.Integer(1)
+        table[_oid(f'1.3.6.1.2.1.2.2.1.10.{if_index}')] = octets(COUNTER32_MODULUS, rfc1902.Counter32, 1)
+        table[_oid(f'1.3.6.1.2.1.2.2.1.16.{if_index}')] = octets(COUNTER32_MODULUS, rfc1902.Counter32, 2)
+        table[_oid(f'1.3.6.1.2.1.31.1.1.1.6.{if_index}')] = octets(COUNTER64_MODULUS, rfc1902.Counter64, 1)
+        table[_oid(f'1.3.6.1.2.1.31.1.1.1.10.{if_index}')] = octets(COUNTER64_MODULUS, rfc1902.Counter64, 2)
+        table[_oid(f'1.3.6.1.2.1.31.1.1.1.15.{if_index}')] = rfc1902.Gauge32(1000)
+
+        # 一半接口配置 IP 地址
+        if if_index % 2:
+            ip = f'10.{index % 250}.{if_index // 250}.{if_index % 250}'
+            table[_oid(f'1.3.6.1.2.1.4.20.1.1.{ip}')] = rfc1902.IpAddress(ip)
+            table[_oid(f'1.3.6.1.2.1.4.20.1.2.{ip}')] = rfc1902.Integer(if_index)
+
+    for neighbor in range(1, neighbors + 1):
+        peer = agent_address(index + neighbor)
+        # LLDP：lldpRemSysName 索引为 timeMark.localPort.remIndex，管理地址索引再加上 地址类型.长度.地址
+        table[_oid(f'1.0.8802.1.1.2.1.4.1.1.9.0.{neighbor}.1')] = rfc1902.OctetString(f'SIM{index + neighbor + 1}')
+        table[_oid(f'1.0.8802.1.1.2.1.4.2.1.4.0.{neighbor}.1.1.4.{peer}')] = rfc1902.Integer(2)
+        # CDP：cdpCacheTable 索引为 ifIndex.deviceIndex
+        table[_oid(f'1.3.6.1.4.1.9.9.23.1.2.1.1.4.{neighbor}.1')] = rfc1902.OctetString(
+            bytes(int(octet) for octet in peer.split('.')))
+        table[_oid(f'1.3.6.1.4.1.9.9.23.1.2.1.1.6.{neighbor}.1')] = rfc1902.OctetString(f'SIM{index + neighbor + 1}')
+
+    return table
+
+class ImpairedUdpTransport(udp.UdpTransport):
+    """在收到请求后按配置丢弃或延迟处理，模拟网络丢包和设备响应慢"""
+
+    latency = 0.0
+    jitter = 0.0
+    loss = 0.0
+
+    def registerCbFun(self, cbFun):
+        def impaired(transport, address, message):
+            if self.loss and random.random() < self.loss:
+                return
+            delay = self.latency + (random.uniform(-self.jitter, self.jitter) if self.jitter else 0.0)
+            if delay > 0:
+                time.sleep(delay)
+            cbFun(transport, address, message)
+
+        super().registerCbFun(impaired)
+
+def run_agent(index, port, interfaces, neighbors, latency, jitter, loss):
+    snmp_engine = engine.SnmpEngine()
+    transport = ImpairedUdpTransport()
+    transport.latency, transport.jitter, transport.loss = latency, jitter, loss
+    config.addTransport(snmp_engine, udp.domainName, transport.openServerMode((agent_address(index), port)))
+    config.addV3User(snmp_engine, FARM_USER, config.usmHMACSHAAuthProtocol, FARM_AUTH_PASSWORD,
+                     config.usmAesCfb128Protocol, FARM_PRIV_PASSWORD)
+    config.addVacmUser(snmp_engine, 3, FARM_USER, 'authPriv', (1,), (1,))
+
+    snmp_context = context.SnmpContext(snmp_engine)
+    snmp_context.unregisterContextName(rfc1902.OctetString(''))
+    snmp_context.registerContextName(rfc1902.OctetString(''),
+                                     FarmInstrumController(build_table(index, interfaces, neighbors, time.time())))
+    cmdrsp.GetCommandResponder(snmp_engine, snmp_context)
+    cmdrsp.NextCommandResponder(snmp_engine, snmp_context)
+    cmdrsp.BulkCommandResponder(snmp_engine, snmp_context)
+
+    snmp_engine.transportDispatcher.jobStarted(1)
+    snmp_engine.transportDispatcher.runDispatcher()
+
+def _farm_process(indexes, port, interfaces, neighbors, latency, jitter, loss, ready):
+    # 每个代理一个线程，各自运行独立的 SNMP 引擎
+    for index in indexes:
+        threading.Thread(target=run_agent, args=(index, port, interfaces, neighbors, latency, jitter, loss),
+                         daemon=True).start()
+    ready.set()
+    threading.Event().wait()
+
+class AgentFarm:
+    """在若干子进程中启动 agents 个模拟代理，processes 用来把代理的 CPU 开销分散到多个核上"""
+
+    def __init__(self, agents, interfaces=48, neighbors=4, latency=0.0, jitter=0.0, loss=0.0,
+                 port=FARM_PORT, processes=None):
+        self.agents = agents
+        self.port = port
+        self.processes = processes or max(1, min(agents, multiprocessing.cpu_count()))
+        self.options = (port, interfaces, neighbors, latency, jitter, loss)
+        self._context = multiprocessing.get_context('fork')
+        self._workers = []
+
+    def start(self):
+        for slot in range(self.processes):
+            ready = self._context.Event()
+            process = self._context.Process(target=_farm_process,
+                                            args=(list(range(slot, self.agents, self.processes)), *self.options, ready),
+                                            daemon=True)
+            process.start()
+            self._workers.append((process, ready))
+        for _, ready in self._workers:
+            ready.wait(timeout=30)
+        time.sleep(0.5)  # 等待所有代理完成绑定
+        return self
+
+    def stop(self):
+        for process, _ in self._workers:
+            process.terminate()
+            process.join(timeout=5)
+        self._workers = []
+
+    def devices(self):
+        return {f'SIM{index + 1}': farm_device(index, self.port) for index in range(self.agents)}
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulated SNMPv3 agent farm')
+    parser.add_argument('--agents', type=int, default=50)
+    parser.add_argument('--interfaces', type=int, default=48)
+    parser.add_argument('--neighbors', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.0, help='per-request latency in ms')
+    parser.add_argument('--jitter', type=float, default=0.0, help='latency jitter in ms')
+    parser.add_argument('--loss', type=float, default=0.0, help='request loss rate, 0..1')
+    parser.add_argument('--port', type=int, default=FARM_PORT)
+    parser.add_argument('--processes', type=int, default=None)
+    args = parser.parse_args()
+
+    farm = AgentFarm(args.agents, args.interfaces, args.neighbors, args.latency / 1000, args.jitter / 1000,
+                     args.loss, args.port, args.processes).start()
+    print(f"{args.agents} agents listening on {agent_address(0)}..{agent_address(args.agents - 1)} port {args.port} "
+          f"(user {FARM_USER}, SHA/{FARM_AUTH_PASSWORD}, AES128/{FARM_PRIV_PASSWORD})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        farm.stop()
+
+if __name__ == '__main__':
+    main()
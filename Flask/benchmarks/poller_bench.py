@@ -0,0 +1,142 @@
+"""
+轮询负载基准：启动本地模拟代理集群（benchmarks.agent_farm），对其运行后台轮询、邻居发现或状态巡检，
+报告每秒完成的设备数、单设备耗时 p50/p99 以及每次轮询消耗的 CPU 时间。
+
+用法（在 Flask 目录下）：
+    python -m benchmarks.poller_bench --agents 100 --interfaces 48 --rounds 3 --workers 16
+    python -m benchmarks.poller_bench --scenario poll --processes 4 --latency 5 --loss 0.01
+    python -m benchmarks.poller_bench --scenario neighbors
+    python -m benchmarks.poller_bench --scenario status
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from benchmarks.agent_farm import AgentFarm, FARM_PORT
+
+def _timed(fn):
+    """包装 fn，记录每次调用的耗时（秒）和是否成功"""
+    samples = []
+
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        ok = False
+        try:
+            result = fn(*args, **kwargs)
+            ok = True
+            return result
+        finally:
+            samples.append((time.perf_counter() - started, ok))
+
+    return wrapper, samples
+
+def _cpu_seconds():
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+def bench_poll(names, rounds, workers, processes):
+    """通过 PollScheduler.poll_device 轮询所有设备（与后台轮询相同的记录路径），processes > 1 时使用分片工作进程"""
+    from perf_mont.performance import fetch_snmpv3_data
+    from perf_mont.poller import PollScheduler
+    from perf_mont.poll_workers import ShardedPollPool
+
+    pool = None
+    poll_fn = fetch_snmpv3_data
+    if processes > 1:
+        pool = ShardedPollPool(processes)
+        pool.start()
+        poll_fn = pool.poll
+
+    timed_fn, samples = _timed(poll_fn)
+    scheduler = PollScheduler(workers=workers, poll_fn=timed_fn)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for _ in range(rounds):
+                list(executor.map(scheduler.poll_device, names))
+    finally:
+        if pool is not None:
+            pool.stop()  # 等待工作进程退出，使其 CPU 时间计入 children
+    return samples
+
+def bench_neighbors(devices, names, rounds, workers):
+    from network_mgmt.ne_mgmt.ne_init import discover_neighbors
+
+    timed_fn, samples = _timed(discover_neighbors)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for _ in range(rounds):
+            list(executor.map(lambda name: _ignore_errors(timed_fn, dict(devices[name])), names))
+    return samples
+
+def bench_status(names, rounds, workers):
+    """每轮运行一次 check_all_devices；单设备耗时取整轮耗时，仅用于计算吞吐量"""
+    from network_mgmt.ne_mgmt.ne_status import check_all_devices
+
+    samples = []
+    for _ in range(rounds):
+        sweep = check_all_devices(max_in_flight=workers)
+        samples.extend([(sweep['duration'], True)] * sweep['online'])
+        samples.extend([(sweep['duration'], False)] * (sweep['total'] - sweep['online']))
+    return samples
+
+def _ignore_errors(fn, *args):
+    try:
+        return fn(*args)
+    except Exception:
+        return None
+
+def report(scenario, samples, elapsed, cpu):
+    latencies = np.array([duration for duration, _ in samples]) * 1000
+    failures = sum(1 for _, ok in samples if not ok)
+    polls = len(samples)
+    print(f"scenario:      {scenario}")
+    print(f"polls:         {polls} ({failures} failed)")
+    print(f"throughput:    {polls / elapsed:.1f} devices/s over {elapsed:.2f}s")
+    if polls:
+        print(f"latency:       p50 {np.percentile(latencies, 50):.1f} ms, p99 {np.percentile(latencies, 99):.1f} ms, "
+              f"max {latencies.max():.1f} ms")
+        print(f"cpu per poll:  {cpu / polls * 1000:.2f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description='SNMP poller benchmark against a simulated agent farm')
+    parser.add_argument('--scenario', choices=['poll', 'neighbors', 'status'], default='poll')
+    parser.add_argument('--agents', type=int, default=100)
+    parser.add_argument('--interfaces', type=int, default=48)
+    parser.add_argument('--neighbors', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.0, help='per-request agent latency in ms')
+    parser.add_argument('--jitter', type=float, default=0.0, help='latency jitter in ms')
+    parser.add_argument('--loss', type=float, default=0.0, help='request loss rate, 0..1')
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=16, help='concurrent polls in the benchmark process')
+    parser.add_argument('--processes', type=int, default=0, help='sharded polling processes (poll scenario)')
+    parser.add_argument('--farm-processes', type=int, default=None)
+    parser.add_argument('--port', type=int, default=FARM_PORT)
+    args = parser.parse_args()
+
+    # 先启动代理集群（fork），再导入会启动线程的模块
+    farm = AgentFarm(args.agents, args.interfaces, args.neighbors, args.latency / 1000, args.jitter / 1000,
+                     args.loss, args.port, args.farm_processes).start()
+    farm_cpu = _cpu_seconds()  # 代理进程仍在运行，不计入 children
+
+    import services.snmp_session
+    from network_mgmt.global_data import devices
+    services.snmp_session.SNMP_PORT = args.port
+    farm_devices = farm.devices()
+    devices.update(farm_devices)
+    names = list(farm_devices)
+
+    try:
+        started = time.perf_counter()
+        if args.scenario == 'poll':
+            samples = bench_poll(names, args.rounds, args.workers, args.processes)
+        elif args.scenario == 'neighbors':
+            samples = bench_neighbors(farm_devices, names, args.rounds, args.workers)
+        else:
+            samples = bench_status(names, args.rounds, args.workers)
+        elapsed = time.perf_counter() - started
+        report(args.scenario, samples, elapsed, _cpu_seconds() - farm_cpu)
+    finally:
+        farm.stop()
+
+if __name__ == '__main__':
+    main()
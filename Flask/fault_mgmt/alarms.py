@@ -0,0 +1,303 @@
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from services.snmp_oids import (IF_INDEX, TRAP_COLD_START, TRAP_WARM_START, TRAP_LINK_DOWN, TRAP_LINK_UP,
+                                TRAP_AUTH_FAILURE)
+from services.oid_names import oid_names
+from network_mgmt.global_data import devices
+
+# 告警级别，从高到低
+SEVERITIES = ('critical', 'major', 'minor', 'warning')
+
+# Trap 类型 -> (告警类型, 动作, 级别)；'clear' 清除同一资源上类型相同的告警
+TRAP_ALARM_RULES = {
+    TRAP_LINK_DOWN: ('link_down', 'raise', 'major'),
+    TRAP_LINK_UP: ('link_down', 'clear', None),
+    TRAP_COLD_START: ('device_restart', 'raise', 'warning'),
+    TRAP_WARM_START: ('device_restart', 'raise', 'warning'),
+    TRAP_AUTH_FAILURE: ('authentication_failure', 'raise', 'minor'),
+}
+# 未配置规则的 Trap 按 trap OID 归并为一个告警，只能手动清除
+DEFAULT_TRAP_SEVERITY = 'warning'
+
+DEVICE_UNREACHABLE_SEVERITY = 'critical'
+IF_OPER_UP = '1'
+IF_OPER_DOWN = '2'
+
+# 振荡抑制：FLAP_WINDOW 秒内产生/清除状态切换达到 FLAP_THRESHOLD 次即判定为振荡，
+# 振荡期间告警保持活动状态，只累计次数；连续 FLAP_QUIET 秒没有切换后恢复，按最后一次事件决定是否清除
+FLAP_WINDOW = 300
+FLAP_THRESHOLD = 4
+FLAP_QUIET = 600
+# 已清除的告警在活动表中保留的时间（秒，用于振荡检测），之后移入历史记录
+CLEARED_RETENTION = FLAP_WINDOW
+ALARM_HISTORY_LENGTH = 10000
+# 清理过期告警和结束振荡的最小间隔（秒）
+ALARM_SWEEP_INTERVAL = 5.0
+
+STATE_ACTIVE = 'active'
+STATE_CLEARED = 'cleared'
+
+def _trap_if_index(varbinds):
+    prefix = IF_INDEX + '.'
+    return next((value for name, value in varbinds if name.startswith(prefix)), '')
+
+class Alarm:
+    """由同一来源、同一类型、同一资源的重复事件合并而成的有状态告警"""
+
+    def __init__(self, alarm_id, key, severity, now, ne_name=None, detail=None):
+        self.id = alarm_id
+        self.key = key
+        self.source, self.type, self.resource = key
+        self.severity = severity
+        self.ne_name = ne_name
+        self.detail = detail
+        self.state = STATE_ACTIVE
+        self.count = 1
+        self.first_seen = now
+        self.last_seen = now
+        self.cleared_at = None
+        self.last_action = 'raise'
+        self.flapping = False
+        self.transitions = deque()
+
+    def to_dict(self):
+        return {
+            'id': self.id, 'source': self.source, 'ne_name': self.ne_name, 'type': self.type,
+            'resource': self.resource, 'severity': self.severity, 'state': self.state, 'count': self.count,
+            'first_seen': self.first_seen, 'last_seen': self.last_seen, 'cleared_at': self.cleared_at,
+            'flapping': self.flapping, 'detail': self.detail,
+        }
+
+class AlarmEngine:
+    """
+    告警关联引擎：把 Trap 和轮询结果转换为 raise/clear 事件，按 (来源, 类型, 资源) 去重为告警并累计次数，
+    收到对应的清除事件（例如 linkDown 之后的 linkUp）时清除告警，状态频繁切换时进入振荡抑制。
+    活动告警按来源、级别、类型建立索引，查询只遍历匹配的集合。
+    """
+
+    def __init__(self, flap_window=FLAP_WINDOW, flap_threshold=FLAP_THRESHOLD, flap_quiet=FLAP_QUIET,
+                 cleared_retention=CLEARED_RETENTION, history_length=ALARM_HISTORY_LENGTH):
+        self.flap_window = flap_window
+        self.flap_threshold = flap_threshold
+        self.flap_quiet = flap_quiet
+        self.cleared_retention = cleared_retention
+        self._alarms = {}  # key -> Alarm（活动的和最近清除的）
+        self._by_id = {}
+        self._active = set()
+        self._by_source = {}
+        self._by_severity = {}
+        self._by_type = {}
+        self._flapping = set()
+        self._cleared = set()
+        self.history = deque(maxlen=history_length)
+        self._if_status = {}  # (source, ifIndex) -> 上一次轮询到的 ifOperStatus
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+        self.stats = {'events': 0, 'raised': 0, 'deduplicated': 0, 'cleared': 0, 'flap_suppressed': 0,
+                      'flaps': 0}
+
+    # ---- 索引维护 ----
+
+    def _index(self, alarm):
+        self._active.add(alarm.key)
+        self._by_source.setdefault(alarm.source, set()).add(alarm.key)
+        self._by_severity.setdefault(alarm.severity, set()).add(alarm.key)
+        self._by_type.setdefault(alarm.type, set()).add(alarm.key)
+
+    def _unindex(self, alarm):
+        self._active.discard(alarm.key)
+        for index, value in ((self._by_source, alarm.source), (self._by_severity, alarm.severity),
+                             (self._by_type, alarm.type)):
+            keys = index.get(value)
+            if keys is not None:
+                keys.discard(alarm.key)
+                if not keys:
+                    del index[value]
+
+    # ---- 事件处理 ----
+
+    def _record_transition(self, alarm, now):
+        transitions = alarm.transitions
+        transitions.append(now)
+        while transitions and now - transitions[0] > self.flap_window:
+            transitions.popleft()
+        if not alarm.flapping and len(transitions) >= self.flap_threshold:
+            alarm.flapping = True
+            self._flapping.add(alarm.key)
+            self.stats['flaps'] += 1
+            logging.warning(f"Alarm {alarm.type} on {alarm.source} {alarm.resource} is flapping")
+
+    def raise_alarm(self, source, alarm_type, resource='', severity=DEFAULT_TRAP_SEVERITY, ne_name=None,
+                    detail=None, now=None):
+        now = now or time.time()
+        key = (source, alarm_type, str(resource))
+        with self._lock:
+            self.stats['events'] += 1
+            alarm = self._alarms.get(key)
+            if alarm is None:
+                alarm = Alarm(next(self._ids), key, severity, now, ne_name, detail)
+                self._alarms[key] = alarm
+                self._by_id[alarm.id] = alarm
+                self._index(alarm)
+                self.stats['raised'] += 1
+            else:
+                alarm.count += 1
+                alarm.last_seen = now
+                alarm.ne_name = ne_name or alarm.ne_name
+                alarm.detail = detail or alarm.detail
+                if alarm.state == STATE_CLEARED:
+                    # 清除后很快再次产生：复用原告警并记为一次状态切换
+                    alarm.state = STATE_ACTIVE
+                    alarm.cleared_at = None
+                    self._cleared.discard(key)
+                    self._index(alarm)
+                    self._record_transition(alarm, now)
+                else:
+                    if alarm.flapping and alarm.last_action == 'clear':
+                        # 振荡期间清除事件被抑制，告警仍是活动状态，但这次产生仍算一次切换
+                        self._record_transition(alarm, now)
+                    self.stats['deduplicated'] += 1
+                alarm.last_action = 'raise'
+            self._maybe_sweep(now)
+            return alarm
+
+    def clear_alarm(self, source, alarm_type, resource='', now=None):
+        now = now or time.time()
+        key = (source, alarm_type, str(resource))
+        with self._lock:
+            self.stats['events'] += 1
+            alarm = self._alarms.get(key)
+            if alarm is None or alarm.state != STATE_ACTIVE:
+                return None
+            alarm.last_seen = now
+            alarm.last_action = 'clear'
+            self._record_transition(alarm, now)
+            if alarm.flapping:
+                self.stats['flap_suppressed'] += 1
+            else:
+                self._clear(alarm, now)
+            self._maybe_sweep(now)
+            return alarm
+
+    def _clear(self, alarm, now):
+        alarm.state = STATE_CLEARED
+        alarm.cleared_at = now
+        self._unindex(alarm)
+        self._cleared.add(alarm.key)
+        self.stats['cleared'] += 1
+
+    def acknowledge_clear(self, alarm_id, now=None):
+        """手动清除告警（包括没有对应清除事件的告警和振荡中的告警）"""
+        now = now or time.time()
+        with self._lock:
+            alarm = self._by_id.get(alarm_id)
+            if alarm is None or alarm.state != STATE_ACTIVE:
+                return None
+            if alarm.flapping:
+                alarm.flapping = False
+                self._flapping.discard(alarm.key)
+            alarm.last_action = 'clear'
+            self._clear(alarm, now)
+            return alarm
+
+    def process_trap(self, trap, ne_name=None, if_index=None):
+        """
+        处理 trap_store.make_trap_record 生成的 Trap 记录。ne_name 是按来源地址定位到的网元，告警以该网元的管理 IP
+        为来源（Trap 可能从接口地址发出），与轮询产生和清除的告警一致；if_index 是来源地址所在的接口，Trap 中没有 ifIndex 时使用。
+        """
+        source, trap_oid = trap['source'], trap['trap_oid']
+        if not source or not trap_oid:
+            return None
+        source = devices.get(ne_name, {}).get('ip') or source
+        rule = TRAP_ALARM_RULES.get(trap_oid)
+        if rule is None:
+            return self.raise_alarm(source, f'trap:{trap_oid}', '', DEFAULT_TRAP_SEVERITY, ne_name,
+                                    detail=oid_names.name(trap_oid))
+
+        alarm_type, action, severity = rule
+        resource = (_trap_if_index(trap['varbinds']) or str(if_index or '')) if alarm_type == 'link_down' else ''
+        if action == 'clear':
+            return self.clear_alarm(source, alarm_type, resource)
+        return self.raise_alarm(source, alarm_type, resource, severity, ne_name)
+
+    def process_poll(self, ne_name, device, snmp_data):
+        """轮询成功：清除设备不可达告警；接口由 up 变为 down 时产生 link_down，处于 up 时清除"""
+        source = device.get('ip')
+        self.clear_alarm(source, 'device_unreachable')
+        for interface in snmp_data.get('Interfaces', []):
+            if_index, status = str(interface.get('Index')), interface.get('Status')
+            previous = self._if_status.get((source, if_index))
+            if status == IF_OPER_DOWN and previous == IF_OPER_UP:
+                self.raise_alarm(source, 'link_down', if_index, 'major', ne_name, interface.get('Description'))
+            self.record_interface_status(source, if_index, status)
+
+    def record_interface_status(self, source, if_index, status):
+        """记录接口的最新状态；接口为 up 时清除其 link_down 告警（包括由 Trap 产生、没有收到 linkUp 的告警）"""
+        if_index = str(if_index)
+        self._if_status[(source, if_index)] = status
+        if status == IF_OPER_UP and (source, 'link_down', if_index) in self._alarms:
+            self.clear_alarm(source, 'link_down', if_index)
+
+    def process_poll_failure(self, ne_name, device, error):
+        return self.raise_alarm(device.get('ip'), 'device_unreachable', '', DEVICE_UNREACHABLE_SEVERITY, ne_name,
+                                str(error))
+
+    # ---- 过期清理 ----
+
+    def _maybe_sweep(self, now):
+        if now - self._last_sweep >= ALARM_SWEEP_INTERVAL:
+            self._sweep(now)
+            self._last_sweep = now
+
+    def _sweep(self, now):
+        for key in list(self._flapping):
+            alarm = self._alarms[key]
+            if alarm.transitions and now - alarm.transitions[-1] < self.flap_quiet:
+                continue
+            alarm.flapping = False
+            alarm.transitions.clear()
+            self._flapping.discard(key)
+            if alarm.last_action == 'clear' and alarm.state == STATE_ACTIVE:
+                self._clear(alarm, now)
+        for key in list(self._cleared):
+            alarm = self._alarms[key]
+            if now - alarm.cleared_at >= self.cleared_retention:
+                self._cleared.discard(key)
+                del self._alarms[key]
+                del self._by_id[alarm.id]
+                self.history.append(alarm.to_dict())
+
+    # ---- 查询 ----
+
+    def list_alarms(self, source=None, severity=None, alarm_type=None, state=STATE_ACTIVE, limit=None):
+        with self._lock:
+            self._maybe_sweep(time.time())
+            if state == STATE_ACTIVE:
+                candidates = [self._active]
+                for index, value in ((self._by_source, source), (self._by_severity, severity),
+                                     (self._by_type, alarm_type)):
+                    if value is not None:
+                        candidates.append(index.get(value, set()))
+                keys = set.intersection(*sorted(candidates, key=len))
+                alarms = [self._alarms[key].to_dict() for key in keys]
+            else:
+                alarms = [self._alarms[key].to_dict() for key in self._cleared] + list(self.history)
+                alarms = [alarm for alarm in alarms
+                          if (source is None or alarm['source'] == source)
+                          and (severity is None or alarm['severity'] == severity)
+                          and (alarm_type is None or alarm['type'] == alarm_type)]
+        alarms.sort(key=lambda alarm: (SEVERITIES.index(alarm['severity']) if alarm['severity'] in SEVERITIES
+                                       else len(SEVERITIES), -alarm['last_seen']))
+        return alarms[:limit] if limit else alarms
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, active=len(self._active), flapping=len(self._flapping),
+                        recently_cleared=len(self._cleared), history=len(self.history),
+                        by_severity={severity: len(keys) for severity, keys in self._by_severity.items()})
+
+alarm_engine = AlarmEngine()
@@ -0,0 +1,212 @@
+import logging
+import threading
+from collections import OrderedDict, deque
+import networkx as nx
+from network_mgmt.global_data import devices
+
+# 网管系统所在位置：虚拟根节点，连接到所有 GNE，所有管理路径都从这里出发
+NMS_ROOT = '__nms__'
+# 每个网络缓存的“故障节点集合 -> 可达节点”结果数量
+REACHABILITY_CACHE_SIZE = 64
+
+CORRELATION_ROOT_CAUSE = 'root_cause'
+CORRELATION_SYMPTOM = 'symptom'
+CORRELATION_INDEPENDENT = 'independent'
+
+def _node_name(node):
+    # nx 生成的是 (name, attrs) 元组，从数据库加载后是 [name, attrs] 列表
+    return node[0] if isinstance(node, (list, tuple)) else node
+
+def _node_attrs(node):
+    return node[1] if isinstance(node, (list, tuple)) and len(node) > 1 and isinstance(node[1], dict) else {}
+
+class NetworkDominators:
+    """
+    单个网络的管理路径图：NMS 根节点 -> 各 GNE，拓扑边双向连通，拓扑中到不了 GNE 的网元直接挂在其 GNE 下。
+    在这张图上计算支配树：节点 D 支配 X 表示从 NMS 到 X 的所有路径都经过 D，D 故障时 X 的告警即为 D 的衍生告警。
+    """
+
+    def __init__(self, network_name, topology):
+        self.network_name = network_name
+        self.graph = nx.DiGraph()
+        self.node_by_ip = {}
+        self.graph.add_node(NMS_ROOT)
+
+        names = set()
+        for node in topology.get('nodes', []):
+            name = _node_name(node)
+            names.add(name)
+            self.graph.add_node(name)
+            ip = _node_attrs(node).get('ip') or devices.get(name, {}).get('ip')
+            if ip:
+                self.node_by_ip[ip] = name
+
+        for edge in topology.get('edges', []):
+            if edge[0] in names and edge[1] in names:
+                self.graph.add_edge(edge[0], edge[1])
+                self.graph.add_edge(edge[1], edge[0])
+
+        # 按 devices 中的 gne 字段确定管理入口：GNE 自身（或 GNE 不在本网络中的网元）由 NMS 直接管理；
+        # 经 GNE 接入的网元沿拓扑边到达，拓扑中没有通往 NMS 的路径时（孤立网元，或只与其他网元相连）直接挂在其 GNE 下
+        gnes = {}
+        for name in names:
+            gne = self.node_by_ip.get(devices.get(name, {}).get('gne'))
+            if gne is None or gne == name:
+                self.graph.add_edge(NMS_ROOT, name)
+            else:
+                gnes[name] = gne
+        reachable = nx.descendants(self.graph, NMS_ROOT)
+        for name, gne in gnes.items():
+            if name not in reachable:
+                self.graph.add_edge(gne, name)
+        # GNE 本身也经其他 GNE 接入、形成环而到不了 NMS 时，由 NMS 直接管理
+        reachable = nx.descendants(self.graph, NMS_ROOT)
+        for name in names - reachable:
+            self.graph.add_edge(NMS_ROOT, name)
+
+        self.idom = nx.immediate_dominators(self.graph, NMS_ROOT)
+        self._dominators = {}
+        self._reachability = OrderedDict()
+
+    def dominators(self, name):
+        """name 的所有严格支配节点，从离 NMS 最近的开始，不含 NMS 根节点"""
+        chain = self._dominators.get(name)
+        if chain is None:
+            chain = []
+            node = self.idom.get(name)
+            while node is not None and node != NMS_ROOT:
+                chain.append(node)
+                node = self.idom.get(node)
+            chain.reverse()
+            self._dominators[name] = chain
+        return chain
+
+    def reachable(self, down):
+        """故障节点集合为 down 时，从 NMS 出发仍可达的节点（故障节点本身不可穿越）"""
+        key = frozenset(down)
+        result = self._reachability.get(key)
+        if result is not None:
+            self._reachability.move_to_end(key)
+            return result
+
+        result = {NMS_ROOT}
+        pending = deque([NMS_ROOT])
+        while pending:
+            for successor in self.graph.successors(pending.popleft()):
+                if successor not in result and successor not in key:
+                    result.add(successor)
+                    pending.append(successor)
+        self._reachability[key] = result
+        if len(self._reachability) > REACHABILITY_CACHE_SIZE:
+            self._reachability.popitem(last=False)
+        return result
+
+    def is_reachable(self, name, down):
+        """除 name 自身外的故障节点都不可穿越时，name 是否仍有一条来自 NMS 的路径"""
+        reachable = self.reachable(down)
+        return name in reachable or any(node in reachable for node in self.graph.predecessors(name))
+
+def topology_signature(topology):
+    nodes = frozenset(_node_name(node) for node in topology.get('nodes', []))
+    edges = frozenset(frozenset(edge[:2]) for edge in topology.get('edges', []))
+    gnes = frozenset((name, devices.get(name, {}).get('gne')) for name in nodes)
+    return nodes, edges, gnes
+
+class RootCauseAnalyzer:
+    """
+    基于拓扑的根因分析：设备不可达告警所在的节点视为故障节点，
+    被故障节点支配（或在去掉所有故障节点后从 NMS 不可达）的节点上的告警标记为衍生告警。
+    支配树按网络缓存，只有该网络的拓扑签名（节点、边、GNE）变化时才在下一次查询时重新计算。
+    """
+
+    def __init__(self):
+        self._topologies = {}  # network_name -> (signature, topology)
+        self._networks = {}  # network_name -> NetworkDominators
+        self._lock = threading.Lock()
+        self.stats = {'updates': 0, 'unchanged': 0, 'rebuilds': 0}
+
+    def update_topology(self, network_name, topology):
+        if not topology:
+            return
+        signature = topology_signature(topology)
+        with self._lock:
+            current = self._topologies.get(network_name)
+            if current is not None and current[0] == signature:
+                self.stats['unchanged'] += 1
+                return
+            topology = {'nodes': list(topology.get('nodes', [])), 'edges': list(topology.get('edges', []))}
+            self._topologies[network_name] = (signature, topology)
+            self._networks.pop(network_name, None)
+            self.stats['updates'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._topologies.clear()
+            self._networks.clear()
+
+    def _network(self, network_name):
+        network = self._networks.get(network_name)
+        if network is None:
+            _, topology = self._topologies[network_name]
+            try:
+                network = NetworkDominators(network_name, topology)
+            except Exception as e:
+                logging.error(f"Failed to build dominator tree for network {network_name}: {e}")
+                return None
+            self._networks[network_name] = network
+            self.stats['rebuilds'] += 1
+        return network
+
+    def _locate(self, ip):
+        for network_name in self._topologies:
+            network = self._network(network_name)
+            if network is not None and ip in network.node_by_ip:
+                return network, network.node_by_ip[ip]
+        return None, None
+
+    def correlate(self, alarms):
+        """
+        为 alarm_engine.list_alarms 返回的告警添加 correlation（root_cause / symptom / independent）
+        和 root_cause_ne 字段。
+        """
+        with self._lock:
+            located = [(alarm, *self._locate(alarm['source'])) for alarm in alarms]
+            down = {}
+            for alarm, network, name in located:
+                if network is not None and alarm['type'] == 'device_unreachable' and alarm['state'] == 'active':
+                    down.setdefault(network.network_name, set()).add(name)
+
+            for alarm, network, name in located:
+                alarm['correlation'], alarm['root_cause_ne'] = CORRELATION_INDEPENDENT, None
+                if network is None:
+                    continue
+                failed = down.get(network.network_name, set())
+                upstream = [node for node in network.dominators(name) if node in failed]
+                if upstream:
+                    alarm['correlation'], alarm['root_cause_ne'] = CORRELATION_SYMPTOM, upstream[0]
+                elif failed and not network.is_reachable(name, failed):
+                    # 没有单个支配节点故障，但所有冗余路径都已中断
+                    alarm['correlation'] = CORRELATION_SYMPTOM
+                elif name in failed:
+                    alarm['correlation'], alarm['root_cause_ne'] = CORRELATION_ROOT_CAUSE, name
+        return alarms
+
+    def root_causes(self, alarms):
+        """按根因节点汇总：每个根因节点及其衍生告警数量"""
+        summary = {}
+        for alarm in self.correlate(alarms):
+            root = alarm['root_cause_ne']
+            if root is None:
+                continue
+            entry = summary.setdefault(root, {'ne_name': root, 'alarms': [], 'symptoms': 0})
+            if alarm['correlation'] == CORRELATION_ROOT_CAUSE:
+                entry['alarms'].append(alarm)
+            else:
+                entry['symptoms'] += 1
+        return sorted(summary.values(), key=lambda entry: entry['symptoms'], reverse=True)
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, networks=len(self._topologies), built=len(self._networks))
+
+root_cause_analyzer = RootCauseAnalyzer()
@@ -0,0 +1,84 @@
+from flask import Blueprint, jsonify, request
+from datetime import datetime
+from services.trap_store import trap_store, serialize_trap
+from services.trap_fanout import trap_fanout
+from services.snmp_receiver import trap_ingest
+from services.device_index import device_index
+from services.oid_names import oid_names
+from .alarms import alarm_engine, STATE_ACTIVE, STATE_CLEARED
+from .root_cause import root_cause_analyzer
+import logging
+
+fault_mgmt_bp = Blueprint('fault_mgmt_bp', __name__)
+
+# 单次查询最多返回的 Trap 条数
+TRAP_QUERY_MAX_LIMIT = 1000
+
+def _parse_time(value):
+    return datetime.fromisoformat(value) if value else None
+
+# 查询 Trap：默认从内存中的最近记录返回，指定 history=1 或时间范围时查询 MongoDB 中的历史记录
+@fault_mgmt_bp.route('/traps', methods=['GET'])
+def get_traps():
+    source = request.args.get('source')
+    trap_oid = request.args.get('trap_oid')
+    limit = min(request.args.get('limit', 100, type=int), TRAP_QUERY_MAX_LIMIT)
+    try:
+        since = _parse_time(request.args.get('since'))
+        until = _parse_time(request.args.get('until'))
+    except ValueError as e:
+        return jsonify({'status': 'failure', 'error': f'Invalid time: {e}'}), 400
+
+    try:
+        if request.args.get('history') == '1' or since or until:
+            traps = trap_store.find_traps(source, trap_oid, since, until, limit)
+        else:
+            traps = trap_store.recent_traps(limit, source, trap_oid)
+    except Exception as e:
+        logging.error(f"Error querying traps: {e}")
+        return jsonify({'status': 'failure', 'error': str(e)}), 500
+    return jsonify({'status': 'success', 'traps': [serialize_trap(trap) for trap in traps]}), 200
+
+# 获取 Trap 接收、缓冲区、持久化写入和前端推送的统计
+@fault_mgmt_bp.route('/traps/stats', methods=['GET'])
+def get_trap_stats():
+    return jsonify({'status': 'success', 'ingest': trap_ingest.get_stats(), 'traps': trap_store.get_stats(),
+                    'fanout': trap_fanout.get_stats(), 'device_index': device_index.get_stats(),
+                    'oid_names': oid_names.get_stats()}), 200
+
+# 查询告警：state=active（默认）或 cleared，可按来源、级别、类型过滤；
+# 活动告警带有根因分析结果，symptoms=0 时只返回根因告警和独立告警
+@fault_mgmt_bp.route('/alarms', methods=['GET'])
+def get_alarms():
+    state = request.args.get('state', STATE_ACTIVE)
+    if state not in (STATE_ACTIVE, STATE_CLEARED):
+        return jsonify({'status': 'failure', 'error': f'Invalid state: {state}'}), 400
+    alarms = alarm_engine.list_alarms(source=request.args.get('source'), severity=request.args.get('severity'),
+                                      alarm_type=request.args.get('type'), state=state)
+    if state == STATE_ACTIVE:
+        root_cause_analyzer.correlate(alarms)
+        if request.args.get('symptoms') == '0':
+            alarms = [alarm for alarm in alarms if alarm['correlation'] != 'symptom']
+    limit = request.args.get('limit', type=int)
+    return jsonify({'status': 'success', 'alarms': alarms[:limit] if limit else alarms}), 200
+
+# 按根因网元汇总活动告警
+@fault_mgmt_bp.route('/alarms/root_causes', methods=['GET'])
+def get_root_causes():
+    alarms = alarm_engine.list_alarms(state=STATE_ACTIVE)
+    return jsonify({'status': 'success', 'root_causes': root_cause_analyzer.root_causes(alarms)}), 200
+
+# 手动清除告警
+@fault_mgmt_bp.route('/alarms/<int:alarm_id>/clear', methods=['POST'])
+def clear_alarm(alarm_id):
+    alarm = alarm_engine.acknowledge_clear(alarm_id)
+    if alarm is None:
+        return jsonify({'status': 'failure', 'error': f'Active alarm {alarm_id} not found'}), 404
+    logging.info(f"Alarm {alarm_id} cleared manually")
+    return jsonify({'status': 'success', 'alarm': alarm.to_dict()}), 200
+
+# 获取告警引擎统计（事件数、去重、清除、振荡抑制）
+@fault_mgmt_bp.route('/alarms/stats', methods=['GET'])
+def get_alarm_stats():
+    return jsonify({'status': 'success', 'alarms': alarm_engine.get_stats(),
+                    'root_cause': root_cause_analyzer.get_stats()}), 200
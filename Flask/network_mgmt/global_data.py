@@ -5,6 +5,9 @@ devices = {}
 devices_snmp = {}
 ne_connections = []
 
+# 后台轮询得到的接口计数器历史：{ne_name: deque([(timestamp, {if_index: (InOctets, OutOctets, HCInOctets, HCOutOctets)}), ...])}
+snmp_history = {}
+
 topo_data = {
     "nodes": [],
     "edges": []
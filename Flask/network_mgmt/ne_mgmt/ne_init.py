@@ -1,12 +1,20 @@
 from network_mgmt.global_data import devices, ne_connections
 import logging
 import socket
-from netmiko import ConnectHandler
-from pysnmp.hlapi import *
-from cachetools import cached, TTLCache
-
-# Cache configuration: max size of 100, TTL (time-to-live) of 300 seconds (5 minutes)
-cache = TTLCache(maxsize=100, ttl=300)
+from services.snmp_session import snmp_sessions, filter_snmp_params
+from services.singleflight import single_flight
+from services.ssh_scheduler import ssh_scheduler
+from services.snmp_cache import create_cache, device_cache_key
+from services.snmp_walk import walk_table
+from services.snmp_get import get_scalars
+from services.snmp_oids import (
+    SYS_NAME, SYS_DESCR,
+    IF_INDEX, IF_DESCR, IF_OPER_STATUS, IP_AD_ENT_ADDR, IP_AD_ENT_IF_INDEX,
+    CDP_CACHE_ADDRESS, CDP_CACHE_DEVICE_ID, LLDP_REM_SYS_NAME, LLDP_REM_MAN_ADDR_IF_ID
+)
+
+# SNMP result cache keyed on device IP + credential fingerprint, serving stale entries while refreshing
+cache = create_cache('ne_init')
 
 # Validate IP addresses
 def is_valid_ip(ip):
@@ -30,120 +38,70 @@ def filter_ssh_params(device_info):
     
     return ssh_params
 
-# Filter out SNMP-related parameters from the device info
-def filter_snmp_params(device_info):
-    allowed_keys = ['ip', 'username', 'auth_protocol', 'auth_password', 'priv_protocol', 'priv_password']
-    snmp_params = {}
-
-    # 检查 allowed_keys 中的键，确保 IP 地址等关键参数不会被过滤掉
-    for key in allowed_keys:
-        if key in device_info:
-            snmp_params[key] = device_info[key]
-        snmp_key = f'snmp_{key}'
-        if snmp_key in device_info:
-            snmp_params[key] = device_info[snmp_key]
-
-    return snmp_params
+# SSH 会话池使用的参数（兼容 ssh_ 前缀的设备字段）
+def ssh_session_params(device_info):
+    ssh_params = filter_ssh_params(device_info)
+    return {
+        'device_type': ssh_params.get('device_type'),
+        'ip': ssh_params.get('ip'),
+        'gne_ip': device_info.get('gne'),
+        'username': ssh_params.get('username'),
+        'password': ssh_params.get('password'),
+        'secret': ssh_params.get('secret', ''),
+    }
+
+# SNMP 请求的合并键：同一设备、同一组 USM 凭据（包括密码，与缓存键相同）
+def snmp_flight_key(device):
+    return device_cache_key(device)
 
 # Fetch SNMP data
-@cached(cache, key=lambda device: device['ip'])
+@cache.cached()
+@single_flight(key=snmp_flight_key)
 def get_snmpv3_data(device):
     snmp_params = filter_snmp_params(device)
-    auth_protocol = usmHMACSHAAuthProtocol if snmp_params.get('auth_protocol') == 'SHA' else usmHMACMD5AuthProtocol
-    priv_protocol_input = snmp_params.get('priv_protocol')
-    
-    if priv_protocol_input == 'AES128':
-        priv_protocol = usmAesCfb128Protocol
-    elif priv_protocol_input == 'DES56' or priv_protocol_input == 'DES':
-        priv_protocol = usmDESPrivProtocol
-    else:
-        raise ValueError(f"Unsupported privacy protocol: {priv_protocol_input}")
-    
+    with snmp_sessions.session(snmp_params) as session:
+        return _collect_snmpv3_data(session)
+
+def _collect_snmpv3_data(session):
     ne_node = {}
 
-    # Fetch basic device information (sysName, sysDescr)
-    def fetch_oid(oid, label):
-        iterator = getCmd(
-            SnmpEngine(),
-            UsmUserData(snmp_params['username'], snmp_params['auth_password'], snmp_params['priv_password'],
-                        authProtocol=auth_protocol,
-                        privProtocol=priv_protocol),
-            UdpTransportTarget((snmp_params['ip'], 161), timeout=10.0, retries=5),
-            ContextData(),
-            ObjectType(ObjectIdentity(oid))
-        )
-        errorIndication, errorStatus, errorIndex, varBinds = next(iterator)
-        if errorIndication:
-            ne_node[label] = str(errorIndication)
-        elif errorStatus:
-            ne_node[label] = f'{errorStatus.prettyPrint()} at {errorIndex and varBinds[int(errorIndex)-1][0] or "?"}'
+    # Fetch basic device information (sysName, sysDescr) in as few GET requests as possible
+    scalar_labels = [
+        (SYS_NAME, 'Device Name'),  # sysName
+        (SYS_DESCR, 'Device Version'),  # sysDescr
+    ]
+    values, errors = get_scalars(session, [oid for oid, _ in scalar_labels], timeout=10.0, retries=5)
+    for oid, label in scalar_labels:
+        if oid in errors:
+            ne_node[label] = errors[oid]
         else:
-            ne_node[label] = str(varBinds[0][1])
+            ne_node[label] = '' if values.get(oid) is None else str(values[oid])
 
-    fetch_oid('1.3.6.1.2.1.1.5.0', 'Device Name')  # sysName
-    fetch_oid('1.3.6.1.2.1.1.1.0', 'Device Version')  # sysDescr
-    
     # 获取设备接口信息
     ne_node['Interfaces'] = []
     interface_indexes = {}
 
-    # 获取接口索引、描述和状态
-    iterator = nextCmd(
-        SnmpEngine(),
-        UsmUserData(snmp_params['username'], snmp_params['auth_password'], snmp_params['priv_password'],
-                    authProtocol=auth_protocol,
-                    privProtocol=priv_protocol),
-        UdpTransportTarget((snmp_params['ip'], 161), timeout=10.0, retries=5),
-        ContextData(),
-        ObjectType(ObjectIdentity('1.3.6.1.2.1.2.2.1.1')),  # ifIndex 接口索引
-        ObjectType(ObjectIdentity('1.3.6.1.2.1.2.2.1.2')),  # ifDescr 接口描述
-        ObjectType(ObjectIdentity('1.3.6.1.2.1.2.2.1.8')),  # ifOperStatus 接口状态
-        lexicographicMode=False
-    )
+    # 获取接口索引、描述和状态（GETBULK 按列并行遍历）
+    if_table = walk_table(session, [IF_INDEX, IF_DESCR, IF_OPER_STATUS], timeout=10.0, retries=5)
 
-    # 先获取接口索引、描述和状态
-    for errorIndication, errorStatus, errorIndex, varBinds in iterator:
-        if errorIndication:
-            logging.error(f"Error indication: {errorIndication}")
-            break
-        elif errorStatus:
-            logging.error(f"Error status: {errorStatus.prettyPrint()}")
-            break
-
-        if_index = str(varBinds[0][1])  # 接口索引
+    for row_index, raw_if_index in if_table[IF_INDEX].items():
+        if_index = str(raw_if_index)  # 接口索引
         interface_info = {
             'Index': if_index,  # 接口索引
-            'Description': str(varBinds[1][1]),  # 接口名称
-            'Status': str(varBinds[2][1]),  # 接口状态
+            'Description': str(if_table[IF_DESCR].get(row_index, '')),  # 接口名称
+            'Status': str(if_table[IF_OPER_STATUS].get(row_index, '')),  # 接口状态
             'IP Address': None  # 占位符，稍后获取IP地址
         }
         ne_node['Interfaces'].append(interface_info)
         interface_indexes[if_index] = interface_info  # 存储接口索引以便后续查找
 
     # 获取每个接口的IP地址
-    ip_iterator = nextCmd(
-        SnmpEngine(),
-        UsmUserData(snmp_params['username'], snmp_params['auth_password'], snmp_params['priv_password'],
-                    authProtocol=auth_protocol,
-                    privProtocol=priv_protocol),
-        UdpTransportTarget((snmp_params['ip'], 161), timeout=10.0, retries=5),
-        ContextData(),
-        ObjectType(ObjectIdentity('1.3.6.1.2.1.4.20.1.2')),  # ipAdEntIfIndex 表示哪个接口有此IP
-        ObjectType(ObjectIdentity('1.3.6.1.2.1.4.20.1.1')),  # ipAdEntAddr 对应的IP地址
-        lexicographicMode=False
-    )
+    ip_table = walk_table(session, [IP_AD_ENT_IF_INDEX, IP_AD_ENT_ADDR], timeout=10.0, retries=5)
 
     # 遍历IP地址表，将IP地址与接口索引匹配
-    for errorIndication, errorStatus, errorIndex, varBinds in ip_iterator:
-        if errorIndication:
-            logging.error(f"Error indication: {errorIndication}")
-            break
-        elif errorStatus:
-            logging.error(f"Error status: {errorStatus.prettyPrint()}")
-            break
-
-        ip_if_index = str(varBinds[0][1])  # 与接口匹配的索引
-        raw_ip_address = varBinds[1][1]  # IP地址 (raw bytes)
+    for row_index, raw_ip_if_index in ip_table[IP_AD_ENT_IF_INDEX].items():
+        ip_if_index = str(raw_ip_if_index)  # 与接口匹配的索引
+        raw_ip_address = ip_table[IP_AD_ENT_ADDR].get(row_index)  # IP地址 (raw bytes)
         try:
             ip_address = socket.inet_ntoa(raw_ip_address.asOctets())  # 将原始字节转换为标准IP
         except Exception as e:
@@ -157,80 +115,50 @@ def get_snmpv3_data(device):
     return ne_node
 
 # Discover neighboring devices via SNMP
+@single_flight(key=lambda device: (snmp_flight_key(device), device['device_type']))
 def discover_neighbors(device):
     """
     Discover neighbors using either LLDP or CDP depending on the device type.
     LLDP is used for non-Cisco devices, and CDP is used for Cisco devices.
     """
     snmp_params = filter_snmp_params(device)
-    auth_protocol = usmHMACSHAAuthProtocol if snmp_params.get('auth_protocol') == 'SHA' else usmHMACMD5AuthProtocol
-    priv_protocol_input = snmp_params.get('priv_protocol')
-    
-    if priv_protocol_input == 'AES128':
-        priv_protocol = usmAesCfb128Protocol
-    elif priv_protocol_input == 'DES56' or priv_protocol_input == 'DES':
-        priv_protocol = usmDESPrivProtocol
-    else:
-        raise ValueError(f"Unsupported privacy protocol: {priv_protocol_input}")
-    
+    with snmp_sessions.session(snmp_params) as session:
+        return _discover_neighbors(session, device)
+
+def _discover_neighbors(session, device):
     neighbors = []
     discovered_devices = {}  # 新增：存储已发现的邻居设备
 
     if device['device_type'] == 'cisco_ios':
         # 使用CDP发现邻居
         logging.debug(f"Using CDP to discover neighbors for Cisco device {device['device_name']}")
-        iterator = nextCmd(
-            SnmpEngine(),
-            UsmUserData(snmp_params['username'], snmp_params['auth_password'], snmp_params['priv_password'],
-                        authProtocol=auth_protocol,
-                        privProtocol=priv_protocol),
-            UdpTransportTarget((snmp_params['ip'], 161), timeout=10.0, retries=5),
-            ContextData(),
-            ObjectType(ObjectIdentity('1.3.6.1.4.1.9.9.23.1.2.1.1.6')),  # cdpCacheDeviceId
-            ObjectType(ObjectIdentity('1.3.6.1.4.1.9.9.23.1.2.1.1.4')),  # cdpCacheAddress
-            lexicographicMode=False
-        )
+        name_column, address_column = CDP_CACHE_DEVICE_ID, CDP_CACHE_ADDRESS
     else:
         # 使用LLDP发现邻居
         logging.debug(f"Using LLDP to discover neighbors for non-Cisco device {device['device_name']}")
-        iterator = nextCmd(
-            SnmpEngine(),
-            UsmUserData(snmp_params['username'], snmp_params['auth_password'], snmp_params['priv_password'],
-                        authProtocol=auth_protocol,
-                        privProtocol=priv_protocol),
-            UdpTransportTarget((snmp_params['ip'], 161), timeout=10.0, retries=5),
-            ContextData(),
-            ObjectType(ObjectIdentity('1.0.8802.1.1.2.1.4.1.1.9')),  # lldpRemSysName
-            ObjectType(ObjectIdentity('1.0.8802.1.1.2.1.4.2.1.4')),  # lldpRemManAddr
-            lexicographicMode=False
-        )
+        name_column, address_column = LLDP_REM_SYS_NAME, LLDP_REM_MAN_ADDR_IF_ID
 
-    for errorIndication, errorStatus, errorIndex, varBinds in iterator:
-        if errorIndication:
-            logging.error(f"Error indication: {errorIndication}")
-            continue
-        elif errorStatus:
-            logging.error(f"Error status: {errorStatus.prettyPrint()}")
-            continue
-        
+    neighbor_table = walk_table(session, [name_column, address_column], timeout=10.0, retries=5)
+
+    # 两列按遍历顺序逐行配对
+    for (_, raw_name), (address_index, raw_address) in zip(neighbor_table[name_column].items(),
+                                                            neighbor_table[address_column].items()):
         # 处理不同协议返回的邻居信息
         if device['device_type'] == 'cisco_ios':
             # CDP 邻居发现
-            ne_name = str(varBinds[0][1])  # Neighbor device's system name from CDP
-            ne_ip = '.'.join(map(str, varBinds[1][1].asNumbers()))  # CDP uses cdpCacheAddress
+            ne_name = str(raw_name)  # Neighbor device's system name from CDP
+            ne_ip = '.'.join(map(str, raw_address.asNumbers()))  # CDP uses cdpCacheAddress
             logging.debug(f"Discovered CDP neighbor: {ne_name}, IP: {ne_ip}")
         else:
             # LLDP 邻居发现
-            ne_name = str(varBinds[0][1])  # Neighbor device's system name
-            addr_oid = varBinds[1][0].prettyPrint()
-            oid_parts = addr_oid.split('.')
+            ne_name = str(raw_name)  # Neighbor device's system name
+            oid_parts = address_index.split('.')
             try:
                 ne_ip = '.'.join(oid_parts[-4:])  # Last four parts of OID as IP address
             except Exception as e:
                 logging.error(f"Failed to extract IP from OID: {e}")
                 ne_ip = None
 
-
         if ne_ip is None or not is_valid_ip(ne_ip):
             logging.error(f"Invalid or missing IP address discovered: {ne_ip}")
             continue
@@ -265,93 +193,37 @@ def discover_neighbors(device):
     
     return discovered_devices, neighbors, ne_connections
 
-# Query device via GNE as a gateway
-def query_device_via_gateway(gne_ip, target_ip, command, device_type, ssh_username, ssh_password, ssh_secret):
-    try:
-        # 构造 SSH 连接的基本参数
-        target_params = {
-            'device_type': device_type,
-            'ip': target_ip,
-            'username': ssh_username,
-            'password': ssh_password,
-            'secret': ssh_secret,
-            'session_log': f'session_log_{target_ip}.txt',
-            'global_delay_factor': 2  # 增加全局延迟
-        }
-
-        logging.info(f"Device type: {device_type}, command: {command}")
-
-        # Huawei通过GNE设备跳转的逻辑
-        if device_type == 'huawei' and gne_ip and gne_ip != target_ip:
-            gne_params = {
-                'device_type': device_type,
-                'ip': gne_ip,
-                'username': ssh_username,
-                'password': ssh_password,
-                'secret': ssh_secret,
-                'session_log': f'session_log_{gne_ip}.txt',
-                'global_delay_factor': 2
-            }
-
-            logging.info(f"Connecting to GNE device {gne_ip} to reach target device {target_ip}")
-            connection = ConnectHandler(**gne_params)
-            if 'secret' in gne_params:
-                connection.enable()
-
-            # 跳转到目标设备
-            stelnet_command = f"stelnet {target_ip}"
-            command_output = connection.send_command_timing(stelnet_command)
-
-            # 处理认证提示
-            if 'The server is not authenticated' in command_output:
-                command_output += connection.send_command_timing('Y')
-
-            command_output += connection.send_command_timing(ssh_username)
-            command_output += connection.send_command_timing(ssh_password)
-
-            if 'Change now? [Y/N]' in command_output:
-                command_output += connection.send_command_timing('N')
-
-            # 执行命令
-            connection.send_command('screen-length 0 temporary')
-            command_output += connection.send_command(command, expect_string=r'[>#]', read_timeout=20)
-        else:
-            # 直接连接到目标设备（适用于Cisco或者Huawei不使用GNE的情况）
-            logging.info(f"Connecting directly to device {target_ip}")
-            connection = ConnectHandler(**target_params)
-
-            # 对于 Cisco 设备，进入 enable 模式并执行命令
-            if device_type == 'cisco_ios':
-                logging.info("Entering enable mode for Cisco device...")
-
-                # 如果有 enable 密码，则执行 connection.enable() 否则直接输入 enable
-                if ssh_secret:
-                    connection.enable()
-                else:
-                    # 直接执行 enable，无需密码
-                    output = connection.send_command_timing('enable')
-                    if 'Password' in output:
-                        # 如果提示输入密码但未提供，直接继续
-                        logging.info("No enable password provided, skipping password input.")
-                        output += connection.send_command_timing('\n')
-
-                logging.info(f"Enable mode output: {output}")
-
-                # 关闭分页输出，防止分页中断
-                connection.send_command('terminal length 0')
+# Query (read-only) configuration; concurrent identical queries (same credentials, including the enable secret)
+# share one SSH session
+@single_flight(key=lambda gne_ip, target_ip, command, device_type, ssh_username, ssh_password, ssh_secret,
+               requester=None: (gne_ip, target_ip, command, device_type, ssh_username, ssh_password, ssh_secret))
+def query_config(gne_ip, target_ip, command, device_type, ssh_username, ssh_password, ssh_secret, requester=None):
+    return query_device_via_gateway(gne_ip, target_ip, command, device_type, ssh_username, ssh_password, ssh_secret,
+                                    requester)
+
+# Query device via GNE as a gateway; the logged-in session (including the stelnet hop) is kept in the pool.
+# requester identifies the user for fair queueing when the device's VTY lines are all in use
+def query_device_via_gateway(gne_ip, target_ip, command, device_type, ssh_username, ssh_password, ssh_secret,
+                             requester=None):
+    ssh_params = {
+        'device_type': device_type,
+        'ip': target_ip,
+        'gne_ip': gne_ip,
+        'username': ssh_username,
+        'password': ssh_password,
+        'secret': ssh_secret,
+    }
+    logging.info(f"Device type: {device_type}, command: {command}")
 
+    try:
+        with ssh_scheduler.session(requester, ssh_params) as session:
             # 执行指定的命令，并增加读取超时时间
-            logging.info(f"Executing command: {command}")
-            command_output = connection.send_command(command, expect_string=r'[>#]', read_timeout=60, delay_factor=2)
-
-            # 打印完整的命令输出
+            logging.info(f"Executing command on {target_ip}: {command}")
+            command_output = session.run(command, expect_string=r'[>#]', read_timeout=60)
             logging.info(f"Command output: {command_output}")
 
-        connection.send_command_timing('quit')
-        connection.disconnect()
-
         return {'status': 'success', 'output': command_output}
 
     except Exception as e:
         logging.error(f"Error during SSH connection: {str(e)}")
-        return {'status': 'failure', 'error': str(e)}
\ No newline at end of file
+        return {'status': 'failure', 'error': str(e)}
@@ -1,60 +1,100 @@
-from pysnmp.hlapi import *
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 from network_mgmt.global_data import devices
+from services.snmp_session import snmp_sessions, filter_snmp_params
+from services.snmp_get import get_scalars
+from services.snmp_oids import SYS_NAME
+from services.snmp_health import CircuitOpenError
 
-# 过滤出SNMP相关的参数
-def filter_snmp_params(device_info):
-    allowed_keys = ['ip', 'auth_protocol', 'auth_password', 'priv_protocol', 'priv_password', 'username']
-    snmp_params = {}
-    
-    for key in allowed_keys:
-        if key in device_info:
-            snmp_params[key] = device_info[key]
-        snmp_key = f'snmp_{key}'
-        if snmp_key in device_info:
-            snmp_params[key] = device_info[snmp_key]
+# 状态巡检的默认参数：同时在途的探测数量上限，以及整轮巡检的截止时间（秒）
+SWEEP_MAX_IN_FLIGHT = 64
+SWEEP_DEADLINE = 30.0
+# 单个设备状态探测的总时间预算（秒），实际超时按设备 RTT 自适应
+STATUS_PROBE_BUDGET = 5.0
 
-    return snmp_params
+# 最近一次巡检的统计信息
+last_sweep = {}
 
 # 简单通过SNMP检测设备是否在线
 def device_status_snmp(device):
     snmp_params = filter_snmp_params(device)
-    auth_protocol = usmHMACSHAAuthProtocol if snmp_params.get('auth_protocol') == 'SHA' else usmHMACMD5AuthProtocol
-    priv_protocol_input = snmp_params.get('priv_protocol')
-    
-    if priv_protocol_input == 'AES128':
-        priv_protocol = usmAesCfb128Protocol
-    elif priv_protocol_input == 'DES56' or priv_protocol_input == 'DES':
-        priv_protocol = usmDESPrivProtocol
-    else:
-        raise ValueError(f"Unsupported privacy protocol: {priv_protocol_input}")
-
-    iterator = getCmd(
-        SnmpEngine(),
-        UsmUserData(snmp_params['username'], snmp_params['auth_password'], snmp_params['priv_password'],
-                    authProtocol=auth_protocol, privProtocol=priv_protocol),
-        UdpTransportTarget((snmp_params['ip'], 161), timeout=2.0, retries=2),
-        ContextData(),
-        ObjectType(ObjectIdentity('1.3.6.1.2.1.1.5.0'))  # sysName OID
-    )
-
-    errorIndication, errorStatus, errorIndex, varBinds = next(iterator)
+
+    try:
+        with snmp_sessions.session(snmp_params, budget=STATUS_PROBE_BUDGET) as session:
+            values, errors = get_scalars(session, [SYS_NAME], retries=2)
+    except CircuitOpenError:
+        # 连续超时的设备在退避期内直接判定为离线
+        return False
 
     # 如果能成功返回则设备在线
-    if errorIndication or errorStatus:
-        return False  # 设备不在线
-    return True  # 设备在线
+    return SYS_NAME not in errors
 
-# 使用SNMP检查设备的在线状态
-def check_all_devices():
-    for ne_name, device in devices.items():
+async def _probe_device(loop, executor, semaphore, ne_name, device):
+    """在线程池中执行一次阻塞的 SNMP 探测，返回 (ne_name, status)"""
+    async with semaphore:
         try:
-            # 通过SNMP检查设备是否在线
-            if device_status_snmp(device):
-                device['status'] = 'online'
-            else:
-                device['status'] = 'offline'
+            online = await loop.run_in_executor(executor, device_status_snmp, device)
         except Exception as e:
-            device['status'] = 'offline'
+            logging.debug(f"Status probe failed for {ne_name}: {e}")
+            online = False
+    return ne_name, 'online' if online else 'offline'
+
+async def sweep_devices(targets, max_in_flight=SWEEP_MAX_IN_FLIGHT, deadline=SWEEP_DEADLINE):
+    """
+    并发探测 targets（{ne_name: device}）中的所有设备。
+    最多同时有 max_in_flight 个探测在途，整轮巡检超过 deadline 秒后未完成的设备保持原状态。
+    返回 {ne_name: status}，只包含在截止时间内完成的设备。
+    """
+    results = {}
+    if not targets:
+        return results
+
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(max_in_flight)
+    executor = ThreadPoolExecutor(max_workers=min(max_in_flight, len(targets)), thread_name_prefix='ne-status')
+    try:
+        tasks = [
+            asyncio.ensure_future(_probe_device(loop, executor, semaphore, ne_name, device))
+            for ne_name, device in targets.items()
+        ]
+        done, pending = await asyncio.wait(tasks, timeout=deadline)
+        for task in pending:
+            task.cancel()
+        for task in done:
+            ne_name, status = task.result()
+            results[ne_name] = status
+    finally:
+        # 不等待超时的探测线程结束，它们的结果会被丢弃
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return results
+
+# 使用SNMP检查设备的在线状态
+def check_all_devices(max_in_flight=SWEEP_MAX_IN_FLIGHT, deadline=SWEEP_DEADLINE):
+    targets = dict(devices)
+    started = time.monotonic()
+
+    results = asyncio.run(sweep_devices(targets, max_in_flight=max_in_flight, deadline=deadline))
+
+    # 将探测结果写回设备记录
+    for ne_name, status in results.items():
+        device = devices.get(ne_name)
+        if device is not None:
+            device['status'] = status
+
+    duration = time.monotonic() - started
+    online = sum(1 for status in results.values() if status == 'online')
+    last_sweep.clear()
+    last_sweep.update({
+        'total': len(targets),
+        'online': online,
+        'offline': len(results) - online,
+        'timed_out': len(targets) - len(results),
+        'duration': round(duration, 3),
+        'finished_at': time.time()
+    })
 
-        # 打印每个设备的状态
-        print(f"Device {ne_name} status: {device['status']}")
\ No newline at end of file
+    logging.info(f"Status sweep finished in {duration:.2f}s: {last_sweep}")
+    return dict(last_sweep)
@@ -2,10 +2,12 @@ from flask import Blueprint, jsonify, request
 from network_mgmt.global_data import devices, devices_snmp, topo_data
 from .ne_init import (
     get_snmpv3_data, discover_neighbors, is_valid_ip, 
-    filter_ssh_params,query_device_via_gateway
+    filter_ssh_params,query_device_via_gateway,query_config,ssh_session_params
 )
 from .topo_init import update_topo_data
-from netmiko import ConnectHandler
+from services.ssh_pool import ssh_pool
+from services.ssh_scheduler import ssh_scheduler
+from services.gne_sessions import gne_sessions
 from services.db import get_db
 from models.network import convert_device_to_db_format, move_ne_to_site, add_ne_to_network_root, remove_ne_from_site, save_topology_to_db
 import logging
@@ -54,7 +56,9 @@ def add_device(network_name):
 
     if is_valid_ip(gne_device['ip']):
         try:
-            connection = ConnectHandler(**filter_ssh_params(gne_device))
+            # 验证 SSH 登录，建立的会话留在会话池中供之后的配置查询复用
+            with ssh_scheduler.session(request.remote_addr, ssh_session_params(gne_device)):
+                pass
             # 将设备信息直接存入 devices 字典中，无需子字典
             devices[ne_name] = gne_device
             print(f"Device data in devices: {devices}")
@@ -217,8 +221,9 @@ def get_config(network_name, ne_name):
 
     logging.info(f"Running command '{command}' on device type '{device_type}'.")
 
-    # 传递命令和设备类型到 query_device_via_gateway
-    result = query_device_via_gateway(gne_ip, ip, command, device_type, ssh_username, ssh_password, ssh_secret)
+    # 传递命令和设备类型到 query_config（相同的并发查询只连接设备一次）
+    result = query_config(gne_ip, ip, command, device_type, ssh_username, ssh_password, ssh_secret,
+                          requester=request.remote_addr)
 
     # 打印返回结果
     logging.info(f"Query result for {ne_name}: {result}")
@@ -258,13 +263,21 @@ def apply_config(network_name, ne_name):
         return jsonify({'status': 'failure', 'error': 'SSH credentials, new configuration, and IP are required'}), 400
 
     # 使用 GNE 跳转到目标设备下发配置
-    result = query_device_via_gateway(gne_ip, ip, new_config, device_type, ssh_username, ssh_password, ssh_secret)
+    result = query_device_via_gateway(gne_ip, ip, new_config, device_type, ssh_username, ssh_password, ssh_secret,
+                                      requester=request.remote_addr)
     
     if result['status'] == 'success':
         return jsonify({'status': 'success', 'message': '新配置已成功下发到设备'}), 200
     else:
         return jsonify({'status': 'failure', 'error': result['error']}), 500
 
+# SSH 会话池统计：每个设备打开和空闲的会话数、复用和等待次数；GNE 连接和各跳转的健康状态；
+# 调度器的排队深度、等待时间和各设备的 VTY 占用
+@ne_mgmt_bp.route('/ssh/stats', methods=['GET'])
+def get_ssh_stats():
+    return jsonify({'status': 'success', 'pool': ssh_pool.get_stats(), 'gne': gne_sessions.get_stats(),
+                    'scheduler': ssh_scheduler.get_stats()}), 200
+
 # 保存初始化完成后的设备到 MongoDB 数据库
 @ne_mgmt_bp.route('/<network_name>/elements/save', methods=['POST'])
 def save_devices_to_db(network_name):
@@ -1,4 +1,5 @@
 from network_mgmt.global_data import devices, ne_connections, devices_snmp, topo_data
+from fault_mgmt.root_cause import root_cause_analyzer
 import networkx as nx
 import logging
 from ipaddress import ip_network, ip_address
@@ -14,6 +15,8 @@ def update_topo_data(network_name):
         # 更新全局的 topo_data
         topo_data["nodes"] = new_topology["nodes"]
         topo_data["edges"] = new_topology["edges"]
+        # 拓扑变化后，根因分析在下一次查询时重新计算该网络的支配树
+        root_cause_analyzer.update_topology(network_name, new_topology)
 
          # 打印更新后的拓扑数据
         print(f"Updated topo_data: {topo_data}")
@@ -1,5 +1,6 @@
 from services.db import get_db
 from network_mgmt.global_data import devices, topo_data
+from fault_mgmt.root_cause import root_cause_analyzer
 
 def load_data_from_db(network_id):
     db = get_db()
@@ -44,6 +45,8 @@ def load_data_from_db(network_id):
         # 这里假设 network 包含拓扑数据，加载到内存
         topo_data.update(network.get('topo_data', {}))
         print(f"Topology data loaded into memory: {topo_data}")
+        root_cause_analyzer.clear()
+        root_cause_analyzer.update_topology(network_name, topo_data)
 
         return {
             "network_name": network_name,
@@ -1,10 +1,22 @@
-import logging
 import socket
-from pysnmp.hlapi import *
-from cachetools import cached, TTLCache
+import time
+from services.snmp_session import snmp_sessions, filter_snmp_params
+from services.singleflight import single_flight
+from services.snmp_cache import create_cache, device_cache_key
+from services.snmp_walk import walk_table
+from services.snmp_get import get_scalars
+from services.snmp_oids import (
+    SYS_NAME, SYS_DESCR, SYS_UPTIME, HR_PROCESSOR_LOAD, HR_STORAGE_USED,
+    IF_INDEX, IF_DESCR, IF_OPER_STATUS, IF_SPEED, IF_IN_OCTETS, IF_OUT_OCTETS, IP_AD_ENT_IF_INDEX,
+    IF_HIGH_SPEED, IF_HC_IN_OCTETS, IF_HC_OUT_OCTETS, IF_TABLE_LAST_CHANGE
+)
+from .refresh_planner import refresh_planner
 
-# 设置缓存，大小为100，缓存时间300秒
-cache = TTLCache(maxsize=100, ttl=300)
+# SNMP 结果缓存：按设备 IP + 凭据指纹缓存，过期后先返回旧数据并在后台刷新
+cache = create_cache('performance')
+
+# 单接口重新轮询的时间预算（秒）
+INTERFACE_REFRESH_BUDGET = 5.0
 
 # 验证IP地址格式
 def is_valid_ip(ip):
@@ -14,114 +26,121 @@ def is_valid_ip(ip):
     except socket.error:
         return False   
 
-# 获取 SNMP v3 数据
-@cached(cache, key=lambda device: device['ip'])
+# 获取 SNMP v3 数据（带缓存）
+@cache.cached()
 def get_snmpv3_data(device):
-    snmp_params = device
-    auth_protocol = usmHMACSHAAuthProtocol if snmp_params.get('auth_protocol') == 'SHA' else usmHMACMD5AuthProtocol
-    priv_protocol_input = snmp_params.get('priv_protocol')
-    
-    if priv_protocol_input == 'AES128':
-        priv_protocol = usmAesCfb128Protocol
-    elif priv_protocol_input == 'DES56' or priv_protocol_input == 'DES':
-        priv_protocol = usmDESPrivProtocol
+    return fetch_snmpv3_data(device)
+
+# 直接从设备获取 SNMP v3 数据，不经过缓存（供后台轮询使用）
+# 同一设备、同一组凭据（包括密码）的并发请求（页面请求与后台轮询）合并为一次
+@single_flight(key=device_cache_key)
+def fetch_snmpv3_data(device):
+    snmp_params = filter_snmp_params(device)
+    with snmp_sessions.session(snmp_params) as session:
+        return _collect_snmpv3_data(session, device_cache_key(device))
+
+# 只读取一个接口的 ifOperStatus（Trap 触发的定向重新轮询），不更新计数器以免打乱速率计算
+def fetch_interface_status(device, if_index):
+    snmp_params = filter_snmp_params(device)
+    oid = f'{IF_OPER_STATUS}.{if_index}'
+    with snmp_sessions.session(snmp_params, budget=INTERFACE_REFRESH_BUDGET) as session:
+        values, errors = get_scalars(session, [oid], timeout=2.0, retries=2)
+    if oid in errors:
+        raise RuntimeError(errors[oid])
+    return None if values.get(oid) is None else str(values[oid])
+
+def _optional_str(value):
+    return None if value is None else str(value)
+
+def _interface_speed(if_speed, if_high_speed):
+    # ifSpeed 最大只能表示约 4.29Gbit/s，更快的接口以 ifHighSpeed（单位 Mbit/s）为准
+    if if_high_speed is not None and int(if_high_speed) > 0:
+        return int(if_high_speed) * 1000000
+    return int(if_speed) if if_speed is not None else None
+
+# 接口结构列（很少变化）和每次都需要获取的状态、计数器列
+INTERFACE_STRUCTURE_COLUMNS = [IF_INDEX, IF_DESCR, IF_SPEED, IF_HIGH_SPEED]
+INTERFACE_COUNTER_COLUMNS = [IF_OPER_STATUS, IF_IN_OCTETS, IF_OUT_OCTETS]
+INTERFACE_HC_COUNTER_COLUMNS = [IF_HC_IN_OCTETS, IF_HC_OUT_OCTETS]
+
+def _walk_interface_structure(session):
+    """遍历接口结构列，返回 {行索引: {'Index', 'Description', 'Speed'}}"""
+    if_table = walk_table(session, INTERFACE_STRUCTURE_COLUMNS, timeout=10.0, retries=5)
+    return {
+        row_index: {
+            'Index': str(raw_if_index),  # 接口索引
+            'Description': str(if_table[IF_DESCR].get(row_index, '')),  # 接口名称
+            'Speed': _interface_speed(if_table[IF_SPEED].get(row_index), if_table[IF_HIGH_SPEED].get(row_index)),  # bit/s
+        }
+        for row_index, raw_if_index in if_table[IF_INDEX].items()
+    }
+
+def _walk_addresses(session):
+    """遍历 ipAddrTable，返回 {ifIndex: IP 地址}；表的索引就是 IP 地址，只需要遍历 ipAdEntIfIndex 一列"""
+    ip_table = walk_table(session, [IP_AD_ENT_IF_INDEX], timeout=10.0, retries=5)
+    return {str(raw_if_index): ip_address for ip_address, raw_if_index in ip_table[IP_AD_ENT_IF_INDEX].items()}
+
+def _collect_snmpv3_data(session, state_key):
+    """state_key 是刷新计划的状态键（设备 IP + 凭据指纹，与缓存键相同）"""
+    ne_node = {'Timestamp': time.time()}  # 采集时间，用于计算计数器速率
+
+    # Fetch basic device information (sysName, sysDescr) in as few GET requests as possible
+    # sysUpTime 和 ifTableLastChange 用来判断接口表结构是否需要重新遍历
+    scalar_labels = [
+        (SYS_NAME, 'Device Name'),  # sysName
+        (SYS_DESCR, 'Device Version'),  # sysDescr
+        (HR_PROCESSOR_LOAD, 'CPU Metrics'),  # hrProcessorLoad
+        (HR_STORAGE_USED, 'Storage Metrics'),  # hrStorageUsed
+    ]
+    values, errors = get_scalars(session, [oid for oid, _ in scalar_labels] + [SYS_UPTIME, IF_TABLE_LAST_CHANGE],
+                                 timeout=10.0, retries=5)
+    for oid, label in scalar_labels:
+        if oid in errors:
+            ne_node[label] = errors[oid]
+        else:
+            ne_node[label] = '' if values.get(oid) is None else str(values[oid])
+    sys_uptime, if_table_last_change = values.get(SYS_UPTIME), values.get(IF_TABLE_LAST_CHANGE)
+
+    state = refresh_planner.state(state_key)
+    structure_walked = refresh_planner.needs_structure_walk(state, sys_uptime, if_table_last_change)
+    if structure_walked:
+        interfaces = _walk_interface_structure(session)
+    else:
+        interfaces = state.interfaces
+
+    # 获取接口状态和流量计数（GETBULK 按列并行遍历）；设备不支持 ifHC 计数器时不再请求这两列
+    counter_columns = INTERFACE_COUNTER_COLUMNS + (INTERFACE_HC_COUNTER_COLUMNS if state.has_hc_counters or structure_walked else [])
+    counters = walk_table(session, counter_columns, timeout=10.0, retries=5)  # 实际超时按设备 RTT 自适应，总耗时受会话预算限制
+    hc_in = counters.get(IF_HC_IN_OCTETS, {})
+    hc_out = counters.get(IF_HC_OUT_OCTETS, {})
+
+    if not structure_walked and set(counters[IF_OPER_STATUS]) != set(interfaces):
+        # 接口行集合变化了（设备不支持 ifTableLastChange 时靠这里发现），重新遍历结构
+        interfaces = _walk_interface_structure(session)
+        structure_walked = True
+
+    if structure_walked:
+        refresh_planner.record_structure(state, sys_uptime, if_table_last_change, interfaces, bool(hc_in))
     else:
-        raise ValueError(f"Unsupported privacy protocol: {priv_protocol_input}")
-    
-    ne_node = {}
-
-    # Fetch basic device information (sysName, sysDescr)
-    def fetch_oid(oid, label):
-        iterator = getCmd(
-            SnmpEngine(),
-            UsmUserData(snmp_params['username'], snmp_params['auth_password'], snmp_params['priv_password'],
-                        authProtocol=auth_protocol,
-                        privProtocol=priv_protocol),
-            UdpTransportTarget((snmp_params['ip'], 161), timeout=10.0, retries=5),
-            ContextData(),
-            ObjectType(ObjectIdentity(oid))
+        refresh_planner.record_counters(state, sys_uptime)
+
+    # 获取每个接口的IP地址（仅在接口结构变化或超过最长间隔时重新遍历 ipAddrTable）
+    if refresh_planner.needs_address_walk(state, structure_walked):
+        refresh_planner.record_addresses(state, _walk_addresses(session))
+
+    ne_node['Interfaces'] = [
+        dict(
+            interface,
+            **{
+                'Status': str(counters[IF_OPER_STATUS].get(row_index, '')),  # 接口状态
+                'IP Address': state.addresses.get(interface['Index']),
+                'InOctets': str(counters[IF_IN_OCTETS].get(row_index, '')),  # 接收到的字节数
+                'OutOctets': str(counters[IF_OUT_OCTETS].get(row_index, '')),  # 发送的字节数
+                'HCInOctets': _optional_str(hc_in.get(row_index)),  # 64 位接收字节数（不支持时为 None）
+                'HCOutOctets': _optional_str(hc_out.get(row_index)),  # 64 位发送字节数
+            }
         )
-        errorIndication, errorStatus, errorIndex, varBinds = next(iterator)
-        if errorIndication:
-            ne_node[label] = str(errorIndication)
-        elif errorStatus:
-            ne_node[label] = f'{errorStatus.prettyPrint()} at {errorIndex and varBinds[int(errorIndex)-1][0] or "?"}'
-        else:
-            ne_node[label] = str(varBinds[0][1])
-
-    fetch_oid('1.3.6.1.2.1.1.5.0', 'Device Name')  # sysName
-    fetch_oid('1.3.6.1.2.1.1.1.0', 'Device Version')  # sysDescr
-    fetch_oid('1.3.6.1.2.1.25.3.3.1.2.1', 'CPU Metrics')  # hrProcessorLoad
-    fetch_oid('1.3.6.1.2.1.25.2.3.1.6.1', 'Storage Metrics')  # hrStorageUsed
-  
-    # 获取设备接口信息
-    ne_node['Interfaces'] = []
-    interface_indexes = {}
-
-    # 获取接口索引、描述和状态
-    iterator = nextCmd(
-        SnmpEngine(),
-        UsmUserData(snmp_params['username'], snmp_params['auth_password'], snmp_params['priv_password'],
-                    authProtocol=auth_protocol, privProtocol=priv_protocol),
-        UdpTransportTarget((snmp_params['ip'], 161), timeout=15.0, retries=10),  # 增加超时时间和重试次数
-        ContextData(),
-        ObjectType(ObjectIdentity('1.3.6.1.2.1.2.2.1.1')),  # ifIndex 接口索引
-        ObjectType(ObjectIdentity('1.3.6.1.2.1.2.2.1.2')),  # ifDescr 接口描述
-        ObjectType(ObjectIdentity('1.3.6.1.2.1.2.2.1.8')),  # ifOperStatus 接口状态
-        ObjectType(ObjectIdentity('1.3.6.1.2.1.2.2.1.10')),  # ifInOctets 接收到的字节数
-        ObjectType(ObjectIdentity('1.3.6.1.2.1.2.2.1.16')),  # ifOutOctets 发送的字节数
-        lexicographicMode=False
-    )
-
-    for errorIndication, errorStatus, errorIndex, varBinds in iterator:
-        if errorIndication:
-            logging.error(f"Error indication: {errorIndication}")
-            break
-        elif errorStatus:
-            logging.error(f"Error status: {errorStatus.prettyPrint()}")
-            break
-
-        if_index = str(varBinds[0][1])  # 接口索引
-        interface_info = {
-            'Index': if_index,  # 接口索引
-            'Description': str(varBinds[1][1]),  # 接口名称
-            'Status': str(varBinds[2][1]),  # 接口状态
-            'IP Address': None,  # 占位符，稍后获取IP地址
-            'InOctets': str(varBinds[3][1]),  # 接收到的字节数
-            'OutOctets': str(varBinds[4][1]),  # 发送的字节数
-        }
-        ne_node['Interfaces'].append(interface_info)
-        interface_indexes[if_index] = interface_info  # 存储接口索引以便后续查找
-
-    # 获取每个接口的IP地址
-    ip_iterator = nextCmd(
-        SnmpEngine(),
-        UsmUserData(snmp_params['username'], snmp_params['auth_password'], snmp_params['priv_password'],
-                    authProtocol=auth_protocol, privProtocol=priv_protocol),
-        UdpTransportTarget((snmp_params['ip'], 161), timeout=15.0, retries=10),  # 增加超时时间和重试次数
-        ContextData(),
-        ObjectType(ObjectIdentity('1.3.6.1.2.1.4.20.1.2')),  # ipAdEntIfIndex 表示哪个接口有此IP
-        ObjectType(ObjectIdentity('1.3.6.1.2.1.4.20.1.1')),  # ipAdEntAddr 对应的IP地址
-        lexicographicMode=False
-    )
-
-    for errorIndication, errorStatus, errorIndex, varBinds in ip_iterator:
-        if errorIndication:
-            logging.error(f"Error indication: {errorIndication}")
-            break
-        elif errorStatus:
-            logging.error(f"Error status: {errorStatus.prettyPrint()}")
-            break
-
-        ip_if_index = str(varBinds[0][1])  # 与接口匹配的索引
-        raw_ip_address = varBinds[1][1]  # IP地址 (raw bytes)
-        try:
-            ip_address = socket.inet_ntoa(raw_ip_address.asOctets())  # 将原始字节转换为标准IP
-        except Exception as e:
-            logging.error(f"Failed to convert IP address: {e}")
-            ip_address = None
-
-        if ip_if_index in interface_indexes:
-            interface_indexes[ip_if_index]['IP Address'] = ip_address
-
-    return ne_node
\ No newline at end of file
+        for row_index, interface in interfaces.items()
+    ]
+
+    return ne_node
@@ -0,0 +1,282 @@
+import bisect
+import hashlib
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from multiprocessing.connection import wait
+from services.snmp_health import CircuitOpenError, SNMP_OPERATION_BUDGET, snmp_health
+from services.snmp_session import filter_snmp_params
+from .refresh_planner import refresh_planner
+
+# 轮询工作进程数量（默认等于 CPU 核数，设为 0 或 1 时在 Web 进程内轮询），以及每个进程内并发轮询的线程数
+POLL_PROCESSES = int(os.environ.get('POLL_PROCESSES', os.cpu_count() or 1))
+POLL_PROCESS_THREADS = 4
+# 一致性哈希环上每个进程的虚拟节点数
+POLL_SHARD_VNODES = 64
+# Web 进程等待一次轮询结果的最长时间（秒），超过后认为工作进程异常
+POLL_RESULT_TIMEOUT = SNMP_OPERATION_BUDGET * 2
+# 检查工作进程存活的间隔（秒）
+POLL_PROCESS_CHECK_INTERVAL = 5.0
+
+# 接口字段按固定顺序打包为元组，避免每个接口都重复传输字段名
+INTERFACE_FIELDS = ('Index', 'Description', 'Speed', 'Status', 'IP Address',
+                    'InOctets', 'OutOctets', 'HCInOctets', 'HCOutOctets')
+
+def pack_snmp_data(snmp_data):
+    """把 fetch_snmpv3_data 的结果转换为紧凑的结构后再经进程间队列传输"""
+    scalars = {key: value for key, value in snmp_data.items() if key != 'Interfaces'}
+    rows = [tuple(interface.get(field) for field in INTERFACE_FIELDS) for interface in snmp_data.get('Interfaces', [])]
+    return scalars, rows
+
+def unpack_snmp_data(packed):
+    scalars, rows = packed
+    return dict(scalars, Interfaces=[dict(zip(INTERFACE_FIELDS, row)) for row in rows])
+
+def _hash(value):
+    return int.from_bytes(hashlib.md5(str(value).encode()).digest()[:8], 'big')
+
+class ShardRing:
+    """一致性哈希环：同一个 ne_id 总是落在同一个分片上，增减分片时只有少量设备迁移"""
+
+    def __init__(self, shards, vnodes=POLL_SHARD_VNODES):
+        points = sorted((_hash(f'{shard}#{vnode}'), shard) for shard in range(shards) for vnode in range(vnodes))
+        self._keys = [point for point, _ in points]
+        self._shards = [shard for _, shard in points]
+
+    def shard_for(self, key):
+        position = bisect.bisect(self._keys, _hash(key)) % len(self._keys)
+        return self._shards[position]
+
+def _poll_in_process(request_id, device, reply):
+    # 在工作进程中执行：会话、USM 密钥缓存和刷新计划都保存在本进程内，同一设备始终由同一进程轮询。
+    # 每个结果附带该设备的熔断器/RTT 状态和刷新计划统计的增量，由 Web 进程合并，/performance/snmp/health 等接口因此包含后台轮询
+    from .performance import fetch_snmpv3_data
+    try:
+        message = (request_id, 'ok', pack_snmp_data(fetch_snmpv3_data(device)))
+    except CircuitOpenError as e:
+        message = (request_id, 'circuit_open', (e.ip, e.retry_in))
+    except Exception as e:
+        message = (request_id, 'error', str(e))
+    reply(message + (_state_report(device),))
+
+def _state_report(device):
+    ip = filter_snmp_params(device).get('ip')
+    return {'health': snmp_health.export(ip), 'refresh': refresh_planner.export(ip)}
+
+def merge_state_report(report):
+    """Web 进程中合并工作进程附带的状态增量"""
+    snmp_health.merge(report['health'])
+    refresh_planner.merge(report['refresh'])
+
+def _worker_main(shard, requests, results, threads):
+    """
+    工作进程入口：多个线程从本分片的请求管道中取设备轮询，结果写入本分片的结果管道。
+    管道的读写锁是进程内的线程锁，进程被杀死时随之消失，重启的进程可以继续使用同一对管道
+    （multiprocessing.Queue 的锁在进程间共享，持有锁的进程被杀死后队列会一直阻塞）。
+    """
+    logging.basicConfig(level=logging.INFO)
+    read_lock, write_lock = threading.Lock(), threading.Lock()
+    stopped = threading.Event()
+
+    def reply(message):
+        with write_lock:
+            results.send(message)
+
+    def run():
+        while not stopped.is_set():
+            with read_lock:
+                item = None if stopped.is_set() else requests.recv()
+            if item is None:
+                stopped.set()  # 让同进程的其他线程也退出
+                return
+            _poll_in_process(*item, reply)
+
+    for index in range(threads):
+        threading.Thread(target=run, name=f'poll-shard-{shard}-{index}', daemon=True).start()
+    stopped.wait()
+
+def _fork_worker(shard, requests, results, threads):
+    """在监督进程中 fork 一个分片工作进程，返回 pid"""
+    pid = os.fork()
+    if pid == 0:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        code = 0
+        try:
+            _worker_main(shard, requests, results, threads)
+        except BaseException:
+            logging.exception(f"Polling process for shard {shard} crashed")
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+def _supervisor_main(parent_pid, requests, results, threads, control):
+    """
+    监督进程入口：在 Web 进程启动任何线程之前创建，本身只有一个线程，由它 fork 所有分片工作进程，
+    工作进程退出时同样由它重新 fork（Web 进程已有多个线程，不能再安全地 fork）。重启和存活数量通过 control 通知 Web 进程。
+    """
+    workers = {}  # pid -> shard
+
+    def kill_workers(*_):
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+        os._exit(0)
+
+    signal.signal(signal.SIGTERM, kill_workers)
+    for shard in range(len(requests)):
+        workers[_fork_worker(shard, requests[shard], results[shard], threads)] = shard
+    control.send(('alive', len(workers)))
+
+    stopping = False
+    while workers:
+        if control.poll(POLL_PROCESS_CHECK_INTERVAL) and control.recv() == 'stop':
+            stopping = True
+        if os.getppid() != parent_pid:
+            kill_workers()
+
+        changed = False
+        while workers:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                break
+            shard = workers.pop(pid, None)
+            if shard is None:
+                continue
+            changed = True
+            if not stopping:
+                workers[_fork_worker(shard, requests[shard], results[shard], threads)] = shard
+                control.send(('restarted', shard, os.waitstatus_to_exitcode(status)))
+        if changed:
+            control.send(('alive', len(workers)))
+
+class ShardedPollPool:
+    """
+    轮询工作进程池。设备按 ne_id 的一致性哈希分配到固定的进程，进程内的 SNMP 会话和缓存因此保持命中；
+    每个分片有一对请求/结果管道，进程把打包后的结果写入结果管道，Web 进程的收集线程解包后交还给等待中的调度线程。
+    poll(device) 与 fetch_snmpv3_data 签名相同，可以直接作为 PollScheduler 的 poll_fn。
+    """
+
+    def __init__(self, processes=POLL_PROCESSES, threads=POLL_PROCESS_THREADS, result_timeout=POLL_RESULT_TIMEOUT):
+        self.processes = processes
+        self.threads = threads
+        self.result_timeout = result_timeout
+        self.ring = ShardRing(processes)
+        # spawn 会在子进程中重新导入 app.py（启动整个 Web 应用），因此使用 fork，并在其他后台线程启动之前创建监督进程；
+        # 工作进程由单线程的监督进程 fork 和重启
+        self._context = multiprocessing.get_context('fork')
+        requests = [self._context.Pipe(duplex=False) for _ in range(processes)]  # (工作进程读取端, Web 进程写入端)
+        results = [self._context.Pipe(duplex=False) for _ in range(processes)]  # (Web 进程读取端, 工作进程写入端)
+        self._requests = [writer for _, writer in requests]
+        self._request_locks = [threading.Lock() for _ in range(processes)]
+        self._results = [reader for reader, _ in results]
+        self._worker_ends = ([reader for reader, _ in requests], [writer for _, writer in results])
+        self._supervisor = None
+        self._control = None
+        self._alive = 0
+        self._pending = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._collector = None
+        self.stats = {'dispatched': 0, 'completed': 0, 'timeouts': 0, 'restarts': 0}
+        self.shard_counts = [0] * processes
+
+    def start(self):
+        if self._collector is not None:
+            return
+        self._stop.clear()
+        self._control, control = self._context.Pipe()
+        self._supervisor = self._context.Process(target=_supervisor_main, name='poll-supervisor', daemon=True,
+                                                 args=(os.getpid(), *self._worker_ends, self.threads, control))
+        self._supervisor.start()
+        self._collector = threading.Thread(target=self._collect, name='poll-results', daemon=True)
+        self._collector.start()
+        logging.info(f"Started {self.processes} SNMP polling processes")
+
+    def stop(self):
+        self._stop.set()
+        if self._supervisor is None:
+            return
+        self._control.send('stop')
+        for shard in range(self.processes):
+            self._send(shard, None)
+        self._supervisor.join(timeout=5)
+        self._collector = None
+
+    def poll(self, device, ne_id=None):
+        shard = self.ring.shard_for(ne_id or device.get('ne_id') or device.get('ne_name') or device.get('ip'))
+        future = Future()
+        with self._lock:
+            request_id = self._next_id
+            self._next_id += 1
+            self._pending[request_id] = future
+            self.stats['dispatched'] += 1
+            self.shard_counts[shard] += 1
+
+        self._send(shard, (request_id, device))
+        try:
+            return future.result(timeout=self.result_timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                self._pending.pop(request_id, None)
+                self.stats['timeouts'] += 1
+            raise TimeoutError(f"Polling process for shard {shard} did not answer within {self.result_timeout}s")
+
+    def _send(self, shard, message):
+        with self._request_locks[shard]:
+            self._requests[shard].send(message)
+
+    def _collect(self):
+        last_check = time.monotonic()
+        while not self._stop.is_set():
+            if time.monotonic() - last_check >= POLL_PROCESS_CHECK_INTERVAL:
+                self._check_workers()
+                last_check = time.monotonic()
+            for results in wait(self._results, timeout=POLL_PROCESS_CHECK_INTERVAL):
+                self._resolve(*results.recv())
+
+    def _resolve(self, request_id, status, payload, report):
+        try:
+            merge_state_report(report)
+        except Exception as e:
+            logging.debug(f"Failed to merge polling state for request {request_id}: {e}")
+        with self._lock:
+            future = self._pending.pop(request_id, None)
+            self.stats['completed'] += 1
+        if future is None:
+            return  # 调度线程已经放弃等待
+        if status == 'ok':
+            future.set_result(unpack_snmp_data(payload))
+        elif status == 'circuit_open':
+            future.set_exception(CircuitOpenError(*payload))
+        else:
+            future.set_exception(RuntimeError(payload))
+
+    def _check_workers(self):
+        """读取监督进程的通知：工作进程的重启和存活数量"""
+        try:
+            while self._control.poll():
+                message = self._control.recv()
+                if message[0] == 'alive':
+                    self._alive = message[1]
+                elif message[0] == 'restarted':
+                    logging.error(f"Polling process for shard {message[1]} exited with code {message[2]}, restarted")
+                    self.stats['restarts'] += 1
+        except (EOFError, OSError):
+            pass
+        if not self._supervisor.is_alive() and self._alive and not self._stop.is_set():
+            logging.error(f"Polling supervisor exited with code {self._supervisor.exitcode}, background polls will time out")
+            self._alive = 0
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, processes=self.processes, pending=len(self._pending),
+                        alive=self._alive,
+                        shard_counts=list(self.shard_counts))
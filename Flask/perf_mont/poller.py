@@ -0,0 +1,274 @@
+import heapq
+import logging
+import queue
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from network_mgmt.global_data import devices, devices_snmp, snmp_history
+from services.snmp_session import filter_snmp_params
+from services.snmp_cache import device_cache_key
+from services.snmp_health import CircuitOpenError
+from services.device_index import device_index
+from fault_mgmt.alarms import alarm_engine
+from .performance import fetch_snmpv3_data, fetch_interface_status, cache
+from .rate_engine import rate_engines
+from .poll_workers import ShardedPollPool, POLL_PROCESSES, POLL_PROCESS_THREADS
+
+# 默认轮询间隔（秒），以及按设备类别（ne_type 或 device_type）设置的间隔
+POLL_DEFAULT_INTERVAL = 300
+POLL_CLASS_INTERVALS = {
+    'huawei': 300,
+    'cisco_ios': 300,
+}
+# 抖动比例：每次调度在间隔的 ±10% 内随机偏移，避免轮询集中在同一时刻
+POLL_JITTER = 0.1
+# 工作线程数量、待处理队列长度，以及每个设备保留的历史记录条数
+POLL_WORKERS = 8
+POLL_QUEUE_SIZE = 256
+POLL_HISTORY_LENGTH = 60
+# 队列已满时，推迟多久（秒）再尝试投递
+POLL_BACKPRESSURE_DELAY = 1.0
+# 多久（秒）同步一次 devices 中新增的设备
+POLL_SYNC_INTERVAL = 5.0
+# Trap 触发的单接口重新轮询的并发线程数
+INTERFACE_REFRESH_WORKERS = 4
+
+def poll_interval(device):
+    """设备自身的 poll_interval 优先，其次是类别间隔，最后是默认间隔"""
+    interval = device.get('poll_interval')
+    if interval:
+        return float(interval)
+    for key in ('ne_type', 'device_type'):
+        if device.get(key) in POLL_CLASS_INTERVALS:
+            return float(POLL_CLASS_INTERVALS[device[key]])
+    return float(POLL_DEFAULT_INTERVAL)
+
+# 历史记录只保存计数器列，不引用 devices_snmp 和缓存中的完整结果
+HISTORY_COUNTER_KEYS = ('InOctets', 'OutOctets', 'HCInOctets', 'HCOutOctets')
+
+def history_counters(snmp_data):
+    """从一次轮询结果中取出 {接口索引: (InOctets, OutOctets, HCInOctets, HCOutOctets)}"""
+    return {
+        interface.get('Index'): tuple(interface.get(key) for key in HISTORY_COUNTER_KEYS)
+        for interface in snmp_data.get('Interfaces', [])
+    }
+
+def is_pollable(device):
+    snmp_params = filter_snmp_params(device)
+    return bool(snmp_params.get('ip') and snmp_params.get('username') and snmp_params.get('priv_protocol'))
+
+class PollScheduler:
+    """
+    后台 SNMP 轮询调度器。
+    调度线程按设备间隔把到期的设备放入有界工作队列，工作线程执行轮询并将结果写入 devices_snmp 和 snmp_history。
+    上一次轮询尚未结束的设备跳过本次调度；队列已满时推迟投递，而不是无限堆积。
+    """
+
+    def __init__(self, workers=POLL_WORKERS, queue_size=POLL_QUEUE_SIZE, history_length=POLL_HISTORY_LENGTH,
+                 poll_fn=fetch_snmpv3_data):
+        self.workers = workers
+        self.history_length = history_length
+        self.poll_fn = poll_fn
+        self.pool = None  # 多进程轮询时的 ShardedPollPool
+        self.work_queue = queue.Queue(maxsize=queue_size)
+        self._schedule = []  # 堆：(due, ne_name)
+        self._scheduled = set()
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+        self._refresh_executor = ThreadPoolExecutor(max_workers=INTERFACE_REFRESH_WORKERS, thread_name_prefix='if-refresh')
+        self._refreshing = set()
+        self.stats = {'polled': 0, 'failed': 0, 'skipped': 0, 'deferred': 0, 'circuit_open': 0,
+                      'interface_refreshes': 0, 'interface_refresh_failed': 0}
+
+    def use_pool(self, pool):
+        """改由工作进程池执行轮询：本进程的工作线程只负责分发请求、等待结果并写回 devices_snmp"""
+        self.pool = pool
+        self.poll_fn = pool.poll
+        self.workers = max(self.workers, pool.processes * pool.threads)
+
+    def start(self):
+        if self._threads:
+            return
+        self._stop.clear()
+        self._threads.append(threading.Thread(target=self._run_scheduler, name='poll-scheduler', daemon=True))
+        for index in range(self.workers):
+            self._threads.append(threading.Thread(target=self._run_worker, name=f'poll-worker-{index}', daemon=True))
+        for thread in self._threads:
+            thread.start()
+        logging.info(f"SNMP poll scheduler started with {self.workers} workers")
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+
+    def _sync_devices(self, now):
+        # 新设备的首次轮询在一个间隔内随机分布
+        for ne_name, device in list(devices.items()):
+            if ne_name not in self._scheduled and is_pollable(device):
+                due = now + random.uniform(0, poll_interval(device))
+                heapq.heappush(self._schedule, (due, ne_name))
+                self._scheduled.add(ne_name)
+
+    def _next_due(self, due, interval, now):
+        next_due = due + interval
+        while next_due <= now:
+            next_due += interval
+        return next_due + random.uniform(-POLL_JITTER, POLL_JITTER) * interval
+
+    def _run_scheduler(self):
+        last_sync = 0.0
+        while not self._stop.is_set():
+            # 每个调度周期对上一周期写入的计数器样本做一次向量化速率计算
+            rate_engines.compute_all()
+
+            now = time.time()
+            if now - last_sync >= POLL_SYNC_INTERVAL:
+                self._sync_devices(now)
+                last_sync = now
+
+            while self._schedule and self._schedule[0][0] <= now:
+                due, ne_name = heapq.heappop(self._schedule)
+                device = devices.get(ne_name)
+                if device is None or not is_pollable(device):
+                    self._scheduled.discard(ne_name)
+                    continue
+
+                interval = poll_interval(device)
+                with self._lock:
+                    overrun = ne_name in self._in_flight
+
+                if overrun:
+                    # 上一次轮询仍在进行，跳过这一拍
+                    self.stats['skipped'] += 1
+                    heapq.heappush(self._schedule, (self._next_due(due, interval, now), ne_name))
+                    continue
+
+                try:
+                    self.work_queue.put_nowait((ne_name, due))
+                except queue.Full:
+                    # 背压：工作线程跟不上，稍后再投递
+                    self.stats['deferred'] += 1
+                    heapq.heappush(self._schedule, (now + POLL_BACKPRESSURE_DELAY, ne_name))
+                    break
+
+                with self._lock:
+                    self._in_flight.add(ne_name)
+                heapq.heappush(self._schedule, (self._next_due(due, interval, now), ne_name))
+
+            wait = POLL_SYNC_INTERVAL
+            if self._schedule:
+                wait = min(wait, max(0.05, self._schedule[0][0] - time.time()))
+            self._stop.wait(wait)
+
+    def _run_worker(self):
+        while not self._stop.is_set():
+            try:
+                ne_name, due = self.work_queue.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            try:
+                self.poll_device(ne_name)
+            finally:
+                with self._lock:
+                    self._in_flight.discard(ne_name)
+                self.work_queue.task_done()
+
+    def poll_device(self, ne_name):
+        device = devices.get(ne_name)
+        if device is None:
+            return None
+        try:
+            snmp_data = self.poll_fn(device)
+        except CircuitOpenError as e:
+            # 设备熔断中，不占用工作线程等待超时
+            self.stats['circuit_open'] += 1
+            logging.debug(f"Skipping background SNMP poll for {ne_name}: {e}")
+            return None
+        except Exception as e:
+            self.stats['failed'] += 1
+            logging.error(f"Background SNMP poll failed for {ne_name}: {e}")
+            alarm_engine.process_poll_failure(ne_name, device, e)
+            return None
+
+        self.record_result(ne_name, device, snmp_data)
+        alarm_engine.process_poll(ne_name, device, snmp_data)
+        self.stats['polled'] += 1
+        return snmp_data
+
+    def record_result(self, ne_name, device, snmp_data):
+        timestamp = time.time()
+        devices_snmp[ne_name] = snmp_data
+        history = snmp_history.get(ne_name)
+        if history is None:
+            history = snmp_history[ne_name] = deque(maxlen=self.history_length)
+        history.append((timestamp, history_counters(snmp_data)))
+        rate_engines.stage(device.get('network_name', ''), ne_name, snmp_data)
+        device_index.update(ne_name, device, snmp_data)
+        # 让页面请求直接拿到最新的轮询结果
+        cache.put(device_cache_key(device), snmp_data)
+
+    def refresh_interface(self, ne_name, if_index):
+        """
+        重新轮询一个接口的状态（linkDown/linkUp Trap 触发），同一接口已在刷新中时合并。
+        用更新了该接口 Status 的副本替换 devices_snmp 和缓存中的结果，不原地修改共享的对象。
+        """
+        key = (ne_name, str(if_index))
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+        self._refresh_executor.submit(self._refresh_interface, key)
+        return True
+
+    def _refresh_interface(self, key):
+        ne_name, if_index = key
+        try:
+            device = devices.get(ne_name)
+            if device is None:
+                return
+            status = fetch_interface_status(device, if_index)
+            if status is None:
+                return  # 接口已不存在，由下一次完整轮询发现结构变化
+            snmp_data = devices_snmp.get(ne_name)
+            if snmp_data is not None:
+                interfaces = [
+                    dict(interface, Status=status) if str(interface.get('Index')) == if_index else interface
+                    for interface in snmp_data.get('Interfaces', [])
+                ]
+                snmp_data = dict(snmp_data, Interfaces=interfaces)
+                devices_snmp[ne_name] = snmp_data
+                cache.put(device_cache_key(device), snmp_data)
+            alarm_engine.record_interface_status(device.get('ip'), if_index, status)
+            self.stats['interface_refreshes'] += 1
+        except Exception as e:
+            self.stats['interface_refresh_failed'] += 1
+            logging.error(f"Failed to refresh interface {if_index} on {ne_name}: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def get_stats(self):
+        with self._lock:
+            in_flight = len(self._in_flight)
+        stats = dict(self.stats, scheduled=len(self._scheduled), in_flight=in_flight,
+                     queue_depth=self.work_queue.qsize(), queue_size=self.work_queue.maxsize)
+        if self.pool is not None:
+            stats['processes'] = self.pool.get_stats()
+        return stats
+
+poll_scheduler = PollScheduler()
+
+# 启动后台轮询；processes 大于 1 时按 ne_id 分片到多个工作进程
+def start_poller(processes=POLL_PROCESSES, threads=POLL_PROCESS_THREADS):
+    if processes > 1 and poll_scheduler.pool is None:
+        pool = ShardedPollPool(processes, threads)
+        pool.start()
+        poll_scheduler.use_pool(pool)
+    poll_scheduler.start()
+    return poll_scheduler
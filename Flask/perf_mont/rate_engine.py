@@ -0,0 +1,278 @@
+import threading
+import numpy as np
+
+# 每个接口保留的速率历史长度、EWMA 平滑系数，以及数组的初始行数
+RATE_HISTORY_LENGTH = 60
+RATE_EWMA_ALPHA = 0.3
+RATE_INITIAL_ROWS = 1024
+
+# 回绕后算出的速率如果超过接口速率的这个倍数，认为是计数器被清零（如设备重启）而不是回绕
+COUNTER_RESET_TOLERANCE = 1.5
+# 不知道接口速率时的合理上限（bit/s），超过时同样认为是计数器被清零
+COUNTER_MAX_PLAUSIBLE_BPS = 1.6e12
+COUNTER32_MASK = np.uint64(0xFFFFFFFF)
+# 不知道接口速率时，32 位计数器回绕后的差值超过计数范围的一半，认为是清零而不是回绕
+# （回绕修正后的速率最大只有约 2^32 * 8 / dt，COUNTER_MAX_PLAUSIBLE_BPS 对 32 位计数器不起作用）
+COUNTER32_RESET_DELTA = np.uint64(0x80000000)
+
+def _parse_counter(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+class NetworkRateEngine:
+    """
+    一个网络内所有接口的计数器与速率，按列存放在 NumPy 数组中，每行对应一个 (ne_name, ifIndex)。
+    轮询结果先通过 stage() 写入本周期的待计算列，compute() 再对所有有新样本的接口做一次向量化计算：
+    计数器差值（32/64 位回绕修正）、bit/s、相对 ifSpeed 的利用率和 EWMA 平滑值，并写入固定长度的环形历史。
+    """
+
+    def __init__(self, network_name, history_length=RATE_HISTORY_LENGTH, alpha=RATE_EWMA_ALPHA,
+                 initial_rows=RATE_INITIAL_ROWS):
+        self.network_name = network_name
+        self.history_length = history_length
+        self.alpha = alpha
+        self.rows = {}  # (ne_name, ifIndex) -> 行号
+        self.size = 0
+        self._lock = threading.Lock()
+        self._allocate(initial_rows)
+
+    def _allocate(self, capacity):
+        history = self.history_length
+        self.capacity = capacity
+        # 最近一次已计算的计数器读数
+        self.last_ts = np.zeros(capacity)
+        self.last_in = np.zeros(capacity, dtype=np.uint64)
+        self.last_out = np.zeros(capacity, dtype=np.uint64)
+        self.has_last = np.zeros(capacity, dtype=bool)
+        self.is_hc = np.zeros(capacity, dtype=bool)
+        self.speed = np.zeros(capacity)
+        # 本周期待计算的样本
+        self.pending = np.zeros(capacity, dtype=bool)
+        self.pending_ts = np.zeros(capacity)
+        self.pending_in = np.zeros(capacity, dtype=np.uint64)
+        self.pending_out = np.zeros(capacity, dtype=np.uint64)
+        self.pending_hc = np.zeros(capacity, dtype=bool)
+        # 计算结果：最新值、EWMA 和环形历史
+        self.in_bps = np.full(capacity, np.nan, dtype=np.float32)
+        self.out_bps = np.full(capacity, np.nan, dtype=np.float32)
+        self.utilization = np.full(capacity, np.nan, dtype=np.float32)
+        self.in_ewma = np.full(capacity, np.nan, dtype=np.float32)
+        self.out_ewma = np.full(capacity, np.nan, dtype=np.float32)
+        self.head = np.zeros(capacity, dtype=np.int32)
+        self.count = np.zeros(capacity, dtype=np.int32)
+        self.hist_ts = np.zeros((capacity, history))
+        self.hist_in = np.full((capacity, history), np.nan, dtype=np.float32)
+        self.hist_out = np.full((capacity, history), np.nan, dtype=np.float32)
+        self.hist_util = np.full((capacity, history), np.nan, dtype=np.float32)
+
+    def _grow(self):
+        # 行数翻倍，保留已有数据
+        old = {name: getattr(self, name) for name in (
+            'last_ts', 'last_in', 'last_out', 'has_last', 'is_hc', 'speed',
+            'pending', 'pending_ts', 'pending_in', 'pending_out', 'pending_hc',
+            'in_bps', 'out_bps', 'utilization', 'in_ewma', 'out_ewma', 'head', 'count',
+            'hist_ts', 'hist_in', 'hist_out', 'hist_util'
+        )}
+        self._allocate(self.capacity * 2)
+        for name, array in old.items():
+            getattr(self, name)[:len(array)] = array
+
+    def _row(self, key):
+        row = self.rows.get(key)
+        if row is None:
+            if self.size == self.capacity:
+                self._grow()
+            row = self.rows[key] = self.size
+            self.size += 1
+        return row
+
+    def stage(self, ne_name, snmp_data):
+        """登记一次 get_snmpv3_data 结果中的接口计数器，优先使用 64 位 ifHC 计数器"""
+        timestamp = snmp_data.get('Timestamp')
+        if timestamp is None:
+            return
+
+        with self._lock:
+            for interface in snmp_data.get('Interfaces', []):
+                in_octets = _parse_counter(interface.get('HCInOctets'))
+                out_octets = _parse_counter(interface.get('HCOutOctets'))
+                hc = True
+                if in_octets is None or out_octets is None:
+                    in_octets = _parse_counter(interface.get('InOctets'))
+                    out_octets = _parse_counter(interface.get('OutOctets'))
+                    hc = False
+                if in_octets is None or out_octets is None:
+                    continue
+
+                row = self._row((ne_name, interface.get('Index')))
+                # 同一个样本（例如缓存中的数据）再次登记时忽略，保留已算出的速率
+                if self.has_last[row] and timestamp <= self.last_ts[row]:
+                    continue
+                self.pending[row] = True
+                self.pending_ts[row] = timestamp
+                self.pending_in[row] = in_octets
+                self.pending_out[row] = out_octets
+                self.pending_hc[row] = hc
+                if interface.get('Speed'):
+                    self.speed[row] = interface['Speed']
+
+    def compute(self):
+        """对本周期所有有新样本的接口做一次向量化计算，返回参与计算的接口数"""
+        with self._lock:
+            rows = np.flatnonzero(self.pending[:self.size])
+            if rows.size == 0:
+                return 0
+
+            ts = self.pending_ts[rows]
+            cur_in = self.pending_in[rows]
+            cur_out = self.pending_out[rows]
+            hc = self.pending_hc[rows]
+
+            # 有上一个样本、时间递增且计数器位宽未变化的行才能计算速率
+            valid = self.has_last[rows] & (hc == self.is_hc[rows]) & (ts > self.last_ts[rows])
+            dt = np.where(valid, ts - self.last_ts[rows], 1.0)
+
+            # uint64 减法按 2^64 自然回绕，32 位计数器再截取低 32 位即可得到回绕修正后的差值
+            delta_in = cur_in - self.last_in[rows]
+            delta_out = cur_out - self.last_out[rows]
+            delta_in = np.where(hc, delta_in, delta_in & COUNTER32_MASK)
+            delta_out = np.where(hc, delta_out, delta_out & COUNTER32_MASK)
+
+            in_bps = delta_in.astype(np.float64) * 8 / dt
+            out_bps = delta_out.astype(np.float64) * 8 / dt
+
+            speed = self.speed[rows]
+            peak = np.maximum(in_bps, out_bps)
+            has_speed = speed > 0
+            # 64 位计数器实际不会回绕，读数变小只能是清零；回绕后的速率超过接口速率或合理上限时也是清零；
+            # 没有接口速率的 32 位计数器，读数变小且回绕后的差值超过计数范围的一半时同样视为清零
+            in_back = cur_in < self.last_in[rows]
+            out_back = cur_out < self.last_out[rows]
+            reset32 = ~hc & ~has_speed & ((in_back & (delta_in > COUNTER32_RESET_DELTA))
+                                          | (out_back & (delta_out > COUNTER32_RESET_DELTA)))
+            reset = (hc & (in_back | out_back)) | reset32 | (has_speed & (peak > speed * COUNTER_RESET_TOLERANCE)) \
+                | (peak > COUNTER_MAX_PLAUSIBLE_BPS)
+            valid &= ~reset
+
+            utilization = np.where(has_speed, peak / np.where(has_speed, speed, 1.0) * 100, np.nan)
+            in_bps = np.where(valid, in_bps, np.nan)
+            out_bps = np.where(valid, out_bps, np.nan)
+            utilization = np.where(valid, utilization, np.nan)
+
+            self.in_bps[rows] = in_bps
+            self.out_bps[rows] = out_bps
+            self.utilization[rows] = utilization
+
+            # EWMA：首个有效速率直接作为初值
+            for ewma, current in ((self.in_ewma, in_bps), (self.out_ewma, out_bps)):
+                previous = ewma[rows]
+                smoothed = np.where(np.isnan(previous), current, self.alpha * current + (1 - self.alpha) * previous)
+                ewma[rows] = np.where(valid, smoothed, previous)
+
+            # 写入环形历史（只记录有效速率）
+            history_rows = rows[valid]
+            slots = self.head[history_rows]
+            self.hist_ts[history_rows, slots] = ts[valid]
+            self.hist_in[history_rows, slots] = in_bps[valid]
+            self.hist_out[history_rows, slots] = out_bps[valid]
+            self.hist_util[history_rows, slots] = utilization[valid]
+            self.head[history_rows] = (slots + 1) % self.history_length
+            self.count[history_rows] = np.minimum(self.count[history_rows] + 1, self.history_length)
+
+            # 当前样本成为下一周期的基准
+            self.last_ts[rows] = ts
+            self.last_in[rows] = cur_in
+            self.last_out[rows] = cur_out
+            self.is_hc[rows] = hc
+            self.has_last[rows] = True
+            self.pending[rows] = False
+            return int(rows.size)
+
+    def _rate_of(self, row):
+        if np.isnan(self.in_bps[row]):
+            return None
+        utilization = self.utilization[row]
+        return {
+            'timestamp': float(self.last_ts[row]),
+            'in_bps': round(float(self.in_bps[row]), 2),
+            'out_bps': round(float(self.out_bps[row]), 2),
+            'in_bps_ewma': round(float(self.in_ewma[row]), 2),
+            'out_bps_ewma': round(float(self.out_ewma[row]), 2),
+            'utilization': None if np.isnan(utilization) else round(float(utilization), 2)
+        }
+
+    def latest_rates(self, ne_name):
+        """返回 {ifIndex: 最新速率}"""
+        with self._lock:
+            return {key[1]: self._rate_of(row) for key, row in self.rows.items() if key[0] == ne_name}
+
+    def network_rates(self):
+        """返回 {ne_name: {ifIndex: 最新速率}}"""
+        with self._lock:
+            result = {}
+            for (ne_name, if_index), row in self.rows.items():
+                result.setdefault(ne_name, {})[if_index] = self._rate_of(row)
+            return result
+
+    def history(self, ne_name, if_index):
+        """按时间顺序返回一个接口的速率历史，接口不存在时返回 None"""
+        with self._lock:
+            row = self.rows.get((ne_name, str(if_index)))
+            if row is None:
+                return None
+            count = int(self.count[row])
+            order = (np.arange(-count, 0) + self.head[row]) % self.history_length
+            return {
+                'counter_width': 64 if self.is_hc[row] else 32,
+                'speed': float(self.speed[row]) or None,
+                'rates': [
+                    {
+                        'timestamp': float(self.hist_ts[row, slot]),
+                        'in_bps': round(float(self.hist_in[row, slot]), 2),
+                        'out_bps': round(float(self.hist_out[row, slot]), 2),
+                        'utilization': None if np.isnan(self.hist_util[row, slot]) else round(float(self.hist_util[row, slot]), 2)
+                    }
+                    for slot in order
+                ]
+            }
+
+class RateEngineRegistry:
+    """按网络名称管理 NetworkRateEngine"""
+
+    def __init__(self):
+        self._engines = {}
+        self._lock = threading.Lock()
+
+    def engine(self, network_name):
+        with self._lock:
+            engine = self._engines.get(network_name)
+            if engine is None:
+                engine = self._engines[network_name] = NetworkRateEngine(network_name)
+            return engine
+
+    def stage(self, network_name, ne_name, snmp_data):
+        self.engine(network_name).stage(ne_name, snmp_data)
+
+    def network_rates(self, network_name):
+        with self._lock:
+            engine = self._engines.get(network_name)
+        return engine.network_rates() if engine else {}
+
+    def compute_all(self):
+        """每个轮询周期调用一次：对每个网络做一次向量化计算"""
+        with self._lock:
+            engines = list(self._engines.values())
+        return sum(engine.compute() for engine in engines)
+
+    def find(self, ne_name):
+        """找到包含该网元接口的网络引擎"""
+        with self._lock:
+            engines = list(self._engines.values())
+        for engine in engines:
+            if any(key[0] == ne_name for key in list(engine.rows)):
+                return engine
+        return None
+
+rate_engines = RateEngineRegistry()
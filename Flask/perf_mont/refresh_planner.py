@@ -0,0 +1,139 @@
+import hashlib
+import threading
+import time
+
+# 接口结构（描述、速率）和 IP 地址表即使没有检测到变化，也最多间隔这么久（秒）重新遍历一次
+STRUCTURE_MAX_AGE = 3600
+ADDRESS_MAX_AGE = 3600
+
+def _ticks(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def address_checksum(addresses):
+    """ipAddrTable 内容的校验和：{ifIndex: ip} 排序后取摘要"""
+    digest = hashlib.sha1()
+    for if_index, ip in sorted(addresses.items()):
+        digest.update(f'{if_index}={ip};'.encode())
+    return digest.hexdigest()
+
+class DeviceRefreshState:
+    """单个设备上一次采集到的表结构，以及判断结构是否变化所需的 sysUpTime / ifTableLastChange / 校验和"""
+
+    def __init__(self):
+        self.sys_uptime = None
+        self.if_table_last_change = None
+        self.interfaces = {}  # ifTable 行索引 -> {'Index', 'Description', 'Speed'}
+        self.has_hc_counters = True
+        self.structure_at = 0.0
+        self.addresses = {}  # ifIndex -> IP 地址
+        self.address_checksum = None
+        self.addresses_at = 0.0
+
+class RefreshPlanner:
+    """
+    决定一次采集需要遍历哪些表。
+    ifTable 的描述和速率列只在设备重启（sysUpTime 变小）、ifTableLastChange 变化、接口行集合变化或超过
+    STRUCTURE_MAX_AGE 时重新遍历，其余时候只遍历状态和计数器列；ipAddrTable 只在接口结构变化或超过
+    ADDRESS_MAX_AGE 时重新遍历，并用校验和记录内容是否变化。
+    状态按 (设备 IP, 凭据指纹) 保存，与 SNMP 缓存键相同；判断和记录都在 self._lock 内完成，
+    后台轮询、页面请求和缓存刷新线程可以同时采集同一设备。
+    """
+
+    def __init__(self, structure_max_age=STRUCTURE_MAX_AGE, address_max_age=ADDRESS_MAX_AGE):
+        self.structure_max_age = structure_max_age
+        self.address_max_age = address_max_age
+        self._states = {}
+        self._remote = set()  # 由轮询工作进程跟踪的设备
+        self._lock = threading.Lock()
+        self.stats = {'full': 0, 'counters_only': 0, 'address_walks': 0, 'address_changes': 0, 'reboots': 0,
+                      'empty_structure': 0}
+        self._exported = dict.fromkeys(self.stats, 0)
+
+    def state(self, key):
+        """key 为 (设备 IP, 凭据指纹)"""
+        with self._lock:
+            state = self._states.get(key)
+            if state is None:
+                state = self._states[key] = DeviceRefreshState()
+            return state
+
+    def needs_structure_walk(self, state, sys_uptime, if_table_last_change, now=None):
+        now = now or time.time()
+        sys_uptime = _ticks(sys_uptime)
+        if_table_last_change = _ticks(if_table_last_change)
+
+        with self._lock:
+            if not state.interfaces or sys_uptime is None:
+                return True
+            if state.sys_uptime is not None and sys_uptime < state.sys_uptime:
+                self.stats['reboots'] += 1
+                return True
+            if if_table_last_change != state.if_table_last_change:
+                # 不支持 ifTableLastChange 的设备两次都是 None，此时依靠接口行集合比对和最长间隔发现变化
+                return True
+            return now - state.structure_at >= self.structure_max_age
+
+    def needs_address_walk(self, state, structure_walked, now=None):
+        now = now or time.time()
+        with self._lock:
+            return structure_walked or state.address_checksum is None or now - state.addresses_at >= self.address_max_age
+
+    def record_structure(self, state, sys_uptime, if_table_last_change, interfaces, has_hc_counters, now=None):
+        """记录新遍历的接口结构；遍历结果为空（例如设备暂时没有响应这张表）时不记录，下一次仍然完整遍历"""
+        with self._lock:
+            if not interfaces:
+                self.stats['empty_structure'] += 1
+                return False
+            state.sys_uptime = _ticks(sys_uptime)
+            state.if_table_last_change = _ticks(if_table_last_change)
+            state.interfaces = interfaces
+            state.has_hc_counters = has_hc_counters
+            state.structure_at = now or time.time()
+            self.stats['full'] += 1
+            return True
+
+    def record_counters(self, state, sys_uptime):
+        with self._lock:
+            state.sys_uptime = _ticks(sys_uptime)
+            self.stats['counters_only'] += 1
+
+    def record_addresses(self, state, addresses, now=None):
+        checksum = address_checksum(addresses)
+        with self._lock:
+            if state.address_checksum is not None and checksum != state.address_checksum:
+                self.stats['address_changes'] += 1
+            state.addresses = addresses
+            state.address_checksum = checksum
+            state.addresses_at = now or time.time()
+            self.stats['address_walks'] += 1
+
+    def forget(self, ip):
+        """移除设备在所有凭据下的状态"""
+        with self._lock:
+            for key in [key for key in self._states if key[0] == ip]:
+                del self._states[key]
+            self._remote.discard(ip)
+
+    def export(self, ip):
+        """轮询工作进程中调用：返回自上次 export 以来的计数增量，交给 Web 进程 merge"""
+        with self._lock:
+            current = dict(self.stats)
+            deltas = {name: current[name] - self._exported[name] for name in current}
+            self._exported = current
+        return {'ip': ip, 'deltas': deltas}
+
+    def merge(self, report):
+        with self._lock:
+            for name, delta in report['deltas'].items():
+                self.stats[name] += delta
+            self._remote.add(report['ip'])
+
+    def get_stats(self):
+        with self._lock:
+            tracked = len({key[0] for key in self._states} | self._remote)
+        return dict(self.stats, devices=tracked)
+
+refresh_planner = RefreshPlanner()
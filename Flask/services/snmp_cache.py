@@ -0,0 +1,166 @@
+import functools
+import hashlib
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from services.snmp_session import filter_snmp_params
+
+# 缓存容量：条目数上限和估算内存上限（字节），可通过环境变量调整
+SNMP_CACHE_MAX_ENTRIES = int(os.environ.get('SNMP_CACHE_MAX_ENTRIES', 10000))
+SNMP_CACHE_MAX_BYTES = int(os.environ.get('SNMP_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+# 条目在 TTL 内直接返回；过期后在 STALE_TTL 内仍立即返回旧数据，同时在后台刷新；超过后同步重新获取
+SNMP_CACHE_TTL = float(os.environ.get('SNMP_CACHE_TTL', 300))
+SNMP_CACHE_STALE_TTL = float(os.environ.get('SNMP_CACHE_STALE_TTL', 3600))
+# 后台刷新线程数
+SNMP_CACHE_REFRESH_WORKERS = int(os.environ.get('SNMP_CACHE_REFRESH_WORKERS', 4))
+
+def credential_fingerprint(snmp_params):
+    """USM 凭据的指纹：凭据变化后缓存键随之变化，不会再返回旧凭据取到的数据"""
+    parts = [str(snmp_params.get(key) or '') for key in
+             ('username', 'auth_protocol', 'auth_password', 'priv_protocol', 'priv_password')]
+    return hashlib.sha256('\0'.join(parts).encode()).hexdigest()[:16]
+
+def device_cache_key(device):
+    """缓存键：设备 IP + 凭据指纹"""
+    snmp_params = filter_snmp_params(device)
+    return snmp_params.get('ip'), credential_fingerprint(snmp_params)
+
+def estimate_size(value):
+    """粗略估算一个 SNMP 结果（dict/list/str 嵌套）占用的内存"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(estimate_size(item) for item in value)
+    return size
+
+class _Entry:
+    __slots__ = ('value', 'stored_at', 'size')
+
+    def __init__(self, value, stored_at, size):
+        self.value = value
+        self.stored_at = stored_at
+        self.size = size
+
+class SnmpResultCache:
+    """
+    SNMP 结果缓存，LRU 顺序淘汰，同时限制条目数和估算内存。
+    过期但仍在 stale_ttl 内的条目立即返回，并提交一次后台刷新（同一个键同时只刷新一次）。
+    """
+
+    def __init__(self, name, max_entries=SNMP_CACHE_MAX_ENTRIES, max_bytes=SNMP_CACHE_MAX_BYTES,
+                 ttl=SNMP_CACHE_TTL, stale_ttl=SNMP_CACHE_STALE_TTL, refresh_workers=SNMP_CACHE_REFRESH_WORKERS):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix=f'{name}-cache-refresh')
+        self.stats = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'refreshes': 0, 'refresh_errors': 0, 'evictions': 0}
+
+    def _store(self, key, value):
+        # 调用方持有 _lock
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old.size
+        entry = _Entry(value, time.time(), estimate_size(value))
+        self._entries[key] = entry
+        self._bytes += entry.size
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+            self.stats['evictions'] += 1
+
+    def put(self, key, value):
+        with self._lock:
+            self._store(key, value)
+
+    def get(self, key):
+        """只读查询（不触发刷新），不存在时返回 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry.value if entry else None
+
+    def get_or_load(self, key, loader, *args, **kwargs):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                age = now - entry.stored_at
+                if age < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.stats['hits'] += 1
+                    return entry.value
+                if age < self.ttl + self.stale_ttl:
+                    self._entries.move_to_end(key)
+                    self.stats['stale_hits'] += 1
+                    if key not in self._refreshing:
+                        self._refreshing.add(key)
+                        self._executor.submit(self._refresh, key, loader, args, kwargs)
+                    return entry.value
+            self.stats['misses'] += 1
+
+        value = loader(*args, **kwargs)
+        self.put(key, value)
+        return value
+
+    def _refresh(self, key, loader, args, kwargs):
+        try:
+            value = loader(*args, **kwargs)
+            with self._lock:
+                self._store(key, value)
+                self.stats['refreshes'] += 1
+        except Exception as e:
+            # 刷新失败时保留旧数据，下一次访问会再次尝试
+            with self._lock:
+                self.stats['refresh_errors'] += 1
+            logging.error(f"Background refresh of {self.name} cache entry {key[0]} failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def invalidate(self, ip):
+        """删除某个 IP 的所有条目（不区分凭据）"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == ip]:
+                self._bytes -= self._entries.pop(key).size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries), bytes=self._bytes, refreshing=len(self._refreshing),
+                        max_entries=self.max_entries, max_bytes=self.max_bytes, ttl=self.ttl, stale_ttl=self.stale_ttl)
+
+    def cached(self, key=device_cache_key):
+        """装饰器，用法与 cachetools.cached 相同"""
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                return self.get_or_load(key(*args, **kwargs), fn, *args, **kwargs)
+
+            wrapper.cache = self
+            return wrapper
+
+        return decorator
+
+# 按名称登记的所有缓存，供统计接口使用
+snmp_caches = {}
+
+def create_cache(name, **kwargs):
+    cache = snmp_caches[name] = SnmpResultCache(name, **kwargs)
+    return cache
+
+def get_cache_stats():
+    return {name: cache.get_stats() for name, cache in snmp_caches.items()}
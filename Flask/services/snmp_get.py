@@ -0,0 +1,90 @@
+import logging
+from pysnmp.entity.rfc3413 import cmdgen
+from pysnmp.hlapi.asyncore.cmdgen import lcd
+from pyasn1.type.univ import Null
+from pysnmp.proto import errind
+from pysnmp.proto.rfc1902 import ObjectName
+from services.snmp_health import send_request
+
+# 单个 GET PDU 中最多携带的 varbind 数量（初始值），遇到 tooBig 时会按会话自动减小
+SCALAR_MAX_VARBINDS = 32
+
+# SNMP PDU errorStatus: tooBig(1), noSuchName(2)
+ERROR_STATUS_TOO_BIG = 1
+ERROR_STATUS_NO_SUCH_NAME = 2
+
+def _get_request(session, target, oids):
+    """发送一次 GET 请求并等待响应，返回 (errorIndication, errorStatus, errorIndex, varBinds)"""
+    cb_ctx = {}
+
+    def cb_fun(snmpEngine, sendRequestHandle, errorIndication, errorStatus, errorIndex, varBinds, cbCtx):
+        cbCtx['result'] = (errorIndication, errorStatus, errorIndex, varBinds)
+
+    # 直接使用 rfc3413 命令生成器：hlapi 的 getCmd 即使 lookupMib=False 也会对请求做 MIB 解析，
+    # 并为每个新的 SnmpEngine 构建一次 MIB 编译器（约 1 秒 CPU）
+    addr_name, _ = lcd.configure(session.engine, session.auth, target, session.context.contextName)
+    cmdgen.GetCommandGenerator().sendVarBinds(
+        session.engine, addr_name, session.context.contextEngineId, session.context.contextName,
+        [(ObjectName(oid), Null('')) for oid in oids], cb_fun, cb_ctx
+    )
+    session.engine.transportDispatcher.runDispatcher()
+
+    return cb_ctx.get('result', (errind.requestTimedOut, 0, 0, []))
+
+def get_scalars(session, oids, timeout=10.0, retries=5):
+    """
+    用尽量少的 GET PDU 读取多个标量 OID。
+    每个 PDU 最多携带 session.max_get_varbinds 个 varbind，代理返回 tooBig 时拆分重发并记住新的上限。
+    返回 (values, errors)：
+      values: {oid: value}，对象不存在（noSuchObject/noSuchInstance/noSuchName）时为 None，不影响其他 OID；
+      errors: {oid: 错误描述}，只包含因超时等请求级错误或 PDU 错误而没有取到的 OID。
+    timeout/retries 是单次尝试超时和重传次数的上限，实际超时按设备 RTT 自适应（见 services.snmp_health）。
+    """
+    values = {}
+    errors = {}
+    pending = list(oids)
+
+    while pending:
+        chunk_size = getattr(session, 'max_get_varbinds', SCALAR_MAX_VARBINDS)
+        chunk = pending[:chunk_size]
+
+        errorIndication, errorStatus, errorIndex, varBinds = send_request(
+            session, lambda target: _get_request(session, target, chunk), timeout, retries
+        )
+
+        if errorIndication:
+            # 请求级错误（超时、认证失败等），设备很可能对剩余的请求也无响应
+            logging.error(f"Error indication: {errorIndication}")
+            for oid in pending:
+                errors[oid] = str(errorIndication)
+            break
+
+        if errorStatus:
+            status = int(errorStatus)
+            if status == ERROR_STATUS_TOO_BIG and len(chunk) > 1:
+                session.max_get_varbinds = max(1, len(chunk) // 2)
+                continue
+
+            failed_position = int(errorIndex) - 1 if errorIndex else -1
+            if 0 <= failed_position < len(chunk):
+                # 只剔除出错的 OID，其余 OID 重新请求
+                failed_oid = chunk[failed_position]
+                if status == ERROR_STATUS_NO_SUCH_NAME:
+                    values[failed_oid] = None
+                else:
+                    errors[failed_oid] = f'{errorStatus.prettyPrint()} at {failed_oid}'
+                pending.remove(failed_oid)
+                continue
+
+            logging.error(f"Error status: {errorStatus.prettyPrint()}")
+            for oid in chunk:
+                errors[oid] = f'{errorStatus.prettyPrint()} at ?'
+            pending = pending[len(chunk):]
+            continue
+
+        for oid, (name, value) in zip(chunk, varBinds):
+            # noSuchObject / noSuchInstance / endOfMibView 都是 Null 的子类
+            values[oid] = None if isinstance(value, Null) else value
+        pending = pending[len(chunk):]
+
+    return values, errors
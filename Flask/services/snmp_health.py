@@ -0,0 +1,238 @@
+import logging
+import threading
+import time
+from pysnmp.proto import errind
+
+# RTO 计算参数（RFC 6298）：初始值、上下限（秒）以及 SRTT/RTTVAR 平滑系数
+RTO_INITIAL = 1.0
+RTO_MIN = 0.2
+RTO_MAX = 8.0
+RTT_ALPHA = 0.125
+RTT_BETA = 0.25
+RTT_K = 4
+# UdpTransportTarget 按超时值复用，超时取整到这个粒度避免生成过多 target
+RTO_GRANULARITY = 0.1
+# 调度器计时精度（秒），pysnmp 默认 0.5 秒，无法实现更短的超时
+SNMP_TIMER_RESOLUTION = 0.1
+
+# 一次操作（一个会话上下文内的所有请求）的总时间预算（秒）
+SNMP_OPERATION_BUDGET = 30.0
+
+# 熔断器：连续多少次请求超时后打开，打开后的首次探测间隔以及最大间隔（秒）
+BREAKER_FAILURE_THRESHOLD = 3
+BREAKER_BASE_BACKOFF = 30.0
+BREAKER_MAX_BACKOFF = 900.0
+
+BREAKER_CLOSED = 'closed'
+BREAKER_OPEN = 'open'
+BREAKER_HALF_OPEN = 'half_open'
+
+class CircuitOpenError(Exception):
+    """设备的熔断器处于打开状态，请求被直接拒绝"""
+
+    def __init__(self, ip, retry_in):
+        super().__init__(f"SNMP circuit open for {ip}, next probe in {retry_in:.0f}s")
+        self.ip = ip
+        self.retry_in = retry_in
+
+class SnmpBudgetExceeded(Exception):
+    """一次操作的时间预算已用完，没有再发出请求；不计为设备超时"""
+
+    def __init__(self, ip):
+        super().__init__(f"SNMP operation for {ip} exceeded its time budget")
+        self.ip = ip
+
+class DeviceHealth:
+    """单个设备的 RTT 估计和熔断器状态"""
+
+    def __init__(self, ip):
+        self.ip = ip
+        self.srtt = None
+        self.rttvar = None
+        self.rto = RTO_INITIAL
+        self.state = BREAKER_CLOSED
+        self.consecutive_failures = 0
+        self.backoff = BREAKER_BASE_BACKOFF
+        self.open_until = 0.0
+        self.probing = False
+        self.stats = {'requests': 0, 'timeouts': 0, 'rejected': 0, 'trips': 0}
+        self._lock = threading.Lock()
+
+    def observe_rtt(self, rtt):
+        with self._lock:
+            if self.srtt is None:
+                self.srtt = rtt
+                self.rttvar = rtt / 2
+            else:
+                self.rttvar = (1 - RTT_BETA) * self.rttvar + RTT_BETA * abs(self.srtt - rtt)
+                self.srtt = (1 - RTT_ALPHA) * self.srtt + RTT_ALPHA * rtt
+            self.rto = min(RTO_MAX, max(RTO_MIN, self.srtt + RTT_K * self.rttvar))
+
+    def before_operation(self):
+        """操作开始前调用：熔断器打开时抛出 CircuitOpenError，到期后只放行一个探测请求"""
+        with self._lock:
+            if self.state == BREAKER_CLOSED:
+                return
+            now = time.monotonic()
+            if self.state == BREAKER_OPEN and now >= self.open_until:
+                self.state = BREAKER_HALF_OPEN
+                self.probing = False
+            if self.state == BREAKER_HALF_OPEN and not self.probing:
+                self.probing = True
+                return
+            self.stats['rejected'] += 1
+            raise CircuitOpenError(self.ip, max(0.0, self.open_until - now))
+
+    def end_operation(self):
+        """操作结束时调用：探测操作没有发出任何请求（例如参数错误）时，让下一个操作继续探测"""
+        with self._lock:
+            if self.state == BREAKER_HALF_OPEN:
+                self.probing = False
+
+    def record_success(self):
+        with self._lock:
+            self.stats['requests'] += 1
+            self.consecutive_failures = 0
+            if self.state != BREAKER_CLOSED:
+                logging.info(f"SNMP circuit for {self.ip} closed")
+            self.state = BREAKER_CLOSED
+            self.backoff = BREAKER_BASE_BACKOFF
+            self.probing = False
+
+    def record_timeout(self):
+        with self._lock:
+            self.stats['requests'] += 1
+            self.stats['timeouts'] += 1
+            self.consecutive_failures += 1
+            if self.state == BREAKER_HALF_OPEN:
+                # 探测失败，加倍退避后重新打开
+                self.backoff = min(BREAKER_MAX_BACKOFF, self.backoff * 2)
+                self._trip()
+            elif self.state == BREAKER_CLOSED and self.consecutive_failures >= BREAKER_FAILURE_THRESHOLD:
+                self._trip()
+
+    def _trip(self):
+        self.state = BREAKER_OPEN
+        self.open_until = time.monotonic() + self.backoff
+        self.probing = False
+        self.stats['trips'] += 1
+        logging.warning(f"SNMP circuit for {self.ip} opened for {self.backoff:.0f}s "
+                        f"after {self.consecutive_failures} consecutive timeouts")
+
+    def merge(self, report):
+        """
+        合并轮询工作进程中同一设备的状态（SnmpHealthRegistry.export 的结果）：计数累加，
+        RTT 估计和熔断器状态采用工作进程的最新值
+        """
+        with self._lock:
+            for name, delta in report['deltas'].items():
+                self.stats[name] += delta
+            if report['srtt'] is not None:
+                self.srtt, self.rttvar, self.rto = report['srtt'], report['rttvar'], report['rto']
+            self.state = report['state']
+            self.consecutive_failures = report['consecutive_failures']
+            self.backoff = report['backoff']
+            self.open_until = time.monotonic() + report['retry_in']
+            self.probing = False
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, ip=self.ip, state=self.state, srtt=self.srtt, rto=self.rto,
+                        consecutive_failures=self.consecutive_failures,
+                        retry_in=max(0.0, self.open_until - time.monotonic()) if self.state == BREAKER_OPEN else 0.0)
+
+class SnmpHealthRegistry:
+    """按设备 IP 保存 DeviceHealth，会话被淘汰或重建后学到的 RTT 和熔断状态仍然保留"""
+
+    def __init__(self):
+        self._devices = {}
+        self._exported = {}  # ip -> 上次 export 时的计数
+        self._lock = threading.Lock()
+
+    def get(self, ip):
+        with self._lock:
+            health = self._devices.get(ip)
+            if health is None:
+                health = self._devices[ip] = DeviceHealth(ip)
+            return health
+
+    def reset(self, ip):
+        with self._lock:
+            self._devices.pop(ip, None)
+            self._exported.pop(ip, None)
+
+    def export(self, ip):
+        """轮询工作进程中调用：返回设备自上次 export 以来的计数增量以及当前的 RTT 和熔断器状态，交给 Web 进程 merge"""
+        health = self.get(ip)
+        snapshot = health.snapshot()
+        with self._lock:
+            previous = self._exported.get(ip, {})
+            self._exported[ip] = {name: snapshot[name] for name in health.stats}
+        return dict(ip=ip, deltas={name: snapshot[name] - previous.get(name, 0) for name in health.stats},
+                    srtt=snapshot['srtt'], rttvar=health.rttvar, rto=snapshot['rto'], state=snapshot['state'],
+                    consecutive_failures=snapshot['consecutive_failures'], backoff=health.backoff,
+                    retry_in=snapshot['retry_in'])
+
+    def merge(self, report):
+        self.get(report['ip']).merge(report)
+
+    def stats(self):
+        with self._lock:
+            devices = list(self._devices.values())
+        snapshots = [health.snapshot() for health in devices]
+        return {
+            'devices': len(snapshots),
+            'open': [s for s in snapshots if s['state'] != BREAKER_CLOSED],
+            'slowest': sorted((s for s in snapshots if s['srtt'] is not None), key=lambda s: s['srtt'], reverse=True)[:20]
+        }
+
+snmp_health = SnmpHealthRegistry()
+
+def _is_timeout(error_indication):
+    return isinstance(error_indication, errind.RequestTimedOut)
+
+def send_request(session, send, timeout, retries):
+    """
+    以自适应超时发送一个 SNMP 请求。send(target) 发出请求并返回 (errorIndication, errorStatus, errorIndex, varBinds)。
+    每次尝试的超时取设备当前的 RTO（指数退避，不超过 timeout），最多重传 retries 次，
+    且所有尝试都不超过会话上当前操作的剩余预算。只有首次发送即成功的请求才用于更新 RTT（Karn 算法）。
+    预算用完时抛出 SnmpBudgetExceeded；只有按完整超时等待后仍未收到响应的请求才计入熔断器的超时次数，
+    被预算截短的尝试不计入，较慢但正常的设备不会因为一次较长的遍历而熔断。
+    """
+    health = session.health
+    deadline = getattr(session, 'deadline', None)
+    result = (errind.requestTimedOut, 0, 0, [])
+    timed_out = False
+
+    for attempt in range(retries + 1):
+        attempt_timeout = min(timeout, health.rto * (2 ** attempt))
+        truncated = False
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining < RTO_MIN:
+                if timed_out:
+                    health.record_timeout()
+                raise SnmpBudgetExceeded(health.ip)
+            truncated = remaining < attempt_timeout
+            attempt_timeout = min(attempt_timeout, remaining)
+        attempt_timeout = max(RTO_MIN, round(round(attempt_timeout / RTO_GRANULARITY) * RTO_GRANULARITY, 3))
+
+        started = time.monotonic()
+        result = send(session.target(timeout=attempt_timeout, retries=0))
+        _tune_dispatcher(session)
+
+        if not _is_timeout(result[0]):
+            if attempt == 0:
+                health.observe_rtt(time.monotonic() - started)
+            health.record_success()
+            return result
+        timed_out = timed_out or not truncated
+
+    if timed_out:
+        health.record_timeout()
+    return result
+
+def _tune_dispatcher(session):
+    dispatcher = getattr(session.engine, 'transportDispatcher', None)
+    if dispatcher is not None and dispatcher.getTimerResolution() != SNMP_TIMER_RESOLUTION:
+        dispatcher.setTimerResolution(SNMP_TIMER_RESOLUTION)
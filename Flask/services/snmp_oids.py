@@ -0,0 +1,48 @@
+# 常用 MIB 对象的 OID
+
+# SNMPv2-MIB system 组
+SYS_DESCR = '1.3.6.1.2.1.1.1.0'
+SYS_UPTIME = '1.3.6.1.2.1.1.3.0'
+SYS_NAME = '1.3.6.1.2.1.1.5.0'
+
+# HOST-RESOURCES-MIB
+HR_PROCESSOR_LOAD = '1.3.6.1.2.1.25.3.3.1.2.1'
+HR_STORAGE_USED = '1.3.6.1.2.1.25.2.3.1.6.1'
+
+# IF-MIB ifTable 列
+IF_INDEX = '1.3.6.1.2.1.2.2.1.1'
+IF_DESCR = '1.3.6.1.2.1.2.2.1.2'
+IF_OPER_STATUS = '1.3.6.1.2.1.2.2.1.8'
+IF_IN_OCTETS = '1.3.6.1.2.1.2.2.1.10'
+IF_OUT_OCTETS = '1.3.6.1.2.1.2.2.1.16'
+
+# IP-MIB ipAddrTable 列
+IP_AD_ENT_ADDR = '1.3.6.1.2.1.4.20.1.1'
+IP_AD_ENT_IF_INDEX = '1.3.6.1.2.1.4.20.1.2'
+
+# CISCO-CDP-MIB cdpCacheTable 列
+CDP_CACHE_ADDRESS = '1.3.6.1.4.1.9.9.23.1.2.1.1.4'
+CDP_CACHE_DEVICE_ID = '1.3.6.1.4.1.9.9.23.1.2.1.1.6'
+
+# LLDP-MIB 远端系统名称，以及远端管理地址表的 lldpRemManAddrIfId 列（管理地址本身编码在行索引末尾）
+LLDP_REM_SYS_NAME = '1.0.8802.1.1.2.1.4.1.1.9'
+LLDP_REM_MAN_ADDR_IF_ID = '1.0.8802.1.1.2.1.4.2.1.4'
+
+# IF-MIB ifSpeed 以及 ifXTable 中的 64 位计数器和高速接口速率
+IF_SPEED = '1.3.6.1.2.1.2.2.1.5'
+IF_HC_IN_OCTETS = '1.3.6.1.2.1.31.1.1.1.6'
+IF_HC_OUT_OCTETS = '1.3.6.1.2.1.31.1.1.1.10'
+IF_HIGH_SPEED = '1.3.6.1.2.1.31.1.1.1.15'
+
+# IF-MIB ifTableLastChange：最近一次 ifTable 增删行时的 sysUpTime
+IF_TABLE_LAST_CHANGE = '1.3.6.1.2.1.31.1.5.0'
+
+# SNMPv2-MIB snmpTrapOID：通知中标识 Trap 类型的变量
+SNMP_TRAP_OID = '1.3.6.1.6.3.1.1.4.1.0'
+
+# SNMPv2-MIB 标准通知（snmpTrapOID.0 的取值）
+TRAP_COLD_START = '1.3.6.1.6.3.1.1.5.1'
+TRAP_WARM_START = '1.3.6.1.6.3.1.1.5.2'
+TRAP_LINK_DOWN = '1.3.6.1.6.3.1.1.5.3'
+TRAP_LINK_UP = '1.3.6.1.6.3.1.1.5.4'
+TRAP_AUTH_FAILURE = '1.3.6.1.6.3.1.1.5.5'
@@ -1,55 +1,244 @@
 import threading
 import logging
-from pysnmp.hlapi.asyncore import *
-from pysnmp.carrier.asyncore.dispatch import AsyncoreDispatcher
+import multiprocessing
+import os
+import queue
+import socket
+import time
+from pysnmp.entity import engine, config
 from pysnmp.carrier.asyncore.dgram import udp
 from pysnmp.entity.rfc3413 import ntfrcv
+from services.trap_store import trap_store, make_trap_record
+from services.trap_fanout import trap_fanout
+from services.snmp_oids import IF_INDEX, TRAP_LINK_DOWN, TRAP_LINK_UP
+from services.device_index import device_index
+from services.oid_names import oid_names
+from fault_mgmt.alarms import alarm_engine
+from perf_mont.poller import poll_scheduler
 
-snmp_traps = []
+# Trap 监听地址和端口（测试时可以改用非特权端口，例如 TRAP_PORT=10162）
+TRAP_LISTEN_ADDRESS = os.environ.get('TRAP_LISTEN_ADDRESS', '0.0.0.0')
+TRAP_PORT = int(os.environ.get('TRAP_PORT', 162))
+# SNMPv1/v2c Trap 的团体名
+TRAP_COMMUNITY = os.environ.get('TRAP_COMMUNITY', 'public')
+# 接收进程数量：每个进程一个绑定同一端口的 SO_REUSEPORT 套接字，由内核分发报文；设为 0 时在 Web 进程内用线程接收
+TRAP_INGEST_PROCESSES = int(os.environ.get('TRAP_INGEST_PROCESSES', 2))
+# 接收进程交给 Web 进程的已解码 Trap 队列上限，队列满时丢弃并计数
+TRAP_INGEST_QUEUE_SIZE = 10000
+# 每个接收套接字的内核接收缓冲区（字节），突发时减少内核丢包
+TRAP_SOCKET_BUFFER = 4 * 1024 * 1024
 
-def snmp_trap_receiver(socketio):
-    def callback_fun(snmpEngine, stateReference, contextEngineId, contextName, varBinds, cbCtx):
-        trap_data = {str(name): str(val) for name, val in varBinds}
-        
-        # 打印收到的 Trap 数据
-        logging.info(f'SNMP Trap received: {trap_data}')
-        print(f"SNMP Trap received: {trap_data}")
-        
-        snmp_traps.append(trap_data)
-        socketio.emit('new_snmp_trap', trap_data)  # 将 SNMP Trap 发送到前端
-
-    snmpEngine = SnmpEngine()
-
-    # 监听 UDP 端口 162，用于接收 SNMP Trap
-    transportDispatcher = AsyncoreDispatcher()
+# 每个接收进程在共享数组中的统计槽位
+INGEST_FIELDS = ('received', 'queued', 'dropped', 'latency_total', 'latency_max')
+
+def trap_source(snmpEngine):
+    """在通知回调中取得发送方的 IP 地址"""
     try:
-        # 打印消息确认端口绑定情况
-        logging.info("Starting SNMP Trap receiver on port 162...")
-        print("Starting SNMP Trap receiver on port 162...")
-        
-        transportDispatcher.registerTransport(
-            udp.domainName, udp.UdpTransport().openServerMode(('0.0.0.0', 162))
-        )
+        exec_context = snmpEngine.observer.getExecutionContext('rfc3412.receiveMessage:request')
+    except KeyError:
+        return None
+    address = exec_context.get('transportAddress')
+    return address[0] if address else None
 
-        ntfrcv.NotificationReceiver(snmpEngine, callback_fun)
+class TimestampedUdpTransport(udp.UdpTransport):
+    """设置 SO_REUSEPORT 和接收缓冲区，并记录当前报文的到达时间，用于计算解码延迟"""
+
+    bufferSize = TRAP_SOCKET_BUFFER
 
-        transportDispatcher.jobStarted(1)  # 开始接收Trap
+    def __init__(self, reuse_port=False):
+        super().__init__()
+        self.received_at = 0.0
+        if reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
 
-        # 打印运行状态
-        logging.info("SNMP Trap receiver is running...")
-        print("SNMP Trap receiver is running...")
+    def registerCbFun(self, cbFun):
+        def timestamped(transport, address, message):
+            self.received_at = time.perf_counter()
+            cbFun(transport, address, message)
 
-        transportDispatcher.runDispatcher()
+        super().registerCbFun(timestamped)
+
+def run_trap_receiver(address, out_queue, stats, slot, reuse_port=False):
+    """
+    运行一个 Trap 接收器：解码后的 Trap 记录以 ('trap', record) 放入 out_queue，启动失败时放入 ('error', message)。
+    stats 是共享的 double 数组，本接收器只写自己的槽位。
+    """
+    base = slot * len(INGEST_FIELDS)
+    snmpEngine = engine.SnmpEngine()
+    transport = TimestampedUdpTransport(reuse_port)
+
+    def callback_fun(snmpEngine, stateReference, contextEngineId, contextName, varBinds, cbCtx):
+        trap = make_trap_record(trap_source(snmpEngine), varBinds)
+        latency = time.perf_counter() - transport.received_at
+        stats[base] += 1
+        stats[base + 3] += latency
+        stats[base + 4] = max(stats[base + 4], latency)
+        try:
+            out_queue.put_nowait(('trap', trap))
+            stats[base + 1] += 1
+        except queue.Full:
+            stats[base + 2] += 1
 
+    try:
+        config.addTransport(snmpEngine, udp.domainName, transport.openServerMode(address))
+        config.addV1System(snmpEngine, 'trap-area', TRAP_COMMUNITY)
+        ntfrcv.NotificationReceiver(snmpEngine, callback_fun)
+        snmpEngine.transportDispatcher.jobStarted(1)  # 开始接收Trap
+        logging.info(f"SNMP Trap receiver {slot} listening on {address[0]}:{address[1]}")
+        snmpEngine.transportDispatcher.runDispatcher()
     except Exception as e:
-        transportDispatcher.closeDispatcher()
-        logging.error(f"Error in SNMP Trap receiver: {e}")
-        print(f"Error in SNMP Trap receiver: {e}")
-        socketio.emit('snmp_error', {'error': str(e)})  # 将错误发送到前端
-
-# 启动接收器线程
-def start_snmp_receiver(socketio):
-    logging.info("Starting SNMP Trap receiver thread...")
-    print("Starting SNMP Trap receiver thread...")
-    
-    threading.Thread(target=snmp_trap_receiver, args=(socketio,)).start()
\ No newline at end of file
+        snmpEngine.transportDispatcher.closeDispatcher()
+        logging.error(f"Error in SNMP Trap receiver {slot}: {e}")
+        out_queue.put(('error', str(e)))
+
+def _ingest_process(address, out_queue, stats, slot):
+    logging.basicConfig(level=logging.INFO)
+    run_trap_receiver(address, out_queue, stats, slot, reuse_port=True)
+
+def kernel_udp_drops(port):
+    """从 /proc/net/udp(6) 读取绑定在 port 上的套接字的内核丢包计数，不支持时返回 None"""
+    drops = None
+    for path in ('/proc/net/udp', '/proc/net/udp6'):
+        try:
+            with open(path) as f:
+                next(f)
+                for line in f:
+                    fields = line.split()
+                    if int(fields[1].rsplit(':', 1)[1], 16) == port:
+                        drops = (drops or 0) + int(fields[-1])
+        except (OSError, ValueError, IndexError, StopIteration):
+            continue
+    return drops
+
+class TrapIngest:
+    """
+    Trap 接收层。processes > 0 时启动多个接收进程，各自在同一端口上打开 SO_REUSEPORT 套接字并解码报文，
+    通过有界队列把 Trap 记录交给 Web 进程；Web 进程的消费线程再写入 trap_store、告警引擎和前端推送。
+    """
+
+    def __init__(self, address=(TRAP_LISTEN_ADDRESS, TRAP_PORT), processes=TRAP_INGEST_PROCESSES,
+                 queue_size=TRAP_INGEST_QUEUE_SIZE):
+        self.address = address
+        self.processes = processes if hasattr(socket, 'SO_REUSEPORT') else 0
+        self.socketio = None
+        # 与轮询进程相同，使用 fork 避免在子进程中重新导入 app.py
+        self._context = multiprocessing.get_context('fork')
+        slots = max(1, self.processes)
+        self._stats = self._context.Array('d', slots * len(INGEST_FIELDS), lock=False)
+        self._queue = self._context.Queue(maxsize=queue_size) if self.processes else queue.Queue(maxsize=queue_size)
+        self._workers = []
+        self._consumer = None
+        self.consumed = 0
+        self.errors = []
+
+    def fork(self):
+        """创建接收进程；必须在 Web 进程启动任何后台线程之前调用"""
+        if self._workers or not self.processes:
+            return
+        for slot in range(self.processes):
+            process = self._context.Process(target=_ingest_process, name=f'trap-ingest-{slot}',
+                                            args=(self.address, self._queue, self._stats, slot), daemon=True)
+            process.start()
+            self._workers.append(process)
+
+    def start(self, socketio):
+        if self._consumer is not None:
+            return
+        self.socketio = socketio
+        if self.processes:
+            self.fork()
+        else:
+            threading.Thread(target=run_trap_receiver, name='trap-ingest',
+                             args=(self.address, self._queue, self._stats, 0), daemon=True).start()
+        self._consumer = threading.Thread(target=self._consume, name='trap-consumer', daemon=True)
+        self._consumer.start()
+        logging.info(f"Starting SNMP Trap receiver on port {self.address[1]} with "
+                     f"{self.processes or 'in-process'} receivers")
+
+    def stop(self):
+        for process in self._workers:
+            process.terminate()
+            process.join(timeout=5)
+        self._workers = []
+
+    def _consume(self):
+        while True:
+            kind, payload = self._queue.get()
+            if kind == 'error':
+                self.errors.append(payload)
+                self.socketio.emit('snmp_error', {'error': payload})  # 将错误发送到前端
+                continue
+            try:
+                handle_trap(payload)
+                self.consumed += 1
+            except Exception as e:
+                logging.error(f"Error handling SNMP Trap from {payload.get('source')}: {e}")
+
+    def get_stats(self):
+        fields = len(INGEST_FIELDS)
+        receivers = []
+        for slot in range(max(1, self.processes)):
+            values = dict(zip(INGEST_FIELDS, self._stats[slot * fields:(slot + 1) * fields]))
+            receivers.append({
+                'received': int(values['received']), 'queued': int(values['queued']), 'dropped': int(values['dropped']),
+                'decode_latency_avg_ms': values['latency_total'] / values['received'] * 1000 if values['received'] else None,
+                'decode_latency_max_ms': values['latency_max'] * 1000,
+            })
+        return {
+            'port': self.address[1],
+            'processes': self.processes,
+            'alive': sum(1 for process in self._workers if process.is_alive()),
+            'received': sum(receiver['received'] for receiver in receivers),
+            'dropped': sum(receiver['dropped'] for receiver in receivers),
+            'consumed': self.consumed,
+            'kernel_drops': kernel_udp_drops(self.address[1]),
+            'errors': self.errors[-10:],
+            'receivers': receivers,
+        }
+
+def _trap_if_index(trap, location):
+    prefix = IF_INDEX + '.'
+    if_index = next((value for name, value in trap['varbinds'] if name.startswith(prefix)), None)
+    return if_index or location[2]
+
+def handle_trap(trap):
+    """
+    Web 进程中处理一条解码后的 Trap：按来源地址定位网元，写入环形缓冲区和持久化队列、送入告警引擎、推送到前端；
+    linkDown/linkUp 只重新轮询对应的一个接口。
+    """
+    # 推送给前端的数据使用符号名，枚举值和 OID 值换成标签，例如 {'ifOperStatus.5': 'down'}
+    trap_data = {oid_names.name(name): oid_names.value_label(name, value) or value
+                 for name, value in trap['varbinds']}
+    location = device_index.lookup(trap['source'])
+    ne_name = location[1] if location else None
+
+    logging.debug(f"SNMP Trap received from {trap['source']} ({ne_name}): {trap_data}")
+
+    trap['ne_name'] = ne_name
+    trap_store.record(trap)
+    alarm_engine.process_trap(trap, ne_name, location[2] if location else None)
+    trap_fanout.publish(dict(trap_data, source=trap['source'], ne_name=ne_name,
+                                     trap_name=oid_names.name(trap['trap_oid']) if trap['trap_oid'] else None))  # 合并后批量推送到前端
+
+    if location and trap['trap_oid'] in (TRAP_LINK_DOWN, TRAP_LINK_UP):
+        if_index = _trap_if_index(trap, location)
+        if if_index:
+            poll_scheduler.refresh_interface(ne_name, if_index)
+
+trap_ingest = TrapIngest()
+
+def is_reloader_parent(debug):
+    """debug 模式下 Werkzeug 重载器的父进程只负责监视文件并重启子进程，WERKZEUG_RUN_MAIN 只在子进程中设置"""
+    return debug and os.environ.get('WERKZEUG_RUN_MAIN') != 'true'
+
+# 创建接收进程（在任何后台线程之前），start_snmp_receiver 再启动消费线程
+def fork_snmp_receiver(debug=False):
+    if is_reloader_parent(debug):
+        return
+    trap_ingest.fork()
+
+# 启动接收器；重载器父进程中不接收 Trap，避免与子进程争用端口和多出一组接收进程
+def start_snmp_receiver(socketio, debug=False):
+    if is_reloader_parent(debug):
+        return
+    trap_ingest.start(socketio)
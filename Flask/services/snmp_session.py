@@ -0,0 +1,201 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pysnmp.hlapi import *
+from services.usm_keys import install_usm_key_cache
+from services.snmp_health import snmp_health, SNMP_OPERATION_BUDGET
+
+SNMP_PORT = 161
+
+# 所有会话共享同一份 USM 本地化密钥缓存
+install_usm_key_cache()
+
+# 会话池默认参数：最多缓存的会话数量，以及空闲多久（秒）后回收
+SESSION_MAX_ENTRIES = 1024
+SESSION_IDLE_TIMEOUT = 600
+
+# 过滤出SNMP相关的参数（兼容 snmp_ 前缀的设备字段）
+def filter_snmp_params(device_info):
+    allowed_keys = ['ip', 'username', 'auth_protocol', 'auth_password', 'priv_protocol', 'priv_password']
+    snmp_params = {}
+
+    for key in allowed_keys:
+        if key in device_info:
+            snmp_params[key] = device_info[key]
+        snmp_key = f'snmp_{key}'
+        if snmp_key in device_info:
+            snmp_params[key] = device_info[snmp_key]
+
+    return snmp_params
+
+# 将前端传入的认证/加密协议名称转换为 pysnmp 协议对象
+def resolve_usm_protocols(snmp_params):
+    auth_protocol = usmHMACSHAAuthProtocol if snmp_params.get('auth_protocol') == 'SHA' else usmHMACMD5AuthProtocol
+    priv_protocol_input = snmp_params.get('priv_protocol')
+
+    if priv_protocol_input == 'AES128':
+        priv_protocol = usmAesCfb128Protocol
+    elif priv_protocol_input == 'DES56' or priv_protocol_input == 'DES':
+        priv_protocol = usmDESPrivProtocol
+    else:
+        raise ValueError(f"Unsupported privacy protocol: {priv_protocol_input}")
+
+    return auth_protocol, priv_protocol
+
+def session_key(snmp_params):
+    return (
+        snmp_params.get('ip'),
+        snmp_params.get('username'),
+        snmp_params.get('auth_protocol'),
+        snmp_params.get('priv_protocol')
+    )
+
+class SnmpSession:
+    """
+    一个设备 + 一组 USM 凭据对应的可复用 SNMP 会话。
+    SnmpEngine 会缓存对端的 engineID 和时间同步信息，复用它可以省去每次请求前的发现过程。
+    SnmpEngine 不是线程安全的，使用时必须持有 lock（由 SnmpSessionManager.session 负责）。
+    users 是已取出（正在使用或等待 lock）的次数，由 SnmpSessionManager 在其锁内维护；
+    从池中移除的会话标记为 retired，最后一个使用者归还时关闭。
+    """
+
+    def __init__(self, key, snmp_params):
+        auth_protocol, priv_protocol = resolve_usm_protocols(snmp_params)
+
+        self.key = key
+        self.ip = snmp_params['ip']
+        self.secrets = (snmp_params.get('auth_password'), snmp_params.get('priv_password'))
+        self.engine = SnmpEngine()
+        self.auth = UsmUserData(snmp_params['username'], snmp_params['auth_password'], snmp_params['priv_password'],
+                                authProtocol=auth_protocol, privProtocol=priv_protocol)
+        self.context = ContextData()
+        self.health = snmp_health.get(self.ip)
+        self.deadline = None  # 当前操作的截止时间（time.monotonic），由 SnmpSessionManager.session 设置
+        self.lock = threading.RLock()
+        self.last_used = time.monotonic()
+        self.users = 0
+        self.retired = False
+        self._targets = {}
+
+    def target(self, timeout=1.0, retries=5):
+        """按 (timeout, retries) 复用 UdpTransportTarget"""
+        target = self._targets.get((timeout, retries))
+        if target is None:
+            target = UdpTransportTarget((self.ip, SNMP_PORT), timeout=timeout, retries=retries)
+            self._targets[(timeout, retries)] = target
+        return target
+
+    def close(self):
+        dispatcher = getattr(self.engine, 'transportDispatcher', None)
+        if dispatcher is not None:
+            try:
+                dispatcher.closeDispatcher()
+            except Exception as e:
+                logging.debug(f"Failed to close SNMP dispatcher for {self.ip}: {e}")
+
+class SnmpSessionManager:
+    """进程级的 SNMP 会话池，按 (ip, user, auth/priv 协议) 复用会话，支持 LRU 淘汰和空闲过期"""
+
+    def __init__(self, max_sessions=SESSION_MAX_ENTRIES, idle_timeout=SESSION_IDLE_TIMEOUT):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def session(self, snmp_params, budget=SNMP_OPERATION_BUDGET):
+        """
+        取出（或新建）与 snmp_params 对应的会话，并在使用期间独占它。
+        设备熔断器打开时直接抛出 CircuitOpenError；上下文内所有请求的总耗时不超过 budget 秒。
+        """
+        health = snmp_health.get(snmp_params.get('ip'))
+        health.before_operation()
+        try:
+            session = self._checkout(snmp_params)
+            try:
+                with session.lock:
+                    session.deadline = time.monotonic() + budget
+                    try:
+                        yield session
+                    finally:
+                        session.deadline = None
+                        session.last_used = time.monotonic()
+            finally:
+                self._checkin(session)
+        finally:
+            health.end_operation()
+
+    def _checkout(self, snmp_params):
+        key = session_key(snmp_params)
+        secrets = (snmp_params.get('auth_password'), snmp_params.get('priv_password'))
+        retired = []
+
+        with self._lock:
+            retired.extend(self._expire_idle())
+
+            session = self._sessions.get(key)
+            if session is not None and session.secrets != secrets:
+                # 凭据已变更，旧会话不能再用
+                retired.append(self._sessions.pop(key))
+                session = None
+
+            if session is None:
+                session = SnmpSession(key, snmp_params)
+                self._sessions[key] = session
+                while len(self._sessions) > self.max_sessions:
+                    _, evicted = self._sessions.popitem(last=False)
+                    retired.append(evicted)
+            else:
+                self._sessions.move_to_end(key)
+            session.last_used = time.monotonic()
+            # 在池的锁内登记使用者，其他线程此后淘汰这个会话时不会关闭它
+            session.users += 1
+            closing = self._retire(retired)
+
+        for old in closing:
+            old.close()
+        return session
+
+    def _checkin(self, session):
+        with self._lock:
+            session.users -= 1
+            closing = session.retired and session.users == 0
+        if closing:
+            session.close()
+
+    def _expire_idle(self):
+        expired = []
+        now = time.monotonic()
+        for key, session in list(self._sessions.items()):
+            if not session.users and now - session.last_used > self.idle_timeout:
+                expired.append(self._sessions.pop(key))
+        return expired
+
+    def _retire(self, sessions):
+        """把已从池中移除的会话标记为 retired，返回现在就可以关闭的（没有使用者的）会话；调用时持有 self._lock"""
+        for session in sessions:
+            session.retired = True
+        return [session for session in sessions if session.users == 0]
+
+    def invalidate(self, ip):
+        """移除某个设备的所有会话，例如设备被删除或重启后"""
+        with self._lock:
+            closing = self._retire([self._sessions.pop(key) for key in list(self._sessions) if key[0] == ip])
+        for session in closing:
+            session.close()
+
+    def clear(self):
+        with self._lock:
+            closing = self._retire(list(self._sessions.values()))
+            self._sessions.clear()
+        for session in closing:
+            session.close()
+
+    def stats(self):
+        with self._lock:
+            return {'sessions': len(self._sessions), 'max_sessions': self.max_sessions, 'idle_timeout': self.idle_timeout}
+
+# 全局共享的会话池
+snmp_sessions = SnmpSessionManager()
@@ -0,0 +1,114 @@
+import logging
+from pysnmp.entity.rfc3413 import cmdgen
+from pysnmp.hlapi.asyncore.cmdgen import lcd
+from pyasn1.type.univ import Null
+from pysnmp.proto import errind
+from pysnmp.proto.rfc1902 import ObjectName
+from services.snmp_health import send_request
+
+# GETBULK 参数：默认/最小/最大 max-repetitions，以及单个响应的目标大小（字节，保持在常见 MTU 以内避免分片）
+BULK_MAX_REPETITIONS = 25
+BULK_MIN_REPETITIONS = 1
+BULK_MAX_REPETITIONS_LIMIT = 100
+BULK_TARGET_RESPONSE_SIZE = 1400
+
+# SNMP PDU errorStatus: tooBig(1)
+ERROR_STATUS_TOO_BIG = 1
+
+def _bulk_request(session, target, max_repetitions, oids):
+    """发送一次 GETBULK 请求并等待响应，返回 (errorIndication, errorStatus, errorIndex, varBindTable)"""
+    cb_ctx = {}
+
+    def cb_fun(snmpEngine, sendRequestHandle, errorIndication, errorStatus, errorIndex, varBindTable, cbCtx):
+        cbCtx['result'] = (errorIndication, errorStatus, errorIndex, varBindTable)
+
+    # 直接使用 rfc3413 命令生成器，不做 MIB 解析（见 snmp_get._get_request）
+    addr_name, _ = lcd.configure(session.engine, session.auth, target, session.context.contextName)
+    cmdgen.BulkCommandGenerator().sendVarBinds(
+        session.engine, addr_name, session.context.contextEngineId, session.context.contextName,
+        0, max_repetitions, [(oid, Null('')) for oid in oids], cb_fun, cb_ctx
+    )
+    session.engine.transportDispatcher.runDispatcher()
+
+    return cb_ctx.get('result', (errind.requestTimedOut, 0, 0, []))
+
+def _encoded_size(name, value):
+    # 粗略估算一个 varbind 的 BER 编码大小，用于调整 max-repetitions
+    try:
+        value_size = len(value)
+    except TypeError:
+        value_size = 6
+    return len(name) + value_size + 6
+
+def walk_table(session, columns, timeout=10.0, retries=5, max_repetitions=None):
+    """
+    使用 GETBULK 并行遍历一个或多个表列。
+    每轮请求同时携带所有未结束的列，列各自独立结束；max-repetitions 会根据 tooBig、超时和响应大小自动调整，
+    调整结果保存在 session 上供下一次遍历使用。
+    返回 {column_oid: {index: value}}，index 为列 OID 之后的后缀（如 '3' 或 '10.0.0.1'），按遍历顺序排列。
+    出错时记录日志并返回已获取的部分结果。
+    timeout/retries 是单次尝试超时和重传次数的上限，实际超时按设备 RTT 自适应（见 services.snmp_health）。
+    """
+    roots = [ObjectName(column) for column in columns]
+    cursors = list(roots)
+    results = [{} for _ in columns]
+    active = list(range(len(roots)))
+    repetitions = max_repetitions or getattr(session, 'bulk_repetitions', BULK_MAX_REPETITIONS)
+    responded = False
+
+    while active:
+        oids = [cursors[i] for i in active]
+        errorIndication, errorStatus, errorIndex, varBindTable = send_request(
+            session, lambda target: _bulk_request(session, target, repetitions, oids), timeout, retries
+        )
+
+        if errorIndication:
+            # 设备有响应但本次超时，可能是响应过大被丢弃，减小 max-repetitions 重试
+            if responded and repetitions > BULK_MIN_REPETITIONS and isinstance(errorIndication, errind.RequestTimedOut):
+                repetitions = max(BULK_MIN_REPETITIONS, repetitions // 2)
+                continue
+            logging.error(f"Error indication: {errorIndication}")
+            break
+        elif errorStatus:
+            if int(errorStatus) == ERROR_STATUS_TOO_BIG and repetitions > BULK_MIN_REPETITIONS:
+                repetitions = max(BULK_MIN_REPETITIONS, repetitions // 2)
+                continue
+            logging.error(f"Error status: {errorStatus.prettyPrint()}")
+            break
+
+        responded = True
+        response_size = 0
+        finished = set()
+        progressed = False
+
+        for row in varBindTable:
+            for position, column in enumerate(active):
+                if column in finished or position >= len(row):
+                    continue
+                name, value = row[position]
+                response_size += _encoded_size(name, value)
+
+                if isinstance(value, Null) or not roots[column].isPrefixOf(name):
+                    finished.add(column)
+                    continue
+                if name <= cursors[column]:
+                    logging.error(f"OID not increasing: {name}")
+                    finished.add(column)
+                    continue
+
+                index = '.'.join(str(arc) for arc in name[len(roots[column]):])
+                results[column][index] = value
+                cursors[column] = name
+                progressed = True
+
+        active = [column for column in active if column not in finished]
+        if not progressed:
+            break
+
+        # 根据本次响应中每行的平均大小调整 max-repetitions
+        if varBindTable:
+            row_size = max(1, response_size // len(varBindTable))
+            repetitions = min(BULK_MAX_REPETITIONS_LIMIT, max(BULK_MIN_REPETITIONS, BULK_TARGET_RESPONSE_SIZE // row_size))
+
+    session.bulk_repetitions = repetitions
+    return {column: results[position] for position, column in enumerate(columns)}
@@ -1,105 +1,57 @@
 import logging
-from netmiko import ConnectHandler
+from services.ssh_scheduler import ssh_scheduler
 
-# 创建一个全局字典来保存SSH连接，以支持保持会话
+# 每个客户端当前占用的 (调度 ticket, SSH 会话)（从会话池中取出，客户端断开时归还），以支持保持会话
 ssh_connections = {}
 
-def open_ssh_connection(client_id, device_params):
-    """为每个客户端打开并保存一个SSH连接"""
+# 支持的设备类型，例如 'huawei', 'cisco_ios'
+SSH_CLI_DEVICE_TYPES = ('huawei', 'cisco_ios')
+
+# 终端等待会话名额的最长时间（秒）；每台设备的终端数量比任务上限少一个，满了时很快返回错误
+SSH_CLI_LEASE_TIMEOUT = 10
+
+def open_ssh_connection(client_id, ssh_params):
+    """从会话池中为客户端取出一个SSH会话，客户端断开前一直由它独占（占用设备的一个 VTY 名额）"""
     try:
-        connection = ConnectHandler(**device_params)
-        ssh_connections[client_id] = connection
+        ticket, session = ssh_scheduler.lease(client_id, ssh_params, SSH_CLI_LEASE_TIMEOUT)
+        ssh_connections[client_id] = (ticket, session)
         logging.info(f"SSH connection established for client {client_id}")
-        return connection
+        return session
     except Exception as e:
         logging.error(f"Error opening SSH connection for client {client_id}: {str(e)}")
         return None
 
-def close_ssh_connection(client_id):
-    """关闭特定客户端的SSH连接"""
-    if client_id in ssh_connections:
-        connection = ssh_connections.pop(client_id, None)
-        if connection:
-            connection.disconnect()
-            logging.info(f"SSH connection closed for client {client_id}")
+def close_ssh_connection(client_id, discard=False):
+    """归还特定客户端的SSH会话：退回用户视图后放回会话池，出错的会话直接关闭"""
+    lease = ssh_connections.pop(client_id, None)
+    if lease:
+        ssh_scheduler.end_lease(*lease, discard=discard)
+        logging.info(f"SSH connection released for client {client_id}")
 
 def ssh_cli(client_id, data):
     """在一个已有的SSH会话中执行命令"""
     try:
         # 检查是否已有SSH连接
-        connection = ssh_connections.get(client_id)
-        if not connection:
+        session = ssh_connections.get(client_id, (None, None))[1]
+        if not session:
             # 获取连接参数
             device_type = data.get('neMake')  # 设备类型，例如 'huawei', 'cisco_ios'
-            ip = data.get('neIp')  # 设备 IP 地址
-            gne_ip = data.get('gneIp')  # GNE IP 地址（仅用于华为）
-            ssh_username = data.get('sshUsername')
-            ssh_password = data.get('sshPassword')
-            ssh_secret = data.get('sshSecret', '')
+            if device_type not in SSH_CLI_DEVICE_TYPES:
+                return f"Error: Unsupported device type: {device_type}"
 
-            # 构造 SSH 连接的基本参数字典
-            device_params = {
+            ssh_params = {
                 'device_type': device_type,
-                'ip': ip,
-                'username': ssh_username,
-                'password': ssh_password,
-                'secret': ssh_secret,
-                'session_log': f'session_log_{ip}.txt',
-                'global_delay_factor': 2
+                'ip': data.get('neIp'),  # 设备 IP 地址
+                'gne_ip': data.get('gneIp'),  # GNE IP 地址（仅用于华为，经 GNE stelnet 跳转）
+                'username': data.get('sshUsername'),
+                'password': data.get('sshPassword'),
+                'secret': data.get('sshSecret', ''),
             }
+            session = open_ssh_connection(client_id, ssh_params)
 
-            # 处理华为设备的连接逻辑（可能通过GNE）
-            if device_type == 'huawei':
-                if gne_ip and gne_ip != ip:
-                    logging.info(f"Connecting to GNE device {gne_ip} to reach target device {ip}")
-                    gne_params = device_params.copy()
-                    gne_params['ip'] = gne_ip
-                    connection = open_ssh_connection(client_id, gne_params)
-
-                    if connection:
-                        stelnet_command = f"stelnet {ip}"
-                        logging.info(f"Executing stelnet command: {stelnet_command}")
-                        command_output = connection.send_command_timing(stelnet_command)
-
-                        if "The server is not authenticated" in command_output:
-                            logging.info("Server authentication prompt detected, sending 'Y'")
-                            command_output += connection.send_command_timing('Y')
-
-                        if "Save the server's public key?" in command_output:
-                            logging.info("Public key prompt detected, sending 'N'")
-                            command_output += connection.send_command_timing('N')
-
-                        command_output += connection.send_command_timing(ssh_username)
-                        command_output += connection.send_command_timing(ssh_password)
-
-                        if "Change now?" in command_output:
-                            logging.info("Password change prompt detected, sending 'N'")
-                            command_output += connection.send_command_timing('N')
-
-                        prompt_after_stelnet = connection.find_prompt()
-                        logging.info(f"Prompt after stelnet: {prompt_after_stelnet}")
-                        
-                        if "Press CTRL + K to abort" in command_output:
-                            logging.info("Connection established to target device.")
-                        elif "closed by the remote host" in command_output:
-                            logging.error("Connection was closed by the remote host.")
-                            return "Error: Connection was closed by the remote host."
-                        else:
-                            logging.error(f"Unexpected output after stelnet: {command_output}")
-                            return "Error: Failed to connect to target device."
-
-                        ssh_connections[client_id] = connection
-                else:
-                    # 直接连接到华为设备
-                    connection = open_ssh_connection(client_id, device_params)
-
-            # 处理 Cisco 设备的逻辑（直接连接）
-            elif device_type == 'cisco_ios':
-                logging.info(f"Connecting directly to Cisco device {ip}")
-                connection = open_ssh_connection(client_id, device_params)
-
-        if not connection:
+        if not session:
             return f"Error: Unable to establish SSH connection for client {client_id}"
+        connection = session.connection
 
         # 动态识别设备提示符
         prompt = connection.find_prompt()
@@ -110,18 +62,18 @@ def ssh_cli(client_id, data):
         # 处理进入配置模式的命令
         if command == "system-view" and "<" in prompt:
             logging.info("Switching to configuration mode...")
-            command_output = connection.send_command('system-view', expect_string=r'\[.*\]')
+            command_output = session.run('system-view', expect_string=r'\[.*\]')
             prompt = connection.find_prompt()
             logging.info(f"New prompt after entering configuration mode: {prompt}")
         elif command == "return" and "[" in prompt:
             logging.info("Exiting configuration mode...")
-            command_output = connection.send_command('return', expect_string=r'<.*>')
+            command_output = session.run('return', expect_string=r'<.*>')
             prompt = connection.find_prompt()
             logging.info(f"New prompt after exiting configuration mode: {prompt}")
         else:
             # 执行其他命令，并捕获提示符
             logging.info(f"Executing command: {command}")
-            command_output = connection.send_command(command, expect_string=r'[\[\]<#>]')
+            command_output = session.run(command, expect_string=r'[\[\]<#>]')
             prompt = connection.find_prompt()
             logging.info(f"New prompt after command: {prompt}")
 
@@ -139,4 +91,6 @@ def ssh_cli(client_id, data):
 
     except Exception as e:
         logging.error(f"Error during SSH command execution for client {client_id}: {str(e)}")
+        # 会话状态未知，关闭它，下一条命令重新建立连接
+        close_ssh_connection(client_id, discard=True)
         return f"Error: {str(e)}"
\ No newline at end of file
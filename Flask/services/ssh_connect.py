@@ -0,0 +1,93 @@
+import logging
+import re
+from netmiko import ConnectHandler
+from services.vty_limits import vty_limits
+
+# 各厂商关闭分页输出的命令，登录后执行一次
+PAGING_COMMANDS = {
+    'huawei': 'screen-length 0 temporary',
+    'cisco_ios': 'terminal length 0',
+}
+
+# 查询设备 VTY 数量的命令，登录提示中没有时在第一次登录后执行一次
+VTY_LIMIT_COMMANDS = {
+    'huawei': 'display user-interface maximum-vty',
+}
+
+def prompt_host(prompt):
+    """提示符中的主机名部分：'<HW>'、'[HW]'、'R1#'、'R1(config)#' -> 'HW'、'R1'"""
+    match = re.match(r'[<\[]?([^\]>#(\s]+)', (prompt or '').strip())
+    return match.group(1) if match else ''
+
+def netmiko_params(ssh_params, ip):
+    return {
+        'device_type': ssh_params['device_type'],
+        'ip': ip,
+        'username': ssh_params['username'],
+        'password': ssh_params['password'],
+        'secret': ssh_params.get('secret', ''),
+        'session_log': f'session_log_{ip}.txt',
+        'global_delay_factor': 2  # 增加全局延迟
+    }
+
+def stelnet_hop(connection, target_ip, username, password):
+    """在 GNE 的会话中 stelnet 到目标设备，登录失败时抛出 ConnectionError"""
+    gne_prompt = connection.find_prompt()
+    command_output = connection.send_command_timing(f"stelnet {target_ip}")
+
+    # 处理认证提示
+    if 'The server is not authenticated' in command_output:
+        command_output += connection.send_command_timing('Y')
+    if "Save the server's public key?" in command_output:
+        command_output += connection.send_command_timing('N')
+
+    command_output += connection.send_command_timing(username)
+    command_output += connection.send_command_timing(password)
+
+    if 'Change now?' in command_output:
+        command_output += connection.send_command_timing('N')
+
+    if 'closed by the remote host' in command_output:
+        raise ConnectionError(f"Connection to {target_ip} was closed by the remote host")
+    # 目标设备的登录提示中带有 "The max number of VTY users is N"
+    vty_limits.learn(target_ip, command_output)
+    prompt = connection.find_prompt()
+    if prompt_host(prompt) == prompt_host(gne_prompt):
+        raise ConnectionError(f"Failed to reach {target_ip} via stelnet: {command_output.strip()[-200:]}")
+    return command_output
+
+def prepare_session(connection, ssh_params):
+    """登录后的准备：Cisco 进入 enable 模式，关闭分页输出"""
+    device_type = ssh_params['device_type']
+    if device_type == 'cisco_ios':
+        # 有 enable 密码时执行 connection.enable()，否则直接输入 enable
+        if ssh_params.get('secret'):
+            connection.enable()
+        else:
+            output = connection.send_command_timing('enable')
+            if 'Password' in output:
+                logging.info("No enable password provided, skipping password input.")
+                connection.send_command_timing('\n')
+    if device_type in PAGING_COMMANDS:
+        connection.send_command_timing(PAGING_COMMANDS[device_type])
+
+def learn_vty_limit(connection, ip, device_type):
+    """设备的 VTY 数量还未知时用命令查询一次"""
+    if vty_limits.known(ip) or device_type not in VTY_LIMIT_COMMANDS:
+        return
+    try:
+        vty_limits.learn(ip, connection.send_command_timing(VTY_LIMIT_COMMANDS[device_type]))
+    except Exception as e:
+        logging.debug(f"Failed to query VTY limit of {ip}: {e}")
+
+def connect_direct(ssh_params):
+    """直接登录设备并完成准备"""
+    logging.info(f"Connecting directly to device {ssh_params['ip']}")
+    connection = ConnectHandler(**netmiko_params(ssh_params, ssh_params['ip']))
+    try:
+        learn_vty_limit(connection, ssh_params['ip'], ssh_params['device_type'])
+        prepare_session(connection, ssh_params)
+    except Exception:
+        connection.disconnect()
+        raise
+    return connection
@@ -0,0 +1,339 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from services.ssh_connect import prompt_host, connect_direct
+from services.gne_sessions import gne_sessions
+from services.vty_limits import vty_limits
+
+# 每个设备同时打开的 SSH 会话上限（包括正在使用的和空闲的），超过时请求排队等待；
+# 另外每台设备（包括作为跳转入口的 GNE）占用的 VTY 不超过 vty_limits.usable
+SSH_MAX_SESSIONS_PER_DEVICE = 2
+# 空闲多久（秒）后关闭会话，释放设备的 VTY
+SSH_IDLE_TIMEOUT = 300
+# 空闲超过这么久（秒）的会话在取出时先检查是否仍然可用
+SSH_KEEPALIVE_INTERVAL = 30
+# 等待空闲会话或会话名额的最长时间（秒）
+SSH_ACQUIRE_TIMEOUT = 30
+
+class SshPoolTimeout(Exception):
+    """等待设备的 SSH 会话名额超时"""
+
+    def __init__(self, ip, waited):
+        super().__init__(f"No SSH session available for {ip} after {waited:.0f}s")
+        self.ip = ip
+        self.waited = waited
+
+def ssh_session_key(ssh_params):
+    ip, gne_ip = ssh_params.get('ip'), ssh_params.get('gne_ip')
+    # GNE 就是设备本身时与直连相同
+    return (ip, gne_ip if gne_ip and gne_ip != ip else None, ssh_params.get('device_type'), ssh_params.get('username'))
+
+def session_lines(key):
+    """会话占用 VTY 的设备：目标设备；经 GNE 跳转时还有 GNE（跳转在 GNE 上占用一个 shell 通道）"""
+    return (key[0],) if key[1] is None else (key[0], key[1])
+
+def connect_device(ssh_params):
+    """
+    建立到设备的 SSH 会话并完成登录后的准备（Cisco 进入 enable 模式、关闭分页）。
+    华为设备指定了 gne_ip 时由 gne_sessions 在已登录的 GNE 连接上打开新通道，再 stelnet 到目标设备。
+    """
+    device_type, ip, gne_ip = ssh_params['device_type'], ssh_params['ip'], ssh_params.get('gne_ip')
+    if device_type == 'huawei' and gne_ip and gne_ip != ip:
+        return gne_sessions.open_hop(ssh_params)
+    return connect_direct(ssh_params)
+
+class SshSession:
+    """池中的一个已登录 SSH 会话（直连，或经 GNE stelnet 跳转到目标设备）"""
+
+    def __init__(self, key, ssh_params, connection):
+        self.key = key
+        self.ip = ssh_params['ip']
+        self.lines = session_lines(key)
+        self.device_type = ssh_params.get('device_type')
+        self.secrets = (ssh_params.get('password'), ssh_params.get('secret', ''))
+        self.connection = connection
+        self.prompt = connection.find_prompt()
+        self.created = time.monotonic()
+        self.last_used = self.created
+        self.last_checked = self.created
+        self.uses = 0
+        self.hop = gne_sessions.is_hop(connection)  # 经 GNE 跳转的会话
+        self.broken = False  # 保活检查失败或命令出错，关闭时计为跳转掉线
+
+    def run(self, command, **kwargs):
+        """执行一条命令（connection.send_command），经 GNE 跳转的会话同时记录命令耗时和失败"""
+        started = time.perf_counter()
+        try:
+            output = self.connection.send_command(command, **kwargs)
+        except Exception as e:
+            if self.hop:
+                gne_sessions.observe(self.connection, time.perf_counter() - started, e)
+            raise
+        if self.hop:
+            gne_sessions.observe(self.connection, time.perf_counter() - started)
+        return output
+
+    def check(self):
+        """保活检查：连接仍然打开，且提示符仍然是目标设备的（经 GNE 跳转的会话可能已被目标设备断开）"""
+        try:
+            # 先看底层 SSH 连接（经 GNE 跳转时是 GNE 的连接），已断开时不再向通道写入
+            transport = getattr(self.connection.remote_conn, 'transport', None)
+            alive = (transport is not None and transport.is_active() and self.connection.is_alive()
+                     and prompt_host(self.connection.find_prompt()) == prompt_host(self.prompt))
+        except Exception as e:
+            logging.debug(f"SSH keepalive check failed for {self.ip}: {e}")
+            alive = False
+        self.last_checked = time.monotonic()
+        self.broken = not alive
+        return alive
+
+    def reset(self):
+        """归还前退回用户视图，下一个使用者拿到的会话状态与新建的相同；没有回到用户视图时返回 False"""
+        try:
+            prompt = self.connection.find_prompt()
+            if self.device_type == 'huawei' and prompt.startswith('['):
+                self.connection.send_command('return', expect_string=r'<.*>')
+                prompt = self.connection.find_prompt()
+            elif self.device_type == 'cisco_ios' and '(config' in prompt:
+                self.connection.send_command('end', expect_string=r'#')
+                prompt = self.connection.find_prompt()
+            return not prompt.startswith('[') and '(config' not in prompt
+        except Exception as e:
+            logging.debug(f"Failed to reset SSH session for {self.ip}: {e}")
+            return False
+
+    def close(self):
+        if self.hop:
+            # 只退出目标设备并关闭通道，GNE 连接由 gne_sessions 保留
+            gne_sessions.close_hop(self.connection, dropped=self.broken)
+            return
+        try:
+            self.connection.send_command_timing('quit')
+        except Exception:
+            pass
+        try:
+            self.connection.disconnect()
+        except Exception as e:
+            logging.debug(f"Failed to close SSH session for {self.ip}: {e}")
+
+class SshSessionPool:
+    """
+    进程级的 SSH 会话池。会话按 (设备 IP, GNE, 设备类型, 用户名) 复用，每个设备同时打开的会话数不超过
+    max_per_device，名额用完时请求等待其他会话归还。空闲会话取出前做保活检查，空闲超过 idle_timeout 的由后台线程关闭。
+    """
+
+    def __init__(self, max_per_device=SSH_MAX_SESSIONS_PER_DEVICE, idle_timeout=SSH_IDLE_TIMEOUT,
+                 keepalive_interval=SSH_KEEPALIVE_INTERVAL, acquire_timeout=SSH_ACQUIRE_TIMEOUT,
+                 connect=connect_device, limits=vty_limits):
+        self.max_per_device = max_per_device
+        self.limits = limits
+        self.idle_timeout = idle_timeout
+        self.keepalive_interval = keepalive_interval
+        self.acquire_timeout = acquire_timeout
+        self.connect = connect
+        self._idle = {}  # key -> [SshSession]，最近归还的在最后
+        self._open = {}  # 目标设备 IP -> 已打开（或正在建立）的会话数
+        self._lines = {}  # 设备 IP -> 占用的 VTY 数（目标设备和 GNE）
+        self._cond = threading.Condition()
+        self._reaper = None
+        self.stats = {'created': 0, 'reused': 0, 'connect_failures': 0, 'keepalive_failures': 0,
+                      'idle_closed': 0, 'discarded': 0, 'waits': 0, 'timeouts': 0}
+
+    def _ensure_reaper(self):
+        with self._cond:
+            if self._reaper is None:
+                self._reaper = threading.Thread(target=self._reap_loop, name='ssh-pool-reaper', daemon=True)
+                self._reaper.start()
+
+    def _reap_loop(self):
+        while True:
+            time.sleep(min(self.keepalive_interval, self.idle_timeout))
+            self.close_idle()
+            gne_sessions.close_idle()
+
+    def _take_idle(self, key, secrets):
+        """取出 key 对应的最近归还的会话；凭据已变更的旧会话返回到 stale 中关闭"""
+        sessions = self._idle.get(key)
+        stale = []
+        while sessions:
+            session = sessions.pop()
+            if session.secrets == secrets:
+                return session, stale
+            stale.append(session)
+        return None, stale
+
+    def device_cap(self, ip):
+        """以 ip 为目标设备的会话数上限"""
+        return min(self.max_per_device, self.limits.usable(ip))
+
+    def _full(self, key, retired):
+        """
+        为 key 新建会话是否会超出名额：返回 ('device', ip)（目标设备的会话数）或 ('line', ip)（设备的 VTY），
+        不超出时返回 None。retired 中即将关闭的会话不计入。
+        """
+        ip = key[0]
+        if self._open.get(ip, 0) - sum(1 for old in retired if old.ip == ip) >= self.device_cap(ip):
+            return 'device', ip
+        for line in session_lines(key):
+            if self._lines.get(line, 0) - sum(1 for old in retired if line in old.lines) >= self.limits.usable(line):
+                return 'line', line
+        return None
+
+    def _take_idle_using(self, kind, ip):
+        """名额已满时，取出占用该名额的最久未用的空闲会话（其他凭据/路径，或经同一 GNE 跳转到其他设备的）"""
+        oldest = None
+        for key, sessions in self._idle.items():
+            uses = key[0] == ip if kind == 'device' else ip in session_lines(key)
+            if uses and sessions and (oldest is None or sessions[0].last_used < oldest[1][0].last_used):
+                oldest = (key, sessions)
+        if oldest is None:
+            return None
+        return oldest[1].pop(0)
+
+    def acquire(self, ssh_params, timeout=None):
+        """
+        取出（或新建）与 ssh_params 对应的会话，使用者独占直到调用 release。
+        ssh_params: device_type, ip, username, password, secret, 以及可选的 gne_ip。
+        """
+        key = ssh_session_key(ssh_params)
+        ip = key[0]
+        secrets = (ssh_params.get('password'), ssh_params.get('secret', ''))
+        timeout = self.acquire_timeout if timeout is None else timeout
+        started = time.monotonic()
+        waited = False
+        self._ensure_reaper()
+
+        while True:
+            retired, timed_out = [], False
+            with self._cond:
+                while True:
+                    session, stale = self._take_idle(key, secrets)
+                    retired.extend(stale)
+                    if session is not None:
+                        break
+                    full = self._full(key, retired)
+                    if full is None:
+                        break
+                    victim = self._take_idle_using(*full)
+                    if victim is not None:
+                        retired.append(victim)
+                        continue
+                    remaining = started + timeout - time.monotonic()
+                    if remaining <= 0:
+                        timed_out = True
+                        break
+                    if not waited:
+                        waited = True
+                        self.stats['waits'] += 1
+                    self._cond.wait(remaining)
+                if session is None and not timed_out:
+                    # 先占用名额，再在锁外建立连接
+                    self._open[ip] = self._open.get(ip, 0) + 1
+                    for line in session_lines(key):
+                        self._lines[line] = self._lines.get(line, 0) + 1
+
+            for old in retired:
+                self._discard(old)
+            if timed_out:
+                self.stats['timeouts'] += 1
+                raise SshPoolTimeout(ip, time.monotonic() - started)
+
+            if session is None:
+                try:
+                    connection = self.connect(ssh_params)
+                    session = SshSession(key, ssh_params, connection)
+                except Exception:
+                    self.stats['connect_failures'] += 1
+                    self._release_slot(key)
+                    raise
+                self.stats['created'] += 1
+            elif time.monotonic() - session.last_checked > self.keepalive_interval and not session.check():
+                logging.info(f"Pooled SSH session to {ip} is no longer usable, reconnecting")
+                self.stats['keepalive_failures'] += 1
+                self._discard(session)
+                continue
+            else:
+                self.stats['reused'] += 1
+
+            session.uses += 1
+            return session
+
+    def release(self, session, discard=False, reset=False):
+        """归还会话；discard=True（例如命令执行出错、会话状态未知）时关闭会话，reset=True 时先退回用户视图"""
+        if not discard and reset:
+            discard = not session.reset()
+        if discard:
+            session.broken = True
+            self.stats['discarded'] += 1
+            self._discard(session)
+            return
+        with self._cond:
+            session.last_used = time.monotonic()
+            session.last_checked = session.last_used
+            self._idle.setdefault(session.key, []).append(session)
+            self._cond.notify_all()
+
+    @contextmanager
+    def session(self, ssh_params, timeout=None):
+        """
+        在上下文内独占一个会话；上下文内抛出异常时会话被关闭而不是放回池中。
+        正常结束时先退回用户视图（下发配置后可能停在系统视图或 config 模式），退不回去的会话同样关闭。
+        """
+        session = self.acquire(ssh_params, timeout)
+        try:
+            yield session
+        except Exception:
+            self.release(session, discard=True)
+            raise
+        self.release(session, reset=True)
+
+    def _release_slot(self, key):
+        with self._cond:
+            for counts, ip in [(self._open, key[0])] + [(self._lines, line) for line in session_lines(key)]:
+                counts[ip] -= 1
+                if not counts[ip]:
+                    del counts[ip]
+            self._cond.notify_all()
+
+    def _discard(self, session):
+        # 先关闭会话（释放设备上的 VTY），再归还名额
+        session.close()
+        self._release_slot(session.key)
+
+    def close_idle(self):
+        """关闭空闲超过 idle_timeout 的会话"""
+        now = time.monotonic()
+        expired = []
+        with self._cond:
+            for key, sessions in list(self._idle.items()):
+                while sessions and now - sessions[0].last_used > self.idle_timeout:
+                    expired.append(sessions.pop(0))
+                if not sessions:
+                    del self._idle[key]
+        for session in expired:
+            self.stats['idle_closed'] += 1
+            self._discard(session)
+
+    def invalidate(self, ip):
+        """关闭某个设备的所有空闲会话，例如设备被删除或凭据变更后"""
+        with self._cond:
+            retired = []
+            for key in [key for key in self._idle if key[0] == ip]:
+                retired.extend(self._idle.pop(key))
+        for session in retired:
+            self._discard(session)
+
+    def get_stats(self):
+        with self._cond:
+            idle = {}
+            for key, sessions in self._idle.items():
+                idle[key[0]] = idle.get(key[0], 0) + len(sessions)
+            devices = {ip: {'open': self._open.get(ip, 0), 'idle': idle.get(ip, 0), 'vty_used': count,
+                            'vty_usable': self.limits.usable(ip)}
+                       for ip, count in self._lines.items()}
+            return dict(self.stats, sessions=sum(self._open.values()), idle=sum(idle.values()),
+                        max_per_device=self.max_per_device, idle_timeout=self.idle_timeout, devices=devices)
+
+# 全局共享的 SSH 会话池
+ssh_pool = SshSessionPool()
@@ -0,0 +1,178 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from services.ssh_pool import ssh_pool, ssh_session_key, session_lines
+from services.vty_limits import vty_limits
+
+# 等待执行的最长时间（秒），超过后放弃并返回错误
+SSH_QUEUE_TIMEOUT = 120
+# 用于统计等待时间的最近任务数
+SSH_WAIT_SAMPLES = 1000
+
+class SshQueueTimeout(Exception):
+    """SSH 任务排队超时：目标设备或 GNE 的 VTY 一直被占满"""
+
+    def __init__(self, ip, waited):
+        super().__init__(f"SSH job for {ip} waited {waited:.0f}s without a free VTY line")
+        self.ip = ip
+        self.waited = waited
+
+class SshTicket:
+    """一个排队中的 SSH 任务：占用目标设备（以及经 GNE 跳转时 GNE）上的一个 VTY"""
+
+    __slots__ = ('id', 'user', 'ip', 'lines', 'lease', 'enqueued_at', 'granted_at', 'granted')
+
+    def __init__(self, ticket_id, user, ssh_params, lease=False):
+        key = ssh_session_key(ssh_params)
+        self.id = ticket_id
+        self.user = user
+        self.ip = key[0]
+        self.lines = session_lines(key)
+        self.lease = lease  # 长期占用（CLI 终端），数量单独限制
+        self.enqueued_at = time.monotonic()
+        self.granted_at = None
+        self.granted = threading.Event()
+
+class SshScheduler:
+    """
+    SSH 任务调度：每个用户一个等待队列，按轮询顺序放行，一个用户的大量请求不会让其他用户一直等待。
+    正在执行的任务数按目标设备和 VTY 计数，目标设备不超过 ssh_pool.device_cap，每台设备（包括跳转经过的 GNE）
+    不超过 vty_limits.usable；放行的任务在会话池中总能拿到会话（复用或替换空闲会话），不会再次等待。
+    队首任务的设备已满时跳过它，放行同一用户队列中其他设备的任务。
+    CLI 终端的长期占用（lease）在每台设备上比普通任务的上限少一个，排队的查询和下发任务总有名额可用。
+    """
+
+    def __init__(self, pool=ssh_pool, limits=vty_limits, queue_timeout=SSH_QUEUE_TIMEOUT):
+        self.pool = pool
+        self.limits = limits
+        self.queue_timeout = queue_timeout
+        self._queues = OrderedDict()  # user -> deque[SshTicket]，最近放行过的用户排在最后
+        self._running = {}  # 目标设备 IP -> 执行中的任务数
+        self._lines = {}  # 设备 IP -> 执行中的任务占用的 VTY 数
+        self._leased = {}  # 设备 IP -> 长期占用的 VTY 数
+        self._waits = deque(maxlen=SSH_WAIT_SAMPLES)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.stats = {'submitted': 0, 'granted': 0, 'immediate': 0, 'timeouts': 0, 'completed': 0}
+
+    def lease_cap(self, ip, target=True):
+        """一台设备上同时存在的长期占用数量上限：比普通任务的上限少一个，至少为 1"""
+        cap = self.pool.device_cap(ip) if target else self.limits.usable(ip)
+        return max(1, cap - 1)
+
+    def _fits(self, ticket):
+        if self._running.get(ticket.ip, 0) >= self.pool.device_cap(ticket.ip):
+            return False
+        if ticket.lease and any(self._leased.get(line, 0) >= self.lease_cap(line, line == ticket.ip)
+                                for line in ticket.lines):
+            return False
+        return all(self._lines.get(line, 0) < self.limits.usable(line) for line in ticket.lines)
+
+    def _grant(self, ticket):
+        self._running[ticket.ip] = self._running.get(ticket.ip, 0) + 1
+        for line in ticket.lines:
+            self._lines[line] = self._lines.get(line, 0) + 1
+            if ticket.lease:
+                self._leased[line] = self._leased.get(line, 0) + 1
+        ticket.granted_at = time.monotonic()
+        self._waits.append(ticket.granted_at - ticket.enqueued_at)
+        self.stats['granted'] += 1
+        ticket.granted.set()
+
+    def _dispatch(self):
+        """按用户轮询放行；每次放行后该用户移到最后，下一轮从最久未被放行的用户开始，调用时持有 self._lock"""
+        while True:
+            for user, queue in self._queues.items():
+                ticket = next((ticket for ticket in queue if self._fits(ticket)), None)
+                if ticket is not None:
+                    queue.remove(ticket)
+                    if queue:
+                        self._queues.move_to_end(user)
+                    else:
+                        del self._queues[user]
+                    self._grant(ticket)
+                    break
+            else:
+                return
+
+    def submit(self, user, ssh_params, timeout=None, lease=False):
+        """排队等待目标设备和 GNE 的 VTY 名额，放行后返回 ticket，用完后必须调用 done(ticket)"""
+        ticket = SshTicket(next(self._ids), user or 'anonymous', ssh_params, lease)
+        timeout = self.queue_timeout if timeout is None else timeout
+        with self._lock:
+            self.stats['submitted'] += 1
+            self._queues.setdefault(ticket.user, deque()).append(ticket)
+            self._dispatch()
+            if ticket.granted.is_set():
+                self.stats['immediate'] += 1
+                return ticket
+
+        if ticket.granted.wait(timeout):
+            return ticket
+        with self._lock:
+            if ticket.granted.is_set():
+                return ticket
+            queue = self._queues.get(ticket.user)
+            queue.remove(ticket)
+            if not queue:
+                del self._queues[ticket.user]
+            self.stats['timeouts'] += 1
+        raise SshQueueTimeout(ticket.ip, time.monotonic() - ticket.enqueued_at)
+
+    def done(self, ticket):
+        with self._lock:
+            counted = [(self._running, ticket.ip)] + [(self._lines, line) for line in ticket.lines]
+            if ticket.lease:
+                counted += [(self._leased, line) for line in ticket.lines]
+            for counts, ip in counted:
+                counts[ip] -= 1
+                if not counts[ip]:
+                    del counts[ip]
+            self.stats['completed'] += 1
+            self._dispatch()
+
+    @contextmanager
+    def session(self, user, ssh_params, timeout=None):
+        """排队放行后从会话池取出会话，在上下文内独占"""
+        ticket = self.submit(user, ssh_params, timeout)
+        try:
+            with self.pool.session(ssh_params) as session:
+                yield session
+        finally:
+            self.done(ticket)
+
+    def lease(self, user, ssh_params, timeout=None):
+        """长期占用一个会话（例如 CLI 终端），返回 (ticket, session)，结束时调用 end_lease"""
+        ticket = self.submit(user, ssh_params, timeout, lease=True)
+        try:
+            return ticket, self.pool.acquire(ssh_params)
+        except Exception:
+            self.done(ticket)
+            raise
+
+    def end_lease(self, ticket, session, discard=False):
+        try:
+            self.pool.release(session, discard=discard, reset=True)
+        finally:
+            self.done(ticket)
+
+    def get_stats(self):
+        now = time.monotonic()
+        with self._lock:
+            waits = sorted(self._waits)
+            queued = {user: {'depth': len(queue), 'oldest_wait': now - queue[0].enqueued_at}
+                      for user, queue in self._queues.items()}
+            devices = {ip: {'running': self._running.get(ip, 0), 'leased': self._leased.get(ip, 0), 'vty_used': count,
+                            'vty_usable': self.limits.usable(ip), 'vty_limit': self.limits.limit(ip)}
+                       for ip, count in self._lines.items()}
+            return dict(self.stats,
+                        queue_depth=sum(entry['depth'] for entry in queued.values()),
+                        wait_avg_ms=sum(waits) / len(waits) * 1000 if waits else None,
+                        wait_p95_ms=waits[int(len(waits) * 0.95)] * 1000 if waits else None,
+                        wait_max_ms=waits[-1] * 1000 if waits else None,
+                        users=queued, devices=devices, vty_limits=self.limits.get_stats())
+
+# 全局共享的 SSH 任务调度器
+ssh_scheduler = SshScheduler()
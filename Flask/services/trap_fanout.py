@@ -0,0 +1,132 @@
+import logging
+import threading
+import time
+from collections import deque
+
+# 合并窗口（秒）：窗口内收到的 Trap 合并为一个事件发送
+FANOUT_INTERVAL = 0.5
+# 每个事件最多携带的 Trap 条数，超出的只计入 suppressed
+FANOUT_MAX_BATCH = 100
+# 每个客户端每秒最多接收的事件数和突发上限（令牌桶）
+CLIENT_EVENT_RATE = 2.0
+CLIENT_EVENT_BURST = 5
+# 等待发送的 Trap 上限，超出后直接计入所有客户端的 suppressed
+FANOUT_MAX_PENDING = 10000
+
+TRAP_BATCH_EVENT = 'new_snmp_traps'
+
+class TokenBucket:
+    def __init__(self, rate=CLIENT_EVENT_RATE, burst=CLIENT_EVENT_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self, now=None):
+        now = now or time.monotonic()
+        self.tokens = min(self.burst, self.tokens + max(0.0, now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+class ClientState:
+    """单个 Socket.IO 客户端的令牌桶和尚未告知的被抑制 Trap 数"""
+
+    def __init__(self, rate, burst):
+        self.bucket = TokenBucket(rate, burst)
+        self.suppressed = 0
+
+class TrapFanout:
+    """
+    Trap 推送：接收线程只把 Trap 放入待发送队列，后台线程每个 FANOUT_INTERVAL 把队列中的 Trap 合并为一个
+    'new_snmp_traps' 事件 {'traps': [...], 'suppressed': N} 发给每个客户端。
+    客户端超过事件速率时这一批不再发送，只累计条数，等到有令牌时在下一个事件的 suppressed 中告知。
+    """
+
+    def __init__(self, interval=FANOUT_INTERVAL, max_batch=FANOUT_MAX_BATCH, rate=CLIENT_EVENT_RATE,
+                 burst=CLIENT_EVENT_BURST, max_pending=FANOUT_MAX_PENDING):
+        self.interval = interval
+        self.max_batch = max_batch
+        self.rate = rate
+        self.burst = burst
+        self.max_pending = max_pending
+        self.socketio = None
+        self._pending = deque()
+        self._overflow = 0
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self.stats = {'published': 0, 'events': 0, 'suppressed': 0, 'overflow': 0}
+
+    def start(self, socketio):
+        if self._thread is not None:
+            return
+        self.socketio = socketio
+        self._thread = threading.Thread(target=self._run, name='trap-fanout', daemon=True)
+        self._thread.start()
+        logging.info(f"Trap fan-out started (window {self.interval}s, {self.rate} events/s per client)")
+
+    def add_client(self, sid):
+        with self._lock:
+            self._clients[sid] = ClientState(self.rate, self.burst)
+
+    def remove_client(self, sid):
+        with self._lock:
+            self._clients.pop(sid, None)
+
+    def publish(self, trap):
+        with self._lock:
+            self.stats['published'] += 1
+            if len(self._pending) >= self.max_pending:
+                self._overflow += 1
+                self.stats['overflow'] += 1
+            else:
+                self._pending.append(trap)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f"Error in trap fan-out: {e}")
+
+    def flush(self, now=None):
+        """取出本窗口内的 Trap，按每个客户端的令牌桶决定发送还是累计为 suppressed"""
+        now = now or time.monotonic()
+        with self._lock:
+            batch = list(self._pending)
+            self._pending.clear()
+            overflow, self._overflow = self._overflow, 0
+            clients = list(self._clients.items())
+
+        # 同一窗口内所有客户端收到相同的 Trap，超出单个事件上限的部分只保留最新的
+        traps = batch[-self.max_batch:]
+        dropped = len(batch) - len(traps) + overflow
+        outgoing = []
+        with self._lock:
+            for sid, client in clients:
+                if not batch and not overflow and not client.suppressed:
+                    continue
+                if client.bucket.take(now):
+                    outgoing.append((sid, client.suppressed + dropped))
+                    client.suppressed = 0
+                else:
+                    client.suppressed += len(batch) + overflow
+                    self.stats['suppressed'] += len(batch) + overflow
+
+        for sid, suppressed in outgoing:
+            self.socketio.emit(TRAP_BATCH_EVENT, {'traps': traps, 'suppressed': suppressed}, to=sid)
+        with self._lock:
+            self.stats['events'] += len(outgoing)
+            self.stats['suppressed'] += dropped * len(outgoing)
+        return len(outgoing)
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, clients=len(self._clients), pending=len(self._pending),
+                        lagging=sum(1 for client in self._clients.values() if client.suppressed))
+
+trap_fanout = TrapFanout()
@@ -0,0 +1,190 @@
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import ConnectionFailure, PyMongoError
+from services.snmp_oids import SNMP_TRAP_OID
+from services.oid_names import oid_names
+
+# 内存中保留的最近 Trap 条数（环形缓冲区，满了之后丢弃最旧的）
+TRAP_BUFFER_SIZE = int(os.environ.get('TRAP_BUFFER_SIZE', 1000))
+# 等待写入 MongoDB 的 Trap 队列上限，写入跟不上时新 Trap 只进入环形缓冲区并计入 dropped
+TRAP_QUEUE_SIZE = int(os.environ.get('TRAP_QUEUE_SIZE', 50000))
+# 每次 insert_many 最多写入的条数，以及队列未满一批时的最长等待时间（秒）
+TRAP_BATCH_SIZE = 500
+TRAP_FLUSH_INTERVAL = 1.0
+# 持久化 Trap 的保留天数，由 MongoDB 的 TTL 索引按 received_at 自动删除
+TRAP_RETENTION_DAYS = int(os.environ.get('TRAP_RETENTION_DAYS', 30))
+# 写入失败后的重试间隔（秒）
+TRAP_RETRY_INTERVAL = 5.0
+
+TRAP_COLLECTION = 'snmp_traps'
+
+def make_trap_record(source, var_binds, received_at=None):
+    """
+    把收到的 varBinds 转换为存储格式：
+    {'received_at', 'source', 'trap_oid', 'varbinds': [[oid, value], ...]}
+    varbinds 用列表而不是字典保存，避免 OID 中的 '.' 作为 MongoDB 字段名。
+    """
+    pairs = [[str(name), str(value)] for name, value in var_binds]
+    trap_oid = next((value for name, value in pairs if name == SNMP_TRAP_OID), None)
+    return {
+        'received_at': received_at or datetime.now(timezone.utc),
+        'source': source,
+        'trap_oid': trap_oid,
+        'varbinds': pairs,
+    }
+
+def serialize_trap(trap):
+    """转换为可 JSON 序列化的字典（时间为 ISO 8601 字符串，去掉 MongoDB 的 _id），并附上 OID 的符号名"""
+    return {
+        'received_at': trap['received_at'].isoformat(),
+        'source': trap['source'],
+        'ne_name': trap.get('ne_name'),
+        'trap_oid': trap['trap_oid'],
+        'trap_name': oid_names.name(trap['trap_oid']) if trap['trap_oid'] else None,
+        'varbinds': oid_names.decode_varbinds(trap['varbinds']),
+    }
+
+class TrapStore:
+    """
+    Trap 存储：最近的 Trap 保存在固定大小的环形缓冲区中供前端快速读取；
+    同时放入有界队列，由后台线程批量 insert_many 写入 MongoDB，历史记录按 TTL 索引过期。
+    接收线程只做内存操作，不会因为数据库慢或不可用而阻塞。
+    """
+
+    def __init__(self, buffer_size=TRAP_BUFFER_SIZE, queue_size=TRAP_QUEUE_SIZE, batch_size=TRAP_BATCH_SIZE,
+                 flush_interval=TRAP_FLUSH_INTERVAL, retention_days=TRAP_RETENTION_DAYS):
+        self.recent = deque(maxlen=buffer_size)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        self.collection = None
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._writer = None
+        self.indexed = False
+        self.stats = {'received': 0, 'persisted': 0, 'dropped': 0, 'batches': 0, 'failed_batches': 0}
+
+    def start(self, collection):
+        """绑定 MongoDB 集合并启动后台写入线程（索引由写入线程创建，数据库不可用时不阻塞应用启动）"""
+        if self._writer is not None:
+            return
+        self.collection = collection
+        self._writer = threading.Thread(target=self._write_loop, name='trap-store-writer', daemon=True)
+        self._writer.start()
+        logging.info(f"Trap store writing to collection '{collection.name}' "
+                     f"(retention {self.retention_days} days, batch {self.batch_size})")
+
+    def ensure_indexes(self):
+        """创建索引；数据库连接失败时返回 False 以便稍后重试，其他错误（例如索引选项冲突）只记录日志"""
+        try:
+            self.collection.create_index([('received_at', ASCENDING)], name='received_at_ttl',
+                                         expireAfterSeconds=self.retention_days * 86400)
+            self.collection.create_index([('source', ASCENDING), ('received_at', DESCENDING)], name='source_time')
+            self.collection.create_index([('trap_oid', ASCENDING), ('received_at', DESCENDING)], name='trap_oid_time')
+            self.indexed = True
+        except ConnectionFailure as e:
+            logging.error(f"Failed to create trap store indexes, retrying in {TRAP_RETRY_INTERVAL}s: {e}")
+            return False
+        except PyMongoError as e:
+            logging.error(f"Failed to create trap store indexes: {e}")
+        return True
+
+    def record(self, trap):
+        """接收线程调用：写入环形缓冲区并排队等待持久化"""
+        with self._lock:
+            self.recent.append(trap)
+            self.stats['received'] += 1
+        if self._writer is None:
+            return
+        try:
+            self._queue.put_nowait(trap)
+        except queue.Full:
+            with self._lock:
+                self.stats['dropped'] += 1
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_loop(self):
+        # 数据库不可用时 Trap 暂存在有界队列中，连上后先创建索引再写入
+        while not self.ensure_indexes():
+            time.sleep(TRAP_RETRY_INTERVAL)
+        while True:
+            batch = self._next_batch()
+            while True:
+                try:
+                    # insert_many 会给文档补上 _id，传入副本以免修改环形缓冲区中的对象
+                    self.collection.insert_many([dict(trap) for trap in batch], ordered=False)
+                    with self._lock:
+                        self.stats['persisted'] += len(batch)
+                        self.stats['batches'] += 1
+                    break
+                except PyMongoError as e:
+                    with self._lock:
+                        self.stats['failed_batches'] += 1
+                    logging.error(f"Failed to persist {len(batch)} traps, retrying in {TRAP_RETRY_INTERVAL}s: {e}")
+                    time.sleep(TRAP_RETRY_INTERVAL)
+
+    def recent_traps(self, limit=100, source=None, trap_oid=None):
+        """从环形缓冲区中按时间倒序返回最近的 Trap"""
+        with self._lock:
+            traps = list(self.recent)
+        result = []
+        for trap in reversed(traps):
+            if source and trap['source'] != source:
+                continue
+            if trap_oid and trap['trap_oid'] != trap_oid:
+                continue
+            result.append(trap)
+            if len(result) >= limit:
+                break
+        return result
+
+    def find_traps(self, source=None, trap_oid=None, since=None, until=None, limit=100):
+        """查询持久化的 Trap 历史，过滤条件均可命中索引"""
+        if self.collection is None:
+            return []
+        query = {}
+        if source:
+            query['source'] = source
+        if trap_oid:
+            query['trap_oid'] = trap_oid
+        if since or until:
+            query['received_at'] = {}
+            if since:
+                query['received_at']['$gte'] = since
+            if until:
+                query['received_at']['$lt'] = until
+        cursor = self.collection.find(query, {'_id': 0}).sort('received_at', DESCENDING).limit(limit)
+        return list(cursor)
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, buffered=len(self.recent), buffer_size=self.recent.maxlen,
+                        queued=self._queue.qsize(), persistent=self._writer is not None, indexed=self.indexed,
+                        retention_days=self.retention_days)
+
+trap_store = TrapStore()
+
+def start_trap_store(app):
+    """在应用上下文中取得 MongoDB 集合并启动 Trap 持久化"""
+    from services.db import get_db
+    with app.app_context():
+        collection = get_db().get_collection(TRAP_COLLECTION)
+    trap_store.start(collection)
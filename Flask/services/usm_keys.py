@@ -0,0 +1,90 @@
+import logging
+import threading
+from cachetools import LRUCache
+from pysnmp.entity import config as snmp_config
+from pysnmp.proto.secmod.rfc3414.service import SnmpUSMSecurityModel
+
+# 本地化密钥缓存的容量（条目数）。每个设备大约占用 4 条：认证/加密口令散列各一条，本地化结果各一条
+USM_KEY_CACHE_SIZE = 8192
+
+class LocalizedKeyCache:
+    """
+    缓存 SNMPv3 USM 的口令散列与密钥本地化结果。
+    口令到密钥的转换需要对约 1MB 的数据做散列，每新建一个 SnmpEngine 或 UsmUserData 都会重新计算一次；
+    以 (协议, 口令, engineID) 为键缓存后，每个代理的密钥只需计算一次。
+    """
+
+    def __init__(self, maxsize=USM_KEY_CACHE_SIZE):
+        self._cache = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            try:
+                value = self._cache[key]
+                self.hits += 1
+                return value
+            except KeyError:
+                self.misses += 1
+
+        # 在锁外计算，避免一次散列阻塞其他设备的请求
+        value = compute()
+        with self._lock:
+            self._cache[key] = value
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._cache), 'maxsize': self._cache.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+usm_key_cache = LocalizedKeyCache()
+
+def _key_part(value):
+    # pyasn1 的 OctetString / ObjectIdentifier 转为普通 bytes / tuple，保证作为缓存键时比较的是内容
+    if hasattr(value, 'asOctets'):
+        return value.asOctets()
+    if hasattr(value, 'asTuple'):
+        return value.asTuple()
+    if isinstance(value, (list, tuple)):
+        return tuple(value)
+    return value
+
+def _wrap_method(service, name, cache):
+    method = getattr(service, name)
+    service_id = _key_part(getattr(service, 'serviceID', type(service).__name__))
+
+    def cached_method(*args):
+        key = (service_id, name) + tuple(_key_part(arg) for arg in args)
+        return cache.get_or_compute(key, lambda: method(*args))
+
+    setattr(service, name, cached_method)
+
+def _wrap_services(services, cache):
+    for service in services.values():
+        if getattr(service, '_usm_key_cache', None) is cache:
+            continue
+        for name in ('hashPassphrase', 'localizeKey'):
+            if hasattr(service, name):
+                _wrap_method(service, name, cache)
+        service._usm_key_cache = cache
+
+def install_usm_key_cache(cache=usm_key_cache):
+    """
+    为 pysnmp 的认证/加密服务加上密钥缓存。
+    addV3User（每个新 SnmpEngine 配置用户时）和 USM 模块（按对端 engineID 克隆用户时）使用的是两组服务实例，都需要包装。
+    """
+    try:
+        _wrap_services(snmp_config.authServices, cache)
+        _wrap_services(snmp_config.privServices, cache)
+        _wrap_services(SnmpUSMSecurityModel.authServices, cache)
+        _wrap_services(SnmpUSMSecurityModel.privServices, cache)
+    except AttributeError as e:
+        logging.warning(f"USM key cache not installed, unsupported pysnmp version: {e}")
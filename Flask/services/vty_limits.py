@@ -0,0 +1,69 @@
+import logging
+import os
+import re
+import threading
+from network_mgmt.global_data import devices
+
+# 没有配置也还没有从设备学到时使用的 VTY 数量（华为、思科默认都是 user-interface vty 0 4）
+VTY_DEFAULT_LIMIT = int(os.environ.get('SSH_VTY_DEFAULT_LIMIT', 5))
+# 每台设备留给操作员直接登录的 VTY 数量，网管最多使用 limit - reserved 条
+VTY_RESERVED_LINES = int(os.environ.get('SSH_VTY_RESERVED_LINES', 1))
+
+# 登录提示 "The max number of VTY users is 5"，以及 display user-interface maximum-vty 的 "Maximum of VTY user:5"
+VTY_LIMIT_PATTERN = re.compile(r'(?:max number of VTY users is|Maximum of VTY user\s*:?)\s*(\d+)', re.IGNORECASE)
+
+class VtyLimits:
+    """
+    每台设备可用的 VTY 数量。优先级：set_limit 配置的 > 设备的 vty_limit 字段 > 从登录提示或命令输出中学到的 > 默认值。
+    """
+
+    def __init__(self, default=VTY_DEFAULT_LIMIT, reserved=VTY_RESERVED_LINES):
+        self.default = default
+        self.reserved = reserved
+        self._configured = {}
+        self._learned = {}
+        self._lock = threading.Lock()
+
+    def set_limit(self, ip, limit):
+        with self._lock:
+            if limit:
+                self._configured[ip] = int(limit)
+            else:
+                self._configured.pop(ip, None)
+
+    def learn(self, ip, text):
+        """从设备输出中解析 VTY 数量，找到时记录并返回"""
+        match = VTY_LIMIT_PATTERN.search(text or '')
+        if not match:
+            return None
+        limit = int(match.group(1))
+        with self._lock:
+            previous = self._learned.get(ip)
+            self._learned[ip] = limit
+        if previous != limit:
+            logging.info(f"Learned VTY limit {limit} for device {ip}")
+        return limit
+
+    def known(self, ip):
+        return ip in self._configured or ip in self._learned or self._device_limit(ip) is not None
+
+    def _device_limit(self, ip):
+        for device in list(devices.values()):
+            if device.get('ip') == ip and device.get('vty_limit'):
+                return int(device['vty_limit'])
+        return None
+
+    def limit(self, ip):
+        configured = self._configured.get(ip) or self._device_limit(ip)
+        return configured or self._learned.get(ip) or self.default
+
+    def usable(self, ip):
+        """网管可以同时占用的 VTY 数量，至少为 1"""
+        return max(1, self.limit(ip) - self.reserved)
+
+    def get_stats(self):
+        with self._lock:
+            return {'default': self.default, 'reserved': self.reserved,
+                    'configured': dict(self._configured), 'learned': dict(self._learned)}
+
+vty_limits = VtyLimits()
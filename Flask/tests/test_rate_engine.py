@@ -0,0 +1,31 @@
+import math
+from perf_mont.rate_engine import NetworkRateEngine
+
+def _sample(timestamp, octets, speed=0, hc=False):
+    in_key, out_key = ('HCInOctets', 'HCOutOctets') if hc else ('InOctets', 'OutOctets')
+    return {'Timestamp': timestamp, 'Interfaces': [{'Index': '1', in_key: octets, out_key: octets, 'Speed': speed}]}
+
+def _rate(engine, *samples):
+    for sample in samples:
+        engine.stage('NE1', sample)
+        engine.compute()
+    return engine.latest_rates('NE1')['1']
+
+def test_counter32_wrap_is_unwrapped():
+    rate = _rate(NetworkRateEngine('net'), _sample(0, 2 ** 32 - 1000), _sample(1, 1000))
+    assert rate['in_bps'] == 16000.0
+
+def test_counter32_reset_without_speed_is_invalid():
+    engine = NetworkRateEngine('net')
+    rate = _rate(engine, _sample(0, 1000000000), _sample(1, 1000))
+    assert rate is None
+    row = engine.rows[('NE1', '1')]
+    assert math.isnan(engine.in_bps[row])
+
+def test_counter64_reset_without_speed_is_invalid():
+    assert _rate(NetworkRateEngine('net'), _sample(0, 10 ** 12, hc=True), _sample(1, 1000, hc=True)) is None
+
+def test_restaged_sample_keeps_rate():
+    engine = NetworkRateEngine('net')
+    _rate(engine, _sample(0, 0, hc=True), _sample(1, 1000, hc=True))
+    assert _rate(engine, _sample(1, 1000, hc=True))['in_bps'] == 8000.0
@@ -32,16 +32,25 @@ function App() {
     const socketInstance = io('http://127.0.0.1:8888'); // 替换为后端 WebSocket 地址
     setSocket(socketInstance);
 
-    // 监听 SNMP Trap 数据
-    socketInstance.on('new_snmp_trap', (data) => {
-      console.log('Received new SNMP Trap:', data); // 打印接收到的 Trap 数据
-      setTrapData((prevData) => [...prevData, data]); // 更新状态
+    // 监听 SNMP Trap 数据（后端按时间窗口合并推送，suppressed 为因限速未推送的条数）
+    socketInstance.on('new_snmp_traps', (data: { traps: any[]; suppressed: number }) => {
+      console.log('Received SNMP Traps:', data); // 打印接收到的 Trap 数据
+      if (data.traps.length > 0) {
+        setTrapData((prevData) => [...prevData, ...data.traps].slice(-1000)); // 更新状态，只保留最近的 Trap
 
-      notification.info({
-        message: 'New SNMP Trap',
-        description: `Trap data: ${JSON.stringify(data)}`,
-        placement: 'bottomRight',
-      });
+        notification.info({
+          message: data.traps.length === 1 ? 'New SNMP Trap' : `${data.traps.length} new SNMP Traps`,
+          description: `Trap data: ${JSON.stringify(data.traps[data.traps.length - 1])}`,
+          placement: 'bottomRight',
+        });
+      }
+      if (data.suppressed > 0) {
+        notification.warning({
+          message: 'SNMP Traps suppressed',
+          description: `${data.suppressed} traps suppressed`,
+          placement: 'bottomRight',
+        });
+      }
     });
 
     // 监听 SNMP 错误